@@ -0,0 +1,164 @@
+# Benchmarks of the main steps of the scripts, on synthetic pangraphs of
+# increasing size (see `synthetic_pangraph.py`). Timings are written as JSON, and
+# can be compared to a previous run to detect performance regressions.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+import pangraph_interface  # noqa: E402
+import pangraph_locator  # noqa: E402
+from add_pancontigs_to_gff import annotate_gff, iter_gff  # noqa: E402
+from synthetic_pangraph import write_dataset  # noqa: E402
+
+# parameters of `synthetic_pangraph` for each scale, and number of genes per GFF
+SCALES = {
+    "small": dict(n_strains=5, n_blocks=50, n_features=200),
+    "medium": dict(n_strains=50, n_blocks=300, n_features=1000),
+    "large": dict(n_strains=200, n_blocks=1000, n_features=4000),
+}
+
+
+def timed(func, repeat, setup=None):
+    """Runs `func` `repeat` times, and returns the list of wall-clock times
+    together with the result of the last run. If `setup` is given, it is called
+    (untimed) before each run, and its result is passed to `func`. Use it for
+    functions that cache their work, so that each run starts from scratch."""
+    times = []
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        t0 = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - t0)
+    return times, result
+
+
+def benchmark_dataset(pan_file, gff_file, repeat):
+    """Times each step on one dataset. Returns a dictionary {benchmark -> list of times}.
+    Steps that depend on each other reuse the result of the previous step."""
+    times = {}
+    load = lambda: pangraph_interface.Pangraph.load_json(pan_file, lazy=True, compact=True)
+    times["load_json"], pan = timed(load, repeat)
+    load_eager = lambda: pangraph_interface.Pangraph.load_json(pan_file, compact=True)
+    times["load_json.eager"], _ = timed(load_eager, repeat)
+
+    # blocks are built while building the map: each run starts from a new lazy pangraph
+    build = lambda pan: (pan, pangraph_locator.build_map(pan.paths, pan.blocks))
+    times["build_map"], (pan, pan_map) = timed(build, repeat, setup=load)
+    locator = pangraph_locator.Locator(pan, lazy=True)
+    locator.map = pan_map
+
+    entries = list(iter_gff(gff_file))
+    pmap = pan_map[entries[0].seqid]
+    intervals = [(e.start, e.end) for e in entries]
+    times["interval_to_blocks"], _ = timed(lambda: [pmap.interval_to_blocks(b, e) for b, e in intervals], repeat)
+    for mode in ["attributes", "regions"]:
+        annotate = lambda: sum(1 for _ in annotate_gff(locator, entries, mode=mode))
+        times[f"add_pancontigs_to_gff.{mode}"], _ = timed(annotate, repeat)
+
+    times["to_blockstats_df"], _ = timed(pan.to_blockstats_df, repeat)
+
+    # blocks are built outside of the timed function
+    alignments = [block.alignment for block in pan.blocks]
+    times["extract_nongap_SNPs"], _ = timed(lambda: [aln.extract_nongap_SNPs() for aln in alignments], repeat)
+    return times
+
+
+def run_benchmarks(scales, repeat, data_dir):
+    """Generates the datasets of the given scales in `data_dir` (if not already
+    present) and benchmarks each of them. Returns the list of results."""
+    results = []
+    for scale in scales:
+        params = dict(SCALES[scale])
+        n_features = params.pop("n_features")
+        scale_dir = os.path.join(data_dir, scale)
+        pan_file = os.path.join(scale_dir, "pangraph.json")
+        gff_file = os.path.join(scale_dir, "strain_0.gff")
+        if not (os.path.isfile(pan_file) and os.path.isfile(gff_file)):
+            write_dataset(scale_dir, n_features=n_features, seed=0, **params)
+        for name, times in benchmark_dataset(pan_file, gff_file, repeat).items():
+            results.append({"scale": scale, "benchmark": name, "best": min(times), "times": times})
+            print(f"{scale}\t{name}\t{min(times):.4f} s", file=sys.stderr)
+    return results
+
+
+def find_regressions(results, baseline, threshold, min_time):
+    """Compares results to the ones of a baseline run. Returns the list of
+    (scale, benchmark, baseline time, time) for the benchmarks that are slower
+    than `threshold` times the baseline. Differences smaller than `min_time`
+    seconds are ignored, as they are dominated by noise."""
+    base = {(r["scale"], r["benchmark"]): r["best"] for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        key = (r["scale"], r["benchmark"])
+        if key not in base:
+            continue
+        if r["best"] > threshold * base[key] and r["best"] - base[key] > min_time:
+            regressions.append((*key, base[key], r["best"]))
+    return regressions
+
+
+def get_options():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scripts on synthetic pangraphs of increasing size",
+        prog="run_benchmarks",
+    )
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"],
+        help="Scales of the synthetic datasets")
+    parser.add_argument("--repeat", type=int, default=3,
+        help="Number of repetitions of each benchmark (the best time is kept)")
+    parser.add_argument("--data_dir", default="",
+        help="Directory in which datasets are generated and reused (default: temporary directory)")
+    parser.add_argument("--output", default="",
+        help="Output file for the results (JSON). Default: standard output")
+    parser.add_argument("--baseline", default="",
+        help="Results of a previous run (JSON). Exits with an error if a benchmark is slower than the baseline")
+    parser.add_argument("--threshold", type=float, default=1.25,
+        help="Maximum allowed ratio between the time of a benchmark and the baseline")
+    parser.add_argument("--min_time", type=float, default=0.01,
+        help="Differences with the baseline smaller than this (in seconds) are ignored")
+    return parser.parse_args()
+
+
+def main():
+    args = get_options()
+    if args.data_dir != "":
+        results = run_benchmarks(args.scales, args.repeat, args.data_dir)
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            results = run_benchmarks(args.scales, args.repeat, data_dir)
+    report = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output != "":
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline != "":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold, args.min_time)
+        for scale, name, t_base, t in regressions:
+            print(f"regression: {scale} {name} {t_base:.4f} s -> {t:.4f} s ({t / t_base:.2f}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
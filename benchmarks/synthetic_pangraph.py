@@ -0,0 +1,223 @@
+# Generator of synthetic pangraphs (in the pangraph .json format) and of matching
+# GFF annotations, used to benchmark the scripts at different scales.
+# Block occurrences carry random mutations, insertions (in the gaps of the block
+# alignment) and deletions, and genomes are circular with a random origin, so that
+# some blocks wrap around the end of the genome.
+
+import argparse
+import json
+import os
+import string
+
+import numpy as np
+
+NUCLEOTIDES = np.array(list("ACGT"))
+
+
+def random_block_ids(rng, n_blocks):
+    """Returns a list of `n_blocks` distinct random block ids, formatted as the
+    ones of pangraph (10 uppercase letters)."""
+    letters = np.array(list(string.ascii_uppercase))
+    ids = set()
+    while len(ids) < n_blocks:
+        ids.add("".join(rng.choice(letters, 10)))
+    ids = sorted(ids)
+    rng.shuffle(ids)
+    return ids
+
+
+def random_sequence(rng, length):
+    return "".join(rng.choice(NUCLEOTIDES, length))
+
+
+def random_block(rng, block_id, mean_len):
+    """Returns a block with random consensus and gaps, and no occurrence."""
+    L = int(rng.integers(50, 2 * mean_len))
+    keys = sorted(set(int(k) for k in rng.integers(0, L + 1, rng.integers(0, 4))))
+    return {
+        "id": block_id,
+        "sequence": random_sequence(rng, L),
+        "gaps": {str(k): int(rng.integers(1, 15)) for k in keys},
+        "mutate": [],
+        "insert": [],
+        "delete": [],
+        "positions": [],
+    }
+
+
+def random_variation(rng, block, mut_density):
+    """Returns random mutations, insertions and deletions of one occurrence of
+    the block, in the pangraph format, and the length of the occurrence."""
+    cons = block["sequence"]
+    L = len(cons)
+    # non-overlapping deletions, each shorter than half the block
+    deleted = np.zeros(L + 2, dtype=bool)
+    dels = []
+    for _ in range(int(rng.integers(0, 3))):
+        pos = int(rng.integers(1, L + 1))
+        dL = min(int(rng.integers(1, 10)), L - pos + 1)
+        if deleted[pos : pos + dL].any() or dL >= L // 2:
+            continue
+        deleted[pos : pos + dL] = True
+        dels.append([pos, dL])
+    dels.sort()
+    # mutations outside of deletions
+    muts = []
+    n_muts = rng.binomial(L, mut_density)
+    for pos in sorted(set(int(p) for p in rng.integers(1, L + 1, n_muts))):
+        if not deleted[pos]:
+            nt = rng.choice([c for c in "ACGT" if c != cons[pos - 1]])
+            muts.append([pos, str(nt)])
+    # at most one insertion per gap
+    ins = []
+    for k, gap_L in block["gaps"].items():
+        if rng.random() < 0.5:
+            ins_L = int(rng.integers(1, gap_L + 1))
+            offset = int(rng.integers(0, gap_L - ins_L + 1))
+            ins.append([[int(k), offset], random_sequence(rng, ins_L)])
+    occ_L = L - sum(dL for _, dL in dels) + sum(len(seq) for _, seq in ins)
+    return muts, ins, dels, occ_L
+
+
+def synthetic_pangraph(
+    n_strains=10,
+    n_blocks=100,
+    dup_rate=0.05,
+    mut_density=0.01,
+    circular=True,
+    mean_len=400,
+    acc_frac=0.3,
+    seed=0,
+):
+    """Returns a random pangraph, as the dictionary of a pangraph .json file,
+    together with a dictionary {strain -> genome length}.
+
+    Args:
+        n_strains (int): number of strains (paths).
+        n_blocks (int): number of blocks.
+        dup_rate (float): probability for each block occurrence to be duplicated
+            elsewhere in the same genome.
+        mut_density (float): fraction of the consensus positions that are
+            mutated in each occurrence.
+        circular (bool): whether genomes are circular. If so, the origin of each
+            genome is placed at random, and blocks can wrap around it.
+        mean_len (int): average length of block consensus sequences.
+        acc_frac (float): fraction of accessory blocks, which are present in a
+            random subset of the strains. Other blocks are core blocks.
+        seed (int): seed of the random number generator.
+    """
+    rng = np.random.default_rng(seed)
+    ids = random_block_ids(rng, n_blocks)
+    blocks = {bl_id: random_block(rng, bl_id, mean_len) for bl_id in ids}
+    accessory = rng.random(n_blocks) < acc_frac
+    core = [bl_id for bl_id, acc in zip(ids, accessory) if not acc]
+    acc = [bl_id for bl_id, acc in zip(ids, accessory) if acc]
+
+    paths, genome_lengths = [], {}
+    for s in range(n_strains):
+        name = f"strain_{s}"
+        order = list(core)
+        for bl_id in acc:
+            # the first strain has all blocks
+            if s == 0 or rng.random() < 0.6:
+                order.insert(int(rng.integers(0, len(order) + 1)), bl_id)
+        for bl_id in [bl_id for bl_id in order if rng.random() < dup_rate]:
+            order.insert(int(rng.integers(0, len(order) + 1)), bl_id)
+
+        counts, path_blocks, occ_coords = {}, [], []
+        pos = 1
+        for bl_id in order:
+            counts[bl_id] = counts.get(bl_id, 0) + 1
+            strand = bool(rng.random() < 0.7)
+            occ = {"name": name, "number": counts[bl_id], "strand": strand}
+            path_blocks.append({"id": bl_id, **occ})
+            block = blocks[bl_id]
+            muts, ins, dels, occ_L = random_variation(rng, block, mut_density)
+            block["mutate"].append([occ, muts])
+            block["insert"].append([occ, ins])
+            block["delete"].append([occ, dels])
+            occ_coords.append((bl_id, occ, pos, pos + occ_L - 1))
+            pos += occ_L
+
+        genome_L = pos - 1
+        offset = int(rng.integers(0, genome_L)) if circular else 0
+        for bl_id, occ, beg, end in occ_coords:
+            beg = (beg - offset - 1) % genome_L + 1
+            end = (end - offset - 1) % genome_L + 1
+            blocks[bl_id]["positions"].append([occ, [beg, end]])
+        paths.append({"name": name, "offset": offset, "circular": circular, "blocks": path_blocks})
+        genome_lengths[name] = genome_L
+
+    used = {bl["id"] for path in paths for bl in path["blocks"]}
+    pan_json = {"paths": paths, "blocks": [blocks[bl_id] for bl_id in ids if bl_id in used]}
+    return pan_json, genome_lengths
+
+
+def synthetic_gff_lines(strain, genome_L, n_features, seed=0):
+    """Returns the lines of a random GFF for a strain, with `n_features` genes,
+    each with one CDS. Features are sorted by start position."""
+    rng = np.random.default_rng(seed)
+    lines = ["##gff-version 3", f"##sequence-region {strain} 1 {genome_L}"]
+    starts = np.sort(rng.integers(1, max(genome_L - 2000, 2), n_features))
+    for i, start in enumerate(starts):
+        end = min(int(start) + int(rng.integers(30, 1500)), genome_L)
+        strand = "+" if rng.random() < 0.5 else "-"
+        lines.append(f"{strain}\tsynthetic\tgene\t{start}\t{end}\t.\t{strand}\t.\tID=gene-{i};Name=g{i}")
+        lines.append(
+            f"{strain}\tsynthetic\tCDS\t{start}\t{end}\t.\t{strand}\t0\tID=cds-{i};Parent=gene-{i};product=p{i}"
+        )
+    return lines
+
+
+def write_dataset(output_dir, n_features=500, **kwargs):
+    """Writes a synthetic pangraph (`pangraph.json`) and one GFF per strain
+    (`{strain}.gff`) to `output_dir`. Additional arguments are passed to
+    `synthetic_pangraph`. Returns the pangraph file and the list of GFF files."""
+    os.makedirs(output_dir, exist_ok=True)
+    pan_json, genome_lengths = synthetic_pangraph(**kwargs)
+    pan_file = os.path.join(output_dir, "pangraph.json")
+    with open(pan_file, "w") as f:
+        json.dump(pan_json, f)
+    gff_files = []
+    for i, (strain, genome_L) in enumerate(genome_lengths.items()):
+        gff_file = os.path.join(output_dir, f"{strain}.gff")
+        with open(gff_file, "w") as f:
+            f.write("\n".join(synthetic_gff_lines(strain, genome_L, n_features, seed=i)) + "\n")
+        gff_files.append(gff_file)
+    return pan_file, gff_files
+
+
+def get_options():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic pangraph and matching GFF annotations",
+        prog="synthetic_pangraph",
+    )
+    parser.add_argument("--output_dir", help="Output directory", required=True)
+    parser.add_argument("--strains", type=int, help="Number of strains", default=10)
+    parser.add_argument("--blocks", type=int, help="Number of blocks", default=100)
+    parser.add_argument("--dup_rate", type=float, help="Duplication rate of block occurrences", default=0.05)
+    parser.add_argument("--mut_density", type=float, help="Mutations per consensus position", default=0.01)
+    parser.add_argument("--linear", action="store_true", help="Linear genomes (no wrap-around at the origin)")
+    parser.add_argument("--mean_len", type=int, help="Average length of blocks", default=400)
+    parser.add_argument("--features", type=int, help="Number of genes in each GFF", default=500)
+    parser.add_argument("--seed", type=int, help="Random seed", default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = get_options()
+    write_dataset(
+        args.output_dir,
+        n_features=args.features,
+        n_strains=args.strains,
+        n_blocks=args.blocks,
+        dup_rate=args.dup_rate,
+        mut_density=args.mut_density,
+        circular=not args.linear,
+        mean_len=args.mean_len,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,62 @@
 import pandas as pd
+import numpy as np
 import re
 import argparse
+import itertools
+import multiprocessing
+import os
+import sys
 from datetime import datetime
 
 import pangraph_locator 
 import pangraph_interface 
+import pangraph_cache
+import pangraph_export
+import pangraph_profile
 
 def get_options():
     parser = argparse.ArgumentParser(description="Add information on pancontig location to gff",
                                      prog="add_pancontigs_to_gff")
     parser.add_argument("--pangraph", 
         help="Input pangraph (JSON)", required=True)
-    parser.add_argument("--input_gff", 
-        help="Annotations (GFF)", required=True)
+    parser.add_argument("--input_gff", nargs="+", 
+        help="Annotations (GFF). Several files can be given, in which case --output_dir is required", required=False, default=[])
+    parser.add_argument("--manifest", 
+        help="File listing input GFFs, one per line, optionally followed by a tab and the output GFF", required=False, default="")
     parser.add_argument("--output_gff", 
         help="Output gff with pancontigs as attributes (GFF)", required=False, default="")
+    parser.add_argument("--output_dir", 
+        help="Output directory when annotating several GFFs", required=False, default="")
+    parser.add_argument("--processes", type=int, 
+        help="Number of processes used to annotate several GFFs (the pangraph is loaded only once)", required=False, default=1)
     parser.add_argument("--mode", choices=["attributes", "regions"],  
         help="Whether to keep original gff and add pancontig attributes (attributes) or make a new gff wrt pancontigs (regions)", required=False, default="attributes")
-    return parser.parse_args()
+    parser.add_argument("--cache", nargs="?", const=True, default=None,
+        help="Use a binary cache of the parsed pangraph, stored in the given directory (default: next to the pangraph file). The cache is rebuilt if the pangraph changes", required=False)
+    parser.add_argument("--coords_only", action="store_true",
+        help="Only load the coordinates of blocks from the pangraph, skipping sequences and alignments (faster, less memory)", required=False)
+    parser.add_argument("--embed_fasta", choices=["block", "genome"], default=None,
+        help="In regions mode, append the sequences of the pancontigs of the strains in the gff as a ##FASTA section, in the orientation of the pancontig consensus (block, matching the coordinates of the entries) or of the genome (genome)", required=False)
+    parser.add_argument("--occurrence_seqids", action="store_true",
+        help="In regions mode, name the seqid of each entry after its block occurrence (e.g. FUZWWRHODH-_1|strain) rather than the block id, as the records of export_pancontig_sequences.py. Implied by --embed_fasta", required=False)
+    parser.add_argument("--profile", nargs="?", const=True, default=None,
+        help="Record the time and memory used by each stage of the run, and write them to the given JSON file (default: next to the output)", required=False)
+    parser.add_argument("--feature_cache", default="",
+        help="In regions mode, store the output of each feature in the given database (sqlite), and reuse it for the features that did not change since a previous run on the same pangraph. Warnings about features that wrap around the genome are not printed (nor counted in the --profile) again for reused features", required=False)
+    args = parser.parse_args()
+    if (len(args.input_gff)==0) == (args.manifest==""):
+        parser.error("exactly one of --input_gff or --manifest is required")
+    if args.output_gff!="" and (len(args.input_gff)!=1):
+        parser.error("--output_gff can only be used with a single --input_gff, use --output_dir instead")
+    if args.embed_fasta is not None and args.mode!="regions":
+        parser.error("--embed_fasta can only be used with --mode regions")
+    if args.embed_fasta is not None and args.coords_only:
+        parser.error("--embed_fasta needs the block sequences, which are not loaded with --coords_only")
+    if args.occurrence_seqids and args.mode!="regions":
+        parser.error("--occurrence_seqids can only be used with --mode regions")
+    if args.feature_cache!="" and args.mode!="regions":
+        parser.error("--feature_cache can only be used with --mode regions")
+    return args
 
 class gffEntry:
     """Class for a single gff entry"""
@@ -47,13 +86,13 @@ class GFF:
 
 class GraphGFF:
     """A data holder for original gff for a strain and the new gff mapped onto a pangraph."""
-    def __init__(self, pangraph_file, gff_file):
+    def __init__(self, pangraph_file, gff_file, cache=None, coords_only=False):
         self.original_gff = GFF(gff_file)
-        self.pangraph = pangraph_interface.Pangraph.load_json(pangraph_file)
-        # Locator
-        loc = pangraph_locator.Locator(self.pangraph)
-        # Get map of the pangraph
-        self.pangraph_map = pangraph_locator.build_map(self.pangraph.paths, self.pangraph.blocks)
+        # blocks are only built when the map needs them
+        self.pangraph = pangraph_interface.Pangraph.load_json(pangraph_file, lazy=True, cache=cache, compact=True, coords_only=coords_only)
+        # Locator (reloads the map from the cache, if present)
+        # maps are only built for the strains in the gff
+        self.pangraph_map = pangraph_locator.Locator(self.pangraph, lazy=True)
         # Add pancontig info onto the gff
         self.new_gff = add_pancontigs_to_gff(self.pangraph_map, self.original_gff.gff)
         self.pancontig_gff = add_gff_to_pancontigs(self.pangraph_map, self.original_gff.gff)
@@ -71,29 +110,36 @@ def file_is_gff(gff_file):
         else:
             return(True)
 
+def iter_gff(gff_file):
+    """Reads a gff file one line at a time, yielding a gffEntry for each feature.
+    Comment lines are skipped and reading stops at the ##FASTA section"""
+    if not file_is_gff(gff_file):
+        raise Exception(f"the input file {gff_file} should start with a ##gff-version header")
+    with open(gff_file, "r") as f:
+        for line in f:
+            if line.startswith("##FASTA"): # Don't read in fasta components
+                break
+            if line.startswith("#"):
+                continue
+            line = line.strip("\n").split("\t")
+            if len(line)==9:
+                yield gffEntry(line)
+
 def load_gff(gff_file):
     """Loads in a gff file"""
-    if file_is_gff(gff_file):
-        gff_entry_list = []
-        with open(gff_file, "r") as f:
-            for line in f.readlines():
-                if line.startswith("#"):
-                    pass
-                if line.startswith("##FASTA"): # Don't read in fasta components
-                    break
-                else:
-                    line = line.strip("\n").split("\t")
-                    if len(line)==9:
-                        gff_entry_list.append(line)
-    gff = [gffEntry(x) for x in gff_entry_list]
+    gff = list(iter_gff(gff_file))
     return(gff)
 
+def gff_seqids(gff_file):
+    """returns the set of seqids of the features in a gff file"""
+    return(set(gff_entry.seqid for gff_entry in iter_gff(gff_file)))
+
 def gff_header(gff_file):
     """Extracts the header of a gff_file"""
     if file_is_gff(gff_file):
         gff_header_string = ""
         with open(gff_file, "r") as f:
-            for line in f.readlines():
+            for line in f:
                 if line.startswith("#"):
                     gff_header_string += line
                 else:
@@ -125,19 +171,61 @@ def add_pancontig_info(pangraph_map, strain: str, gff_entry):
     return(new_gff_entries)
 
 
+def get_profiler(pangraph_map):
+    """profiler of the map (see pangraph_profile), or a profiler that records nothing"""
+    return(getattr(pangraph_map, "profiler", pangraph_profile.NULL_PROFILER))
+
+def count_fragments(profiler, offsets):
+    """counts the features that span several pancontigs, and their fragments"""
+    n_blocks = np.diff(offsets)
+    profiler.count("fragmented_features", np.sum(n_blocks>1))
+    profiler.count("fragments", np.sum(n_blocks[n_blocks>1]))
+
+def pancontig_labels(pmap):
+    """pancontig label (e.g. FUZWWRHODH-_1) of every block occurrence of a strain, in the
+    PathMap order. The list is repeated twice, so that the labels of the blocks of any
+    interval (which are consecutive, possibly across the end of the list) are a slice"""
+    labels = [bl_id+{True: "+", False: "-"}[strand]+"_"+str(n) for bl_id, strand, n in
+              zip(pmap.ids.tolist(), pmap.strands.tolist(), pmap.nums.tolist())]
+    return(labels+labels)
+
+def pancontig_info_batch(pangraph_map, gff_entries):
+    """returns the pancontig information string (e.g. FUZWWRHODH-_1,...) for each gff entry.
+    Entries are grouped by seqid. For each strain, only the range of blocks containing each
+    entry is located (see PathMap.interval_block_ranges), and labels are built once per
+    block occurrence rather than once per fragment"""
+    pancontigInfo = [None]*len(gff_entries)
+    entries_by_strain = {}
+    for i, gff_entry in enumerate(gff_entries):
+        entries_by_strain.setdefault(gff_entry.seqid, []).append(i)
+    for strain, entry_idxs in entries_by_strain.items():
+        pmap = pangraph_map[strain]
+        starts = [gff_entries[i].start for i in entry_idxs]
+        ends = [gff_entries[i].end for i in entry_idxs]
+        with get_profiler(pangraph_map).stage("interval_to_blocks"):
+            idx_b, n_blocks = pmap.interval_block_ranges(starts, ends)
+        count_fragments(get_profiler(pangraph_map), np.concatenate([[0], np.cumsum(n_blocks)]))
+        labels = pancontig_labels(pmap)
+        for i, b, n in zip(entry_idxs, idx_b.tolist(), n_blocks.tolist()):
+            pancontigInfo[i] = ",".join(labels[b:b+n])
+    return(pancontigInfo)
+
 def add_pancontigs_to_gff(pangraph_map, original_gff):
     """adds pancontig information for each gff entry"""
     new_gff_list = []
-    for gff_entry in original_gff:
-        strain = gff_entry.seqid
-        gff_partials = add_pancontig_info(pangraph_map, strain, gff_entry)
-        for gff_partial in gff_partials:
-            new_gff_list.append(gff_partial)
+    pancontigInfo = pancontig_info_batch(pangraph_map, original_gff)
+    for gff_entry, info in zip(original_gff, pancontigInfo):
+        entry_attributes = gff_entry.attributes+";pancontigs="+info
+        new_gff_list.append(gffEntry([gff_entry.seqid, gff_entry.source, gff_entry.type, gff_entry.start, gff_entry.end, gff_entry.score, gff_entry.strand, gff_entry.phase, \
+                                    entry_attributes]))
     return(GFF(new_gff_list))
 
-def project_annotation_onto_pancontig(pangraph_map, strain: str, gff_entry):
-    """given a gff entry, returns new gff entries mapped onto pancontigs (blocks) of pangraph"""
-    blocks_for_gene_ids, blocks_for_gene_rel_pos, blocks_for_gene_occurrences = list(pangraph_map[strain].interval_to_blocks(gff_entry.start, gff_entry.end))
+def project_annotation_onto_pancontig(pangraph_map, strain: str, gff_entry, blocks_for_gene=None):
+    """given a gff entry, returns new gff entries mapped onto pancontigs (blocks) of pangraph.
+    The blocks containing the entry (as returned by interval_to_blocks) can be passed if already computed"""
+    if blocks_for_gene is None:
+        blocks_for_gene = pangraph_map[strain].interval_to_blocks(gff_entry.start, gff_entry.end)
+    blocks_for_gene_ids, blocks_for_gene_rel_pos, blocks_for_gene_occurrences = list(blocks_for_gene)
     new_gff_entries = []
     if len(blocks_for_gene_ids)==1: # if only one block, entry is not fragmented across multiple blocks
         entry_type = gff_entry.type # Inherit entry type
@@ -154,10 +242,10 @@ def project_annotation_onto_pancontig(pangraph_map, strain: str, gff_entry):
         gene_starting_block = blocks_for_gene_ids[0] # get the first and 
         #gene_starting_block_idx = 
         gene_ending_block = blocks_for_gene_ids[-1] # last block
-        block_ids_strain = pangraph_map[strain].ids
+        strain_map = pangraph_map[strain]
         for i, b in enumerate(blocks_for_gene_ids): # we go through each block to output the gene fragments
-            # We get the index of the block - accounts for duplicated blocks (a headache to understand but I think works ok)
-            b_index = [i for i in range(len(block_ids_strain)) if block_ids_strain[i] in b][blocks_for_gene_occurrences[i][1]-1]
+            # We get the index of the block from its id and occurrence number - accounts for duplicated blocks
+            b_index = strain_map.occurrence_to_block_idx(b, blocks_for_gene_occurrences[i][1])
             block_strand = {True: '+', False: '-'}[blocks_for_gene_occurrences[i][2]] # get strand
             block_occurrence = blocks_for_gene_occurrences[i][1]
             b_start, b_end = pangraph_map[strain].b[b_index], pangraph_map[strain].e[b_index] # get block start and end
@@ -188,12 +276,34 @@ def project_annotation_onto_pancontig(pangraph_map, strain: str, gff_entry):
 
 
 
+def blocks_for_entries_batch(pangraph_map, gff_entries):
+    """returns, for each gff entry, the blocks containing it in the same format as interval_to_blocks.
+    Entries are grouped by seqid, and the intervals of each strain are located in a single vectorized query"""
+    blocks_for_entries = [None]*len(gff_entries)
+    entries_by_strain = {}
+    for i, gff_entry in enumerate(gff_entries):
+        entries_by_strain.setdefault(gff_entry.seqid, []).append(i)
+    for strain, entry_idxs in entries_by_strain.items():
+        pmap = pangraph_map[strain]
+        starts = [gff_entries[i].start for i in entry_idxs]
+        ends = [gff_entries[i].end for i in entry_idxs]
+        with get_profiler(pangraph_map).stage("interval_to_blocks"):
+            offsets, idxs, I_b, I_e, _ = pmap.interval_to_blocks_batch(starts, ends)
+        count_fragments(get_profiler(pangraph_map), offsets)
+        occs = pmap.occurrences(idxs)
+        I = list(zip(I_b.tolist(), I_e.tolist()))
+        for k, i in enumerate(entry_idxs):
+            sl = slice(offsets[k], offsets[k+1])
+            blocks_for_entries[i] = (pmap.block_ids(idxs[sl]), I[sl], occs[sl])
+    return(blocks_for_entries)
+
 def add_gff_to_pancontigs(pangraph_map, original_gff):
     """adds a gff onto the pancontigs, making a note of fragmented genes in attributes"""
     new_gff_list = []
-    for gff_entry in original_gff:
+    blocks_for_entries = blocks_for_entries_batch(pangraph_map, original_gff)
+    for gff_entry, blocks_for_gene in zip(original_gff, blocks_for_entries):
         strain = gff_entry.seqid
-        gff_partials = project_annotation_onto_pancontig(pangraph_map, strain, gff_entry)
+        gff_partials = project_annotation_onto_pancontig(pangraph_map, strain, gff_entry, blocks_for_gene)
         for gff_partial in gff_partials:
             new_gff_list.append(gff_partial)
     return(GFF(new_gff_list))
@@ -206,6 +316,87 @@ def calculate_phase(start, initial_phase, position):
         absolute_phase = (relative_phase_to_start + int(initial_phase)) % 3
         return(absolute_phase)
 
+def annotate_lines_cached(pangraph_map, gff_entries, mode, feature_cache):
+    """returns the output gff lines of a list of gff entries projected onto pancontigs (regions),
+    reusing the results of the entries found in feature_cache (a pangraph_cache.FeatureCache).
+    Only the other entries are annotated, and their output lines are added to the cache. Features
+    are identified by their whole gff line, so that any change of a feature (e.g. of its attributes)
+    annotates it again. Cached lines are written as they are, without building gff entries.
+    Fragments of cached features are counted from their lines (one per fragment), but warnings about
+    features that wrap around the genome are only printed when they are annotated.
+    Only regions mode is supported: in attributes mode, annotating is faster than reading the cache"""
+    if mode!="regions":
+        raise ValueError(f"the feature cache can only be used in regions mode, not {mode}")
+    profiler = get_profiler(pangraph_map)
+    lines = [gff_entry_to_line(gff_entry) for gff_entry in gff_entries]
+    with profiler.stage("feature_cache"):
+        keys = feature_cache.keys(mode, lines)
+        results = feature_cache.lookup(keys)
+    missing = [i for i, result in enumerate(results) if result is None]
+    profiler.count("cached_features", len(lines)-len(missing))
+    n_lines = [result.count("\n")+1 for result in results if result]
+    count_fragments(profiler, np.concatenate([[0], np.cumsum(n_lines, dtype=np.int64)]))
+    if len(missing)>0:
+        missing_entries = [gff_entries[i] for i in missing]
+        blocks_for_entries = blocks_for_entries_batch(pangraph_map, missing_entries)
+        new_results = ["\n".join(gff_entry_to_line(new_entry) for new_entry in
+                                 project_annotation_onto_pancontig(pangraph_map, gff_entry.seqid, gff_entry, blocks_for_gene))
+                       for gff_entry, blocks_for_gene in zip(missing_entries, blocks_for_entries)]
+        for i, result in zip(missing, new_results):
+            results[i] = result
+        with profiler.stage("feature_cache"):
+            feature_cache.store([keys[i] for i in missing], new_results)
+    return([line for result in results if result!="" for line in result.split("\n")])
+
+def annotate_gff(pangraph_map, gff_entries, mode="attributes", chunk_size=10000):
+    """Generator of the new gff entries for a stream of gff entries, either with pancontigs
+    as attributes or projected onto pancontigs (regions). Entries are processed in chunks
+    of chunk_size, so that memory does not grow with the size of the gff"""
+    profiler = get_profiler(pangraph_map)
+    gff_entries = iter(gff_entries)
+    while True:
+        with profiler.stage("read_gff"):
+            chunk = list(itertools.islice(gff_entries, chunk_size))
+        if len(chunk)==0:
+            break
+        profiler.count("features", len(chunk))
+        with profiler.stage("annotate"):
+            if mode=="attributes":
+                new_gff = add_pancontigs_to_gff(pangraph_map, chunk)
+            elif mode=="regions":
+                new_gff = add_gff_to_pancontigs(pangraph_map, chunk)
+            else:
+                raise ValueError(f"unknown mode {mode}, should be attributes or regions")
+        profiler.count("output_entries", len(new_gff.gff))
+        # the entries are written by the consumer of the generator
+        with profiler.stage("write_gff"):
+            yield from new_gff.gff
+
+def annotate_gff_lines(pangraph_map, gff_entries, mode="attributes", chunk_size=10000, feature_cache=None):
+    """Generator of the output gff lines (without newline) for a stream of gff entries, as
+    annotate_gff. If a feature_cache is given, the results of the features already annotated
+    in a previous run are reused (see annotate_lines_cached, regions mode only)"""
+    if feature_cache is None:
+        yield from map(gff_entry_to_line, annotate_gff(pangraph_map, gff_entries, mode=mode, chunk_size=chunk_size))
+        return
+    profiler = get_profiler(pangraph_map)
+    gff_entries = iter(gff_entries)
+    while True:
+        with profiler.stage("read_gff"):
+            chunk = list(itertools.islice(gff_entries, chunk_size))
+        if len(chunk)==0:
+            break
+        profiler.count("features", len(chunk))
+        with profiler.stage("annotate"):
+            new_lines = annotate_lines_cached(pangraph_map, chunk, mode, feature_cache)
+        profiler.count("output_entries", len(new_lines))
+        with profiler.stage("write_gff"):
+            yield from new_lines
+
+def gff_entry_to_line(gff_entry):
+    """returns the tab-separated gff line of a gff entry (without newline)"""
+    return("\t".join([str(x) for x in vars(gff_entry).values()]))
+
 def write_gff(gff_list, gff_file, header_string="##gff-version 3\n"): 
     """writes a gff to file"""
     with open(gff_file, "w") as f:
@@ -213,25 +404,182 @@ def write_gff(gff_list, gff_file, header_string="##gff-version 3\n"):
             for entry in gff_list:
                 f.write("\t".join([str(x) for x in entry])+"\n")
 
+def write_gff_lines(gff_lines, gff_file, header_string="##gff-version 3\n"):
+    """writes a stream of gff lines (without newline) to file, one at a time"""
+    with open(gff_file, "w") as f:
+        f.write(header_string)
+        for line in gff_lines:
+            f.write(line+"\n")
+
+def write_gff_entries(gff_entries, gff_file, header_string="##gff-version 3\n"):
+    """writes a stream of gff entries to file, one at a time"""
+    write_gff_lines(map(gff_entry_to_line, gff_entries), gff_file, header_string)
+
+def occurrence_seqid_line(line):
+    """renames the seqid (block id) of an output line of regions mode after the block occurrence
+    (e.g. FUZWWRHODH-_1|strain), as the records of the ##FASTA section. Block ids are not unique
+    when a block occurs several times. See pangraph_export.pancontig_sequence_name"""
+    fields = line.split("\t")
+    occurrence = re.search(r";pancontigStrand=([+-]);pancontigN=(\d+)$", fields[8])
+    fields[0] = pangraph_export.pancontig_sequence_name(fields[0], fields[1], int(occurrence.group(2)), occurrence.group(1)=="+")
+    return("\t".join(fields))
+
+def annotate_gff_file(pangraph_map, input_gff, output_gff, mode, pangraph_name, fasta_orientation=None, feature_cache=None,
+                      occurrence_seqids=False, processes=1):
+    """annotates a single gff file, writing the result to output_gff (or to stdout if output_gff is empty).
+    If fasta_orientation is "block" or "genome", the sequences of the pancontigs of the strains in the gff
+    are appended as a ##FASTA section (see pangraph_export.iter_pancontig_sequences), extracted with a pool
+    of processes. In this case, or if occurrence_seqids is True, the seqids of the entries are renamed after
+    the block occurrences as the records (see occurrence_seqid_line). If a feature_cache is given, only the
+    features that are not in the cache are annotated"""
+    additional_header_string = "#!pancontig information relative to "+str(pangraph_name)+" added on "+datetime.now().strftime("%m/%d/%Y, %H:%M:%S")+"\n"
+    gff_header_string = gff_header(input_gff)+additional_header_string
+    # gff entries are streamed from the input, through the annotation, to the output
+    # In regions mode (IN PROGRESS)
+    # To do: add a proper header string with sequence regions as pancontigs
+    # The sequences of the pancontigs in the strain can be appended (fasta_orientation)
+    # or exported with export_pancontig_sequences.py, to inspect e.g. in IGV
+    output_gff_lines = annotate_gff_lines(pangraph_map, iter_gff(input_gff), mode=mode, feature_cache=feature_cache)
+    if occurrence_seqids or fasta_orientation is not None:
+        output_gff_lines = map(occurrence_seqid_line, output_gff_lines)
+    if output_gff!="":
+        write_gff_lines(output_gff_lines, output_gff, header_string = gff_header_string)
+    else:
+        print(gff_header_string)
+        for line in output_gff_lines:
+            print(line)
+    if fasta_orientation is not None:
+        # strains in order of appearance in the gff
+        strains = list(dict.fromkeys(gff_entry.seqid for gff_entry in iter_gff(input_gff)))
+        with get_profiler(pangraph_map).stage("write_fasta"):
+            if output_gff!="":
+                with open(output_gff, "a") as f:
+                    f.write("##FASTA\n")
+                    pangraph_export.write_pancontig_sequences(pangraph_map, strains, f, fasta_orientation, processes)
+            else:
+                print("##FASTA")
+                pangraph_export.write_pancontig_sequences(pangraph_map, strains, sys.stdout, fasta_orientation, processes)
+    return(output_gff)
+
+def read_manifest(manifest_file):
+    """reads a manifest of gff files: one input gff per line, optionally followed by a tab and the output gff.
+    Returns a list of (input, output) pairs, with output="" if not specified"""
+    jobs = []
+    with open(manifest_file, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line=="" or line.startswith("#"):
+                continue
+            fields = line.split("\t")
+            jobs.append((fields[0], fields[1] if len(fields)>1 else ""))
+    return(jobs)
+
+def default_output_gff(input_gff, output_dir, mode):
+    """output file in output_dir for an input gff e.g. genome.gff -> output_dir/genome.pancontigs_as_attributes.gff"""
+    stem = os.path.splitext(os.path.basename(input_gff))[0]
+    return(os.path.join(output_dir, stem+".pancontigs_as_"+mode+".gff"))
+
+# map shared by worker processes. With the fork start method it is inherited
+# from the parent process without copying (copy-on-write)
+_worker_pangraph_map = None
+
+def _init_worker(pangraph_map):
+    global _worker_pangraph_map
+    _worker_pangraph_map = pangraph_map
+
+def _annotate_gff_job(job):
+    """annotates a gff in a worker process. Returns the output file and the stages
+    recorded by the profiler of the map in this job"""
+    input_gff, output_gff, mode, pangraph_name, fasta_orientation, feature_cache, occurrence_seqids = job
+    # each worker has its own copy of the profiler
+    profiler = get_profiler(_worker_pangraph_map)
+    profiler.reset()
+    output_gff = annotate_gff_file(_worker_pangraph_map, input_gff, output_gff, mode, pangraph_name, fasta_orientation, feature_cache,
+                                   occurrence_seqids)
+    if feature_cache is not None:
+        # each job has its own copy of the cache, with its own connection
+        feature_cache.close()
+    return(output_gff, profiler.to_dict())
+
+def annotate_gff_files(pangraph_map, io_files, mode, pangraph_name, processes=1, fasta_orientation=None, feature_cache=None,
+                       occurrence_seqids=False):
+    """annotates several gff files against the same pangraph map. io_files is a list of
+    (input, output) pairs. Files are distributed over a pool of processes sharing the map.
+    If pangraph_map is a Locator, the maps of all the strains in the files (and the block
+    records, to embed sequences) are loaded before starting the pool. The feature_cache (if any) is opened separately by each process"""
+    jobs = [(input_gff, output_gff, mode, pangraph_name, fasta_orientation, feature_cache, occurrence_seqids)
+            for input_gff, output_gff in io_files]
+    if processes<=1 or len(jobs)<=1:
+        # a single file: processes are used to extract the pancontig sequences, if any
+        return([annotate_gff_file(pangraph_map, *job, processes=processes) for job in jobs])
+    if isinstance(pangraph_map, pangraph_locator.Locator):
+        seqids = set()
+        for input_gff, _ in io_files:
+            seqids |= gff_seqids(input_gff)
+        pangraph_map.prefetch(sorted(seqids))
+        if fasta_orientation is not None:
+            # the processes extract sequences from the shared block records
+            pangraph_map.blocks.load_raw()
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+    with context.Pool(processes, initializer=_init_worker, initargs=(pangraph_map,)) as pool:
+        results = pool.map(_annotate_gff_job, jobs, chunksize=1)
+    for _, report in results:
+        get_profiler(pangraph_map).merge(report)
+    return([output_gff for output_gff, _ in results])
+
+def default_profile_file(io_files, output_dir):
+    """default location of the profile report: next to the output gff for a single
+    output, in output_dir for several outputs, otherwise in the working directory"""
+    if len(io_files)==1 and io_files[0][1]!="":
+        return(io_files[0][1]+".profile.json")
+    if output_dir!="":
+        return(os.path.join(output_dir, "add_pancontigs_to_gff.profile.json"))
+    return("add_pancontigs_to_gff.profile.json")
+
 def main():
     args = get_options()
-    additional_header_string = "#!pancontig information relative to "+str(args.pangraph)+" added on "+datetime.now().strftime("%m/%d/%Y, %H:%M:%S")+"\n"
-    gff_header_string = gff_header(args.input_gff)+additional_header_string
-    glued_gff = GraphGFF(args.pangraph, args.input_gff)
-    if args.mode=="attributes":
-        output_gff_list = glued_gff.new_gff.gff_to_df().values.tolist()
-    elif args.mode=="regions":
-        # IN PROGRESS
-        # To do: add a proper header string with sequence regions as pancontigs
-        # Need to output a new file of the pancontigs with *actual sequences* in the strain
-        # so can inspect e.g. in IGV and match up
-        output_gff_list = glued_gff.pancontig_gff.gff_to_df().values.tolist()
-    if args.output_gff!="":
-        write_gff(output_gff_list, args.output_gff, header_string = gff_header_string)
+    if args.manifest!="":
+        io_files = read_manifest(args.manifest)
     else:
-        print(gff_header_string)
-        for entry in output_gff_list:
-            print("\t".join([str(x) for x in entry]))
+        io_files = [(input_gff, "") for input_gff in args.input_gff]
+    if len(io_files)==1 and args.output_dir=="":
+        io_files = [(io_files[0][0], io_files[0][1] or args.output_gff)]
+    else:
+        # several inputs: every output must be specified in the manifest or go to output_dir
+        if args.output_dir=="" and any(output_gff=="" for _, output_gff in io_files):
+            raise Exception("--output_dir is required when annotating several GFFs")
+        if args.output_dir!="":
+            os.makedirs(args.output_dir, exist_ok=True)
+        io_files = [(input_gff, output_gff or default_output_gff(input_gff, args.output_dir, args.mode)) for input_gff, output_gff in io_files]
+        # e.g. inputs with the same name in different directories: one output would overwrite the other
+        output_paths = [os.path.abspath(output_gff) for _, output_gff in io_files]
+        duplicates = sorted(set(path for path in output_paths if output_paths.count(path)>1))
+        if duplicates:
+            raise Exception("several inputs would be written to the same output: "+", ".join(duplicates)+
+                            ". Give their outputs explicitly in a --manifest")
+    profiler = pangraph_profile.StageProfiler(enabled=args.profile is not None)
+    with profiler.stage("total"):
+        # blocks are only built when the map needs them
+        pangraph = pangraph_interface.Pangraph.load_json(args.pangraph, lazy=True, cache=args.cache, compact=True,
+                                                         coords_only=args.coords_only, profiler=profiler)
+        # maps are only built for the strains in the input gffs
+        pangraph_map = pangraph_locator.Locator(pangraph, lazy=True)
+        feature_cache = None
+        if args.feature_cache!="":
+            # the content hash of the pangraph is already known if it was loaded through the cache
+            digest = pangraph.cache.digest if pangraph.cache is not None else pangraph_cache.file_digest(args.pangraph)
+            feature_cache = pangraph_cache.FeatureCache(args.feature_cache, digest)
+        annotate_gff_files(pangraph_map, io_files, args.mode, args.pangraph, processes=args.processes,
+                           fasta_orientation=args.embed_fasta, feature_cache=feature_cache, occurrence_seqids=args.occurrence_seqids)
+        if feature_cache is not None:
+            feature_cache.close()
+    if args.profile is not None:
+        profile_file = default_profile_file(io_files, args.output_dir) if args.profile is True else args.profile
+        profiler.write_json(profile_file, pangraph=args.pangraph, input_gff=[input_gff for input_gff, _ in io_files],
+                            mode=args.mode, processes=args.processes)
 
 
 
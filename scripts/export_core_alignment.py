@@ -0,0 +1,29 @@
+import argparse
+
+import pangraph_interface
+
+def get_options():
+    parser = argparse.ArgumentParser(description="Export the concatenated alignment of core pancontigs as FASTA",
+                                     prog="export_core_alignment")
+    parser.add_argument("--pangraph", 
+        help="Input pangraph (JSON)", required=True)
+    parser.add_argument("--output_fasta", 
+        help="Output alignment (FASTA), with one record per strain", required=True)
+    parser.add_argument("--snps_only", action="store_true", 
+        help="Only output polymorphic alignment columns without gaps", required=False)
+    parser.add_argument("--reference", 
+        help="Strain whose path sets the order and orientation of pancontigs (default: first strain)", required=False, default=None)
+    parser.add_argument("--processes", type=int, 
+        help="Number of processes used to build pancontig alignments", required=False, default=1)
+    parser.add_argument("--cache", nargs="?", const=True, default=None,
+        help="Use a binary cache of the parsed pangraph, stored in the given directory (default: next to the pangraph file)", required=False)
+    return parser.parse_args()
+
+def main():
+    args = get_options()
+    # blocks are only built when their alignment is needed
+    pangraph = pangraph_interface.Pangraph.load_json(args.pangraph, lazy=True, cache=args.cache, compact=True)
+    pangraph.write_core_alignment(args.output_fasta, snps_only=args.snps_only, reference=args.reference, processes=args.processes)
+
+if __name__== "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+
+import pangraph_export
+import pangraph_interface
+import pangraph_locator
+
+def get_options():
+    parser = argparse.ArgumentParser(description="Export the sequences of the pancontigs of each strain as FASTA, e.g. to view a regions gff in IGV. "
+                                     "Records are named after block occurrences (e.g. FUZWWRHODH-_1|strain), as the seqids of a regions gff "
+                                     "written by add_pancontigs_to_gff.py with --occurrence_seqids",
+                                     prog="export_pancontig_sequences")
+    parser.add_argument("--pangraph", 
+        help="Input pangraph (JSON)", required=True)
+    parser.add_argument("--strains", nargs="+", 
+        help="Strains whose pancontigs are exported (default: all strains)", required=False, default=[])
+    parser.add_argument("--output_fasta", 
+        help="Output FASTA with the pancontigs of all strains (default: standard output)", required=False, default="")
+    parser.add_argument("--output_dir", 
+        help="Output directory, with one FASTA per strain ({strain}.pancontigs.fa)", required=False, default="")
+    parser.add_argument("--orientation", choices=["block", "genome"], 
+        help="Orientation of the sequences: as the pancontig consensus, which matches the coordinates of the regions gff (block), or as in the genome (genome)", required=False, default="block")
+    parser.add_argument("--processes", type=int, 
+        help="Number of processes used to extract the sequences of pancontigs", required=False, default=1)
+    parser.add_argument("--cache", nargs="?", const=True, default=None,
+        help="Use a binary cache of the parsed pangraph, stored in the given directory (default: next to the pangraph file)", required=False)
+    args = parser.parse_args()
+    if args.output_fasta!="" and args.output_dir!="":
+        parser.error("only one of --output_fasta or --output_dir can be given")
+    return args
+
+def main():
+    args = get_options()
+    # blocks are only built when their sequences are needed
+    pangraph = pangraph_interface.Pangraph.load_json(args.pangraph, lazy=True, cache=args.cache, compact=True)
+    pangraph_map = pangraph_locator.Locator(pangraph, lazy=True)
+    strains = list(dict.fromkeys(args.strains)) if len(args.strains)>0 else pangraph_map.strains()
+    unknown = [strain for strain in strains if strain not in pangraph.paths.id_to_pos]
+    if unknown:
+        raise Exception(f"strains not in the pangraph: {', '.join(unknown)}")
+    if args.output_dir!="":
+        os.makedirs(args.output_dir, exist_ok=True)
+        filenames = [os.path.join(args.output_dir, strain+".pancontigs.fa") for strain in strains]
+        pangraph_export.write_pancontig_sequences_per_strain(pangraph_map, strains, filenames, args.orientation, args.processes)
+    elif args.output_fasta!="":
+        with open(args.output_fasta, "w") as f:
+            pangraph_export.write_pancontig_sequences(pangraph_map, strains, f, args.orientation, args.processes)
+    else:
+        pangraph_export.write_pancontig_sequences(pangraph_map, strains, sys.stdout, args.orientation, args.processes)
+
+if __name__== "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import multiprocessing
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+
+import pangraph_interface
+import pangraph_locator
+import pangraph_liftover
+from add_pancontigs_to_gff import gffEntry, iter_gff, gff_entry_to_line, calculate_phase
+
+REPORT_COLUMNS = ["feature", "seqid", "start", "end", "strand", "status", "n_pancontigs",
+                  "n_mapped", "n_duplicated", "target_start", "target_end", "target_strand"]
+FLIP_STRAND = {"+": "-", "-": "+"}
+
+def get_options():
+    parser = argparse.ArgumentParser(description="Transfer the annotations of one strain onto other strains through shared pancontigs",
+                                     prog="liftover_annotations")
+    parser.add_argument("--pangraph",
+        help="Input pangraph (JSON)", required=True)
+    parser.add_argument("--input_gff",
+        help="Annotations of the source strain (GFF). Seqids must be strain names in the pangraph", required=True)
+    parser.add_argument("--target", nargs="+",
+        help="Target strains. Several strains can be given, in which case --output_dir is required", required=True)
+    parser.add_argument("--output_gff",
+        help="Output gff with the annotations lifted onto the target strain", required=False, default="")
+    parser.add_argument("--report",
+        help="Output report (TSV) with the status of each feature: mapped, fragmented, partial or unmapped", required=False, default="")
+    parser.add_argument("--output_dir",
+        help="Output directory when lifting onto several strains", required=False, default="")
+    parser.add_argument("--processes", type=int,
+        help="Number of processes used to lift annotations onto several strains", required=False, default=1)
+    parser.add_argument("--cache", nargs="?", const=True, default=None,
+        help="Use a binary cache of the parsed pangraph, stored in the given directory (default: next to the pangraph file)", required=False)
+    args = parser.parse_args()
+    if len(args.target)>1 and args.output_dir=="":
+        parser.error("--output_dir is required when lifting onto several strains")
+    if len(args.target)==1 and args.output_dir=="" and args.output_gff=="":
+        parser.error("one of --output_gff or --output_dir is required")
+    return args
+
+class SourceAnnotation:
+    """Annotations of the source strain, split into pancontig pieces. The pieces are
+    computed once and reused for every target strain. Features are grouped by seqid:
+    `groups` is a list of (seqid, indices of the features, pieces)"""
+    def __init__(self, locator, gff_entries):
+        self.entries = gff_entries
+        entries_by_strain = {}
+        for i, gff_entry in enumerate(gff_entries):
+            entries_by_strain.setdefault(gff_entry.seqid, []).append(i)
+        self.groups = []
+        for strain, entry_idxs in entries_by_strain.items():
+            starts = [gff_entries[i].start for i in entry_idxs]
+            ends = [gff_entries[i].end for i in entry_idxs]
+            pieces = pangraph_liftover.locate_intervals(locator, strain, starts, ends)
+            self.groups.append((strain, np.array(entry_idxs), pieces))
+
+def feature_id(gff_entry):
+    """ID attribute of a gff entry, or "" if missing"""
+    match = re.search("(?:^|;)ID=([^;]*)", gff_entry.attributes)
+    return(match.group(1) if match else "")
+
+def lifted_entries(gff_entry, target, pieces, lifted, i, sl):
+    """new gff entries for the i-th feature onto the target strain, together with its
+    status and coordinates for the report. Features mapped as a whole keep their
+    attributes; otherwise each mapped piece is a fragment, numbered as in add_pancontigs_to_gff.
+    Features with an end that falls in a gap of the target strain are partial"""
+    n_pieces, n_mapped, n_exact = lifted["n_pieces"][i], lifted["n_mapped"][i], lifted["n_exact"][i]
+    if lifted["contiguous"][i]:
+        strand = FLIP_STRAND.get(gff_entry.strand, gff_entry.strand) if lifted["flipped"][i] else gff_entry.strand
+        start, end = int(lifted["start"][i]), int(lifted["end"][i])
+        entry = gffEntry([target, gff_entry.source, gff_entry.type, start, end, gff_entry.score,
+                          strand, gff_entry.phase, gff_entry.attributes])
+        return([entry], "mapped" if n_exact==n_pieces else "partial", (start, end, strand))
+    status = "unmapped" if n_mapped==0 else ("fragmented" if n_exact==n_pieces else "partial")
+    parent_entry_id = re.sub("ID=", "", re.sub(";.*", "", gff_entry.attributes))
+    parent_other_attributes = re.sub("^.*?;", "", gff_entry.attributes)
+    new_entries = []
+    for k in np.flatnonzero(lifted["mapped"][sl]):
+        p = sl.start+k
+        strand = FLIP_STRAND.get(gff_entry.strand, gff_entry.strand) if lifted["flip"][p] else gff_entry.strand
+        if gff_entry.strand=="-":
+            n_fragment = n_pieces-k
+            phase = calculate_phase(gff_entry.end, gff_entry.phase, int(pieces["src_e"][p]))
+        else:
+            n_fragment = k+1
+            phase = calculate_phase(gff_entry.start, gff_entry.phase, int(pieces["src_b"][p]))
+        attributes = "ID="+parent_entry_id+"-fragment"+str(n_fragment)+";parent="+parent_entry_id+";"+parent_other_attributes
+        new_entries.append(gffEntry([target, gff_entry.source, gff_entry.type, int(lifted["tgt_b"][p]), int(lifted["tgt_e"][p]),
+                                     ".", strand, phase, attributes]))
+    return(new_entries, status, None)
+
+def liftover_annotation(pangraph_map, source, target):
+    """lifts the annotation of the source strain onto the target strain. Returns the list of
+    new gff entries (sorted by position) and the report rows, one per source feature"""
+    new_entries = []
+    report = [None]*len(source.entries)
+    for _, entry_idxs, pieces in source.groups:
+        lifted = pangraph_liftover.lift_pieces(pieces, pangraph_map, target)
+        offsets = pieces["offsets"]
+        n_duplicated = np.add.reduceat(lifted["n_copies"]>1, offsets[:-1]) if len(offsets)>1 else []
+        for i, entry_idx in enumerate(entry_idxs):
+            gff_entry = source.entries[entry_idx]
+            sl = slice(offsets[i], offsets[i+1])
+            entries, status, coords = lifted_entries(gff_entry, target, pieces, lifted, i, sl)
+            new_entries += entries
+            coords = coords if coords is not None else (".", ".", ".")
+            report[entry_idx] = [feature_id(gff_entry) or "feature"+str(entry_idx+1), gff_entry.seqid, gff_entry.start,
+                                 gff_entry.end, gff_entry.strand, status, lifted["n_pieces"][i], lifted["n_mapped"][i],
+                                 n_duplicated[i], *coords]
+    new_entries.sort(key=lambda entry: entry.start)
+    return(new_entries, report)
+
+def write_liftover(pangraph_map, source, input_gff, target, output_gff, report_file, pangraph_name):
+    """lifts the annotation onto one target strain and writes the gff and the report"""
+    new_entries, report = liftover_annotation(pangraph_map, source, target)
+    with open(output_gff, "w") as f:
+        f.write("##gff-version 3\n")
+        f.write("#!annotations of "+str(input_gff)+" lifted onto "+target+" through "+str(pangraph_name)+
+                " on "+datetime.now().strftime("%m/%d/%Y, %H:%M:%S")+"\n")
+        for entry in new_entries:
+            f.write(gff_entry_to_line(entry)+"\n")
+    if report_file!="":
+        with open(report_file, "w") as f:
+            f.write("\t".join(REPORT_COLUMNS)+"\n")
+            for row in report:
+                f.write("\t".join([str(x) for x in row])+"\n")
+    return(output_gff)
+
+# state shared by worker processes. With the fork start method it is inherited
+# from the parent process without copying (copy-on-write)
+_worker_state = None
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+def _liftover_job(job):
+    pangraph_map, source, input_gff, pangraph_name = _worker_state
+    target, output_gff, report_file = job
+    return(write_liftover(pangraph_map, source, input_gff, target, output_gff, report_file, pangraph_name))
+
+def main():
+    args = get_options()
+    if args.output_dir!="":
+        os.makedirs(args.output_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(args.input_gff))[0]
+        jobs = [(target, os.path.join(args.output_dir, stem+".lifted_to_"+target+".gff"),
+                 os.path.join(args.output_dir, stem+".lifted_to_"+target+".report.tsv")) for target in args.target]
+    else:
+        jobs = [(args.target[0], args.output_gff, args.report)]
+    pangraph = pangraph_interface.Pangraph.load_json(args.pangraph, lazy=True, cache=args.cache, compact=True)
+    pangraph_map = pangraph_locator.Locator(pangraph, lazy=True)
+    source = SourceAnnotation(pangraph_map, list(iter_gff(args.input_gff)))
+    # build the maps of all target strains before starting the pool
+    pangraph_map.prefetch(args.target)
+    state = (pangraph_map, source, args.input_gff, args.pangraph)
+    if args.processes<=1 or len(jobs)<=1:
+        _init_worker(state)
+        for job in jobs:
+            _liftover_job(job)
+        return
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+    with context.Pool(args.processes, initializer=_init_worker, initargs=(state,)) as pool:
+        pool.map(_liftover_job, jobs, chunksize=1)
+
+if __name__== "__main__":
+    main()
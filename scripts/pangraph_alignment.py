@@ -7,6 +7,9 @@
 
 import numpy as np
 
+# ASCII code of the gap character "-"
+GAP = ord("-")
+
 
 class pan_alignment:
     """This class contains information on the sequences contained in a block.
@@ -30,11 +33,26 @@ class pan_alignment:
         indices indicating where the block occurrence lays on the full genome
         sequence. in python [i:j] -> [i-1:j].
         NB: for blocks that wrap around the end of the genome, it can be j<i!
+
+    If `compact` is True, mutations, insertions, deletions and positions are
+    stored in numpy arrays (see `compact_variation`), saved in the `variation`
+    attribute. In this case `muts`, `ins`, `dels` and `pos` are read-only views
+    that decode the entries of one occurrence at a time in the format above.
     """
 
-    def __init__(self, pan_block: dict):
+    def __init__(self, pan_block: dict, compact=False):
         self.consensus = pan_block["sequence"]
         self.gaps = pan_block["gaps"]
+        if compact:
+            self.variation = compact_variation.from_pan_block(pan_block)
+            self.occs = self.variation.occs
+            self.muts = variation_view(self.variation, "muts")
+            self.ins = variation_view(self.variation, "ins")
+            self.dels = variation_view(self.variation, "dels")
+            self.pos = variation_view(self.variation, "pos")
+            return
+        self.variation = None
+        self._packed = None
         occs, muts, ins, dels, pos = parse_alignment(pan_block)
         self.occs = occs
         self.muts = muts
@@ -55,6 +73,8 @@ class pan_alignment:
     def block_occurrence_length(self, occ: tuple):
         """Returns the length of a particular block occurrence, inferred from alignment
         information."""
+        if self.variation is not None:
+            return self.variation.occurrence_length(occ, len(self.consensus))
         L = len(self.consensus)
         ins, dels = self.ins[occ], self.dels[occ]
         for i in ins:
@@ -63,24 +83,69 @@ class pan_alignment:
             L -= d[1]  # remove deletions
         return L
 
+    def to_pan_block(self):
+        """Returns the gaps, mutations, insertions, deletions and positions of the
+        block occurrences in the pangraph .json format, as a dictionary with keys
+        "gaps", "mutate", "insert", "delete" and "positions"."""
+        pan_block = {"gaps": self.gaps}
+        pan_labels = ["mutate", "insert", "delete", "positions"]
+        containers = [self.muts, self.ins, self.dels, self.pos]
+        for pan_label, container in zip(pan_labels, containers):
+            pan_block[pan_label] = [
+                [tuple_to_blockid(occ), container[occ]] for occ in self.occs
+            ]
+        return pan_block
+
+    def packed(self):
+        """Returns the variation of the block as a `compact_variation` object. If
+        the alignment is not stored in compact form, this is built (once) from
+        the dictionaries of mutations, insertions, deletions and positions."""
+        if self.variation is not None:
+            return self.variation
+        if self._packed is None:
+            self._packed = compact_variation(
+                self.occs,
+                [self.muts[occ] for occ in self.occs],
+                [self.ins[occ] for occ in self.occs],
+                [self.dels[occ] for occ in self.occs],
+                [self.pos[occ] for occ in self.occs],
+            )
+        return self._packed
+
+    def segments(self, occs=None):
+        """Returns the offset tables of a list of block occurrences (default: all),
+        relating positions in the occurrence sequences to consensus positions and
+        alignment columns (see `occurrence_segments`)."""
+        occs = self.occs if occs is None else list(dict.fromkeys(occs))
+        return occurrence_segments(
+            len(self.consensus),
+            self.gaps,
+            occs,
+            [self.ins[occ] for occ in occs],
+            [self.dels[occ] for occ in occs],
+        )
+
+    def alignment_matrix(self, which=None):
+        """Returns the alignment of the block as a (n. occurrences x n. alignment columns)
+        matrix of uint8 ASCII codes (gaps are `ord("-")`), together with the corresponding
+        list of occurrences (strain, occurrence_n, strand). Optionally a subset of occurrences
+        can be selected. These must be elements of `self.occs`.
+        Rows can be converted to strings with `row.tobytes().decode()`.
+        """
+        if which is None:
+            which = self.occs
+        variation = self.packed()
+        rows = [variation.occ_index[wh] for wh in which]
+        aln = reconstruct_alignment_matrix(self.consensus, self.gaps, variation, rows)
+        return aln, which
+
     def generate_alignments(self, which=None):
         """Returns the aligned set of sequences corresponding to the same block,
         together with the corresponding list of occurrences (strain, occurrence_n, strand).
         Optionally a subset of occurrences can be selected. These must be elements of `self.occs`
         """
-        if which is None:
-            which = self.occs
-
-        seqs = []
-        for wh in which:
-            seq = reconstruct_alignment(
-                self.consensus,
-                gaps=self.gaps,
-                muts=self.muts[wh],
-                ins=self.ins[wh],
-                dels=self.dels[wh],
-            )
-            seqs.append(seq)
+        aln, which = self.alignment_matrix(which)
+        seqs = [_decode(row) for row in aln]
         return seqs, which
 
     def generate_sequences(self, which=None):
@@ -88,33 +153,40 @@ class pan_alignment:
         together with the corresponding list of occurrences (strain, occurrence_n, strand).
         Optionally a subset of occurrences can be selected. These must be elements of `self.occs`
         """
-        alns, which = self.generate_alignments(which)
-        seqs = [aln.replace("-", "") for aln in alns]  # remove gaps "-"
+        aln, which = self.alignment_matrix(which)
+        seqs = [_decode(row[row != GAP]) for row in aln]  # remove gaps "-"
         return seqs, which
 
-    def extract_nongap_SNPs(self, which=None):
+    def extract_nongap_SNPs(self, which=None, return_consensus_flag=False):
         """Given a set of genomes, it returns the positions in which they have mutations w.r.t the block
         consensus.
 
         Returns:
             - positions (np.array): list of positions in which mutations occurr (nb: relative to
                 block consensus)
-            - SNPs (np matrix): matrix of nucleotides. The first index represent occurrences and
-                the second the position
+            - SNPs (np matrix): matrix of nucleotides, as uint8 ASCII codes. The first index represent
+                occurrences and the second the position. It can be converted to characters with
+                `SNPs.view("S1")`.
             - which (list): set of occurrences corresponding to the matrix rows.
+            - has_consensus_column (bool): only if `return_consensus_flag` is True. Whether at least
+                one column has no mutations among the selected occurrences.
 
-        NB: some alignment columns might be the same if a subset of strains is selected. In this case
-            a warning message is printed.
+        NB: some alignment columns might be the same if a subset of strains is selected. This is
+            reported by the `has_consensus_column` flag.
         NB: the order of the occurrences can be controlled through the optional `which argument`.
         """
 
         if which is None:
             which = self.occs
 
-        positions, SNPs = extract_relevant_SNPs(
-            consensus=self.consensus, dels=self.dels, muts=self.muts, which=which
+        variation = self.packed()
+        rows = [variation.occ_index[wh] for wh in which]
+        positions, SNPs, has_consensus_column = extract_relevant_SNPs(
+            consensus=self.consensus, variation=variation, rows=rows
         )
 
+        if return_consensus_flag:
+            return positions, SNPs, which, has_consensus_column
         return positions, SNPs, which
 
 
@@ -147,11 +219,322 @@ def parse_alignment(pan_block: dict):
     return occs, muts, ins, dels, pos
 
 
+class coords_alignment:
+    """Lightweight version of `pan_alignment`, that only contains the coordinates
+    of block occurrences. It is built from a coordinates-only block record (see
+    `pangraph_interface.coords_record`) and has attributes:
+    - occs: a list (strain, n. occurrence, strand) of block occurrences
+    - pos: a dictionary {occurrence -> [beg, end]}, as in `pan_alignment`
+    - lengths: a dictionary {occurrence -> length of the block occurrence}
+    Alignments and sequences cannot be reconstructed from it.
+    """
+
+    def __init__(self, pan_block: dict):
+        self.occs = [blockid_to_tuple(occ) for occ, _ in pan_block["positions"]]
+        self.pos = {occ: pos for occ, (_, pos) in zip(self.occs, pan_block["positions"])}
+        self.lengths = dict(zip(self.occs, pan_block["lengths"]))
+
+    def block_occurrence_length(self, occ: tuple):
+        """Returns the length of a particular block occurrence."""
+        return self.lengths[occ]
+
+
+class compact_variation:
+    """Array-based storage of the variation of all occurrences of a block.
+    Entries of all occurrences are concatenated, and the entries of the i-th
+    occurrence (in the order of `occs`) are in the slice `ptr[i]:ptr[i+1]` of
+    the corresponding pointer array. It has attributes:
+    - occs: a list (strain, n. occurrence, strand) of block occurrences
+    - occ_index: a dictionary {occurrence -> i}
+    - mut_ptr, mut_pos, mut_nt: positions (julia indexing) and nucleotides (as
+        uint8 ASCII codes) of mutations.
+    - del_ptr, del_pos, del_len: positions (julia indexing) and lengths of
+        deletions.
+    - ins_ptr, ins_gap, ins_gap_pos: gap position on the consensus and beginning
+        of the insertion w.r.t. the gap, for every insertion.
+    - ins_seq_ptr, ins_seq: inserted sequences (as uint8 ASCII codes). The
+        sequence of the k-th insertion is `ins_seq[ins_seq_ptr[k]:ins_seq_ptr[k+1]]`.
+    - pos: (n. occurrences x 2) array of [beg, end] positions on the genome
+        (julia indexing).
+    """
+
+    def __init__(self, occs: list, muts: list, ins: list, dels: list, pos: list):
+        """Takes the list of occurrences, and the lists of mutations, insertions,
+        deletions and positions of each occurrence (in the same order)."""
+        self.occs = list(occs)
+        self.occ_index = {occ: i for i, occ in enumerate(self.occs)}
+
+        self.mut_ptr = _pointers([len(m) for m in muts])
+        self.mut_pos = np.array([p for m in muts for p, _ in m], dtype=np.int32)
+        self.mut_nt = _encode("".join(nt for m in muts for _, nt in m))
+
+        self.del_ptr = _pointers([len(d) for d in dels])
+        self.del_pos = np.array([p for d in dels for p, _ in d], dtype=np.int32)
+        self.del_len = np.array([L for d in dels for _, L in d], dtype=np.int32)
+
+        self.ins_ptr = _pointers([len(i) for i in ins])
+        self.ins_gap = np.array([g for i in ins for (g, _), _ in i], dtype=np.int32)
+        self.ins_gap_pos = np.array([gp for i in ins for (_, gp), _ in i], dtype=np.int32)
+        self.ins_seq_ptr = _pointers([len(nts) for i in ins for _, nts in i])
+        self.ins_seq = _encode("".join(nts for i in ins for _, nts in i))
+
+        self.pos = np.array(pos, dtype=np.int64).reshape(-1, 2)
+
+    @staticmethod
+    def from_pan_block(pan_block: dict):
+        """Builds the object directly from the pangraph block dictionary."""
+        occs = [blockid_to_tuple(occ) for occ, _ in pan_block["mutate"]]
+        occ_index = {occ: i for i, occ in enumerate(occs)}
+
+        # order the entries of each label as in `occs`
+        ordered = {}
+        for pan_label in ["mutate", "insert", "delete", "positions"]:
+            items = [None] * len(occs)
+            for occ, item in pan_block[pan_label]:
+                occ_id = blockid_to_tuple(occ)
+                assert occ_id in occ_index, "mismatch in occurrences"
+                items[occ_index[occ_id]] = item
+            ordered[pan_label] = items
+
+        return compact_variation(
+            occs,
+            ordered["mutate"],
+            ordered["insert"],
+            ordered["delete"],
+            ordered["positions"],
+        )
+
+    def occurrence_length(self, occ: tuple, consensus_len: int):
+        """Returns the length of a block occurrence, given the consensus length."""
+        i = self.occ_index[occ]
+        k_b, k_e = self.ins_ptr[i], self.ins_ptr[i + 1]
+        ins_L = self.ins_seq_ptr[k_e] - self.ins_seq_ptr[k_b]
+        del_L = self.del_len[self.del_ptr[i] : self.del_ptr[i + 1]].sum()
+        return int(consensus_len + ins_L - del_L)
+
+    def muts(self, i):
+        """Mutations of the i-th occurrence, as a list [[position, nucleotide], ...]"""
+        sl = slice(self.mut_ptr[i], self.mut_ptr[i + 1])
+        nts = _decode(self.mut_nt[sl])
+        return [[int(p), nt] for p, nt in zip(self.mut_pos[sl], nts)]
+
+    def dels(self, i):
+        """Deletions of the i-th occurrence, as a list [[position, length], ...]"""
+        sl = slice(self.del_ptr[i], self.del_ptr[i + 1])
+        return [[int(p), int(L)] for p, L in zip(self.del_pos[sl], self.del_len[sl])]
+
+    def ins(self, i):
+        """Insertions of the i-th occurrence, as a list
+        [[[gap position, position in gap], sequence], ...]"""
+        items = []
+        for k in range(self.ins_ptr[i], self.ins_ptr[i + 1]):
+            seq = _decode(self.ins_seq[self.ins_seq_ptr[k] : self.ins_seq_ptr[k + 1]])
+            items.append([[int(self.ins_gap[k]), int(self.ins_gap_pos[k])], seq])
+        return items
+
+    def positions(self, i):
+        """Positions [beg, end] of the i-th occurrence on the genome."""
+        return [int(p) for p in self.pos[i]]
+
+
+class occurrence_segments:
+    """Offset tables relating positions in the sequence of block occurrences to
+    positions on the consensus and to columns of the alignment. The sequence of
+    each occurrence is split in segments that are contiguous both in the sequence
+    and in the alignment. A segment is either a run of consensus positions or an
+    insertion. It has attributes:
+    - occs: list of block occurrences (strain, n. occurrence, strand)
+    - occ_index: dictionary {occurrence -> i}
+    - ptr: the segments of the i-th occurrence are in the slice `ptr[i]:ptr[i+1]`
+    - seq_pos: first position of each segment in the occurrence sequence
+    - cons_pos: first consensus position of each segment. For insertions, this is
+        the consensus position after which the insertion is (0 = at the beginning)
+    - col: first alignment column of each segment
+    - inserted: whether each segment is an insertion
+    - occ_len: length of the sequence of each occurrence
+    All positions and columns are 1-based. Sequence positions are relative to the
+    block occurrence in the same orientation as the consensus, as returned by
+    `PathMap.position_to_block`.
+    """
+
+    def __init__(self, consensus_len: int, gaps: dict, occs: list, ins: list, dels: list):
+        """Takes the consensus length, the gaps of the block, the list of occurrences
+        and the lists of insertions and deletions of each occurrence."""
+        self.occs = list(occs)
+        self.occ_index = {occ: i for i, occ in enumerate(self.occs)}
+
+        # alignment column of gap k (after consensus position k), and of the
+        # consensus position following it
+        self._gap_len = {int(k): int(gL) for k, gL in gaps.items()}
+        self._gap_keys = np.array(sorted(self._gap_len), dtype=np.int64)
+        gap_L = np.array([self._gap_len[k] for k in self._gap_keys.tolist()], dtype=np.int64)
+        self._gap_cum = np.concatenate([[0], np.cumsum(gap_L)]).astype(np.int64)
+
+        ptr, seq_pos, cons_pos, col, inserted, occ_len = [0], [], [], [], [], []
+        for occ_ins, occ_dels in zip(ins, dels):
+            segs, L = self._occurrence_segments(consensus_len, occ_ins, occ_dels)
+            occ_len.append(L)
+            for sp, cp, cl, i in segs:
+                seq_pos.append(sp)
+                cons_pos.append(cp)
+                col.append(cl)
+                inserted.append(i)
+            ptr.append(len(seq_pos))
+        self.ptr = np.array(ptr, dtype=np.int64)
+        self.seq_pos = np.array(seq_pos, dtype=np.int64)
+        self.cons_pos = np.array(cons_pos, dtype=np.int64)
+        self.col = np.array(col, dtype=np.int64)
+        self.inserted = np.array(inserted, dtype=bool)
+        self.occ_len = np.array(occ_len, dtype=np.int64)
+
+    def consensus_column(self, cons_pos):
+        """Alignment column of (an array of) consensus positions. For position 0,
+        this is the column before the first."""
+        n_before = np.searchsorted(self._gap_keys, cons_pos, side="left")
+        return cons_pos + self._gap_cum[n_before]
+
+    def _occurrence_segments(self, L, occ_ins, occ_dels):
+        """List of segments (sequence position, consensus position, column,
+        inserted) of one occurrence, and length of the occurrence."""
+        del_len = {p: dL for p, dL in occ_dels}
+        breaks = {1, L + 1}
+        for p, dL in occ_dels:
+            breaks |= {p, p + dL}
+        breaks |= {k + 1 for k in self._gap_len}
+        ins_at = {}
+        for (k, gp), seq in sorted(occ_ins, key=lambda x: (x[0][0], x[0][1])):
+            ins_at.setdefault(k, []).append((gp, len(seq)))
+
+        breaks = sorted(b for b in breaks if 1 <= b <= L + 1)
+        # alignment column of the consensus position at each break
+        break_cols = self.consensus_column(np.array(breaks)).tolist()
+        segs, q, del_end = [], 1, 0
+        for n, s in enumerate(breaks):
+            # insertions in the gap before consensus position s. The gap starts
+            # right after the column of consensus position s - 1
+            if (s - 1) in ins_at:
+                gap_col = break_cols[n] - self._gap_len[s - 1]
+                for gp, iL in ins_at[s - 1]:
+                    segs.append((q, s - 1, gap_col + gp, True))
+                    q += iL
+            if s == L + 1:
+                break
+            # consensus positions [s, t), if not deleted
+            if s in del_len:
+                del_end = s + del_len[s]
+            if s >= del_end:
+                t = breaks[n + 1]
+                segs.append((q, s, break_cols[n], False))
+                q += t - s
+        return segs, q - 1
+
+    def locate(self, rows, seq_pos):
+        """Given arrays of occurrence indices (in `occs`) and of positions in the
+        sequence of the occurrences, returns arrays of the corresponding consensus
+        positions and alignment columns, and whether the positions are in an
+        insertion. For inserted positions, the consensus position is the one
+        after which the insertion is."""
+        rows = np.asarray(rows, dtype=np.int64)
+        seq_pos = np.asarray(seq_pos, dtype=np.int64)
+        # segments of all occurrences are sorted by (occurrence, sequence position)
+        big = int(self.seq_pos.max(initial=0)) + int(seq_pos.max(initial=0)) + 1
+        seg_row = np.repeat(np.arange(len(self.occs)), np.diff(self.ptr))
+        keys = seg_row * big + self.seq_pos
+        k = np.searchsorted(keys, rows * big + seq_pos, side="right") - 1
+        delta = seq_pos - self.seq_pos[k]
+        inserted = self.inserted[k]
+        cons_pos = np.where(inserted, self.cons_pos[k], self.cons_pos[k] + delta)
+        return cons_pos, self.col[k] + delta, inserted
+
+    def sequence_position(self, rows, cols, side="left"):
+        """Inverse of `locate`: given arrays of occurrence indices (in `occs`) and of
+        alignment columns, returns the positions in the sequence of the occurrences
+        at these columns, and whether the occurrences have a nucleotide there (rather
+        than a gap). For gap columns, the position returned is the last one before
+        the column if `side` is "left" (0 if none), or the first one after the column
+        if `side` is "right" (length + 1 if none)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        seg_row = np.repeat(np.arange(len(self.occs)), np.diff(self.ptr))
+        # length of each segment: up to the next segment of the occurrence, or its end
+        seg_end = np.append(self.seq_pos[1:], 0)
+        last = self.ptr[1:][np.diff(self.ptr) > 0] - 1
+        seg_end[last] = self.occ_len[seg_row[last]] + 1
+        seg_len = seg_end - self.seq_pos
+        # segments of all occurrences are sorted by (occurrence, column)
+        big = int(self.col.max(initial=0)) + int(cols.max(initial=0)) + 1
+        k = np.searchsorted(seg_row * big + self.col, rows * big + cols, side="right") - 1
+        valid = k >= 0
+        k = np.where(valid, k, 0)
+        valid &= seg_row[k] == rows
+        delta = cols - self.col[k]
+        present = valid & (delta < seg_len[k])
+        if side == "left":
+            gap_pos = np.where(valid, self.seq_pos[k] + seg_len[k] - 1, 0)
+        else:
+            gap_pos = np.where(valid, self.seq_pos[k] + seg_len[k], self.seq_pos[self.ptr[rows]])
+        return np.where(present, self.seq_pos[k] + delta, gap_pos), present
+
+
+class variation_view:
+    """Read-only dictionary-like view {occurrence -> entries} on one of the
+    attributes of a `compact_variation` object. `kind` is one of "muts",
+    "ins", "dels" or "pos"."""
+
+    def __init__(self, variation: compact_variation, kind: str):
+        self.variation = variation
+        self.kind = kind
+        self._decode = getattr(variation, "positions" if kind == "pos" else kind)
+
+    def __getitem__(self, occ):
+        return self._decode(self.variation.occ_index[occ])
+
+    def __contains__(self, occ):
+        return occ in self.variation.occ_index
+
+    def __iter__(self):
+        return iter(self.variation.occs)
+
+    def __len__(self):
+        return len(self.variation.occs)
+
+    def keys(self):
+        return list(self.variation.occs)
+
+    def values(self):
+        return [self[occ] for occ in self.variation.occs]
+
+    def items(self):
+        return [(occ, self[occ]) for occ in self.variation.occs]
+
+
+def _pointers(counts):
+    """Given the number of entries of each occurrence, returns the array of
+    pointers delimiting the entries of each occurrence in a flat array."""
+    return np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64)
+
+
+def _encode(seq: str):
+    """Converts a nucleotide sequence to an array of uint8 ASCII codes."""
+    return np.frombuffer(seq.encode("ascii"), dtype=np.uint8).copy()
+
+
+def _decode(arr):
+    """Converts an array of uint8 ASCII codes back to a string."""
+    return np.asarray(arr, dtype=np.uint8).tobytes().decode("ascii")
+
+
 def blockid_to_tuple(bl):
     """Given a block id, returns a tuple that can be used as key in a dictionary"""
     return (bl["name"], bl["number"], bl["strand"])
 
 
+def tuple_to_blockid(occ):
+    """Inverse of `blockid_to_tuple`."""
+    name, number, strand = occ
+    return {"name": str(name), "number": int(number), "strand": bool(strand)}
+
+
 def reconstruct_alignment(
     consensus: str, gaps: dict, muts: list, ins: list, dels: list
 ) -> str:
@@ -193,65 +576,206 @@ def reconstruct_alignment(
     return seq
 
 
-def extract_relevant_SNPs(consensus: str, dels: list, muts: list, which: list):
+def reconstruct_alignment_matrix(
+    consensus: str, gaps: dict, variation: compact_variation, rows: list
+) -> np.ndarray:
+    """Batch version of `reconstruct_alignment`. It reconstructs the alignment of
+    the occurrences with indices `rows` in `variation.occs` all at once, and returns
+    it as a (len(rows) x n. alignment columns) matrix of uint8 ASCII codes.
+    The consensus is first placed in the columns that are not gaps, then mutations,
+    deletions and insertions of all occurrences are scattered in the matrix."""
+    v = variation
+    cons = _encode(consensus)
+    rows = np.asarray(rows, dtype=np.int64)
+
+    # shared map from consensus positions to alignment columns
+    gap_items = sorted((int(pos), L) for pos, L in gaps.items())
+    gap_pos = np.array([pos for pos, _ in gap_items], dtype=np.int64)
+    gap_len = np.array([L for _, L in gap_items], dtype=np.int64)
+    n_gaps_before = np.concatenate([[0], np.cumsum(gap_len)])
+    # a gap at position i is added after consensus position i (julia indexing)
+    cons_col = np.arange(len(cons)) + n_gaps_before[np.searchsorted(gap_pos, np.arange(1, len(cons) + 1), side="left")]
+    gap_col = gap_pos + n_gaps_before[:-1]
+    n_cols = len(cons) + n_gaps_before[-1]
+
+    aln = np.full((len(rows), n_cols), GAP, dtype=np.uint8)
+    aln[:, cons_col] = cons
+
+    # apply mutations
+    m_idx, m_row = _select_entries(v.mut_ptr, rows)
+    aln[m_row, cons_col[v.mut_pos[m_idx] - 1]] = v.mut_nt[m_idx]
+
+    # apply deletions (insert gaps)
+    d_idx, d_row = _select_entries(v.del_ptr, rows)
+    d_len = v.del_len[d_idx]
+    d_pos = _expand_intervals(v.del_pos[d_idx] - 1, d_len)
+    aln[np.repeat(d_row, d_len), cons_col[d_pos]] = GAP
+
+    # fill gaps with insertions
+    i_idx, i_row = _select_entries(v.ins_ptr, rows)
+    i_len = v.ins_seq_ptr[i_idx + 1] - v.ins_seq_ptr[i_idx]
+    i_col = gap_col[np.searchsorted(gap_pos, v.ins_gap[i_idx])] + v.ins_gap_pos[i_idx]
+    i_nts = v.ins_seq[_expand_intervals(v.ins_seq_ptr[i_idx], i_len)]
+    aln[np.repeat(i_row, i_len), _expand_intervals(i_col, i_len)] = i_nts
+
+    return aln
+
+
+def _select_entries(ptr, rows):
+    """Given the pointer array of a flat array of entries (see `compact_variation`)
+    and a list of occurrence indices, returns the indices of the entries of these
+    occurrences, and for each entry the position of its occurrence in `rows`."""
+    counts = ptr[rows + 1] - ptr[rows]
+    idx = _expand_intervals(ptr[rows], counts)
+    return idx, np.repeat(np.arange(len(rows)), counts)
+
+
+def _expand_intervals(begs, lengths):
+    """Given arrays of interval beginnings and lengths, returns the array of all
+    positions contained in the intervals."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(np.asarray(begs, dtype=np.int64), lengths) + np.arange(lengths.sum()) - offsets
+
+
+def variation_stats(blocks):
+    """Evaluates statistics on the variation of a set of blocks, in a single pass.
+    `blocks` is an iterable of (consensus length, gaps, variation) tuples, where
+    `gaps` is the gap dictionary of the block and `variation` a `compact_variation`
+    object. Per-block entries are only concatenated, and all statistics are then
+    evaluated at once over the whole set. Returns a dictionary of arrays with one
+    entry per block:
+    - n_occs: number of block occurrences.
+    - mean_muts, max_muts: mean and maximum number of mutations per occurrence.
+    - snp_sites: number of distinct consensus positions that are mutated in at
+        least one occurrence.
+    - ins_bases, del_bases: total number of inserted and deleted bases, summed over
+        occurrences.
+    - gap_columns: number of alignment columns that contain a gap in at least one
+        occurrence.
+    - min_len, max_len: minimum and maximum length of block occurrences.
+    """
+    cons_L, gap_L, n_occs = [], [], []
+    n_muts, mut_pos, del_pos, del_len, ins_len, ins_gap, ins_gap_pos = [[] for _ in range(7)]
+    n_dels, n_ins = [], []
+    for L, gaps, var in blocks:
+        cons_L.append(L)
+        gap_L.append(sum(gaps.values()))
+        n_occs.append(len(var.occs))
+        n_muts.append(np.diff(var.mut_ptr))
+        mut_pos.append(var.mut_pos)
+        n_dels.append(np.diff(var.del_ptr))
+        del_pos.append(var.del_pos)
+        del_len.append(var.del_len)
+        n_ins.append(np.diff(var.ins_ptr))
+        ins_len.append(np.diff(var.ins_seq_ptr))
+        ins_gap.append(var.ins_gap)
+        ins_gap_pos.append(var.ins_gap_pos)
+
+    n_blocks = len(cons_L)
+    cons_L = np.array(cons_L, dtype=np.int64)
+    gap_L = np.array(gap_L, dtype=np.int64)
+    n_occs = np.array(n_occs, dtype=np.int64)
+    cat = lambda arrs: np.concatenate([np.zeros(0, dtype=np.int64)] + arrs).astype(np.int64)
+    n_muts, n_dels, n_ins = cat(n_muts), cat(n_dels), cat(n_ins)
+    mut_pos, del_pos, del_len = cat(mut_pos), cat(del_pos), cat(del_len)
+    ins_len, ins_gap, ins_gap_pos = cat(ins_len), cat(ins_gap), cat(ins_gap_pos)
+
+    # block of each occurrence, and occurrence of each mutation / deletion / insertion
+    occ_block = np.repeat(np.arange(n_blocks), n_occs)
+    n_occ_tot = len(occ_block)
+    del_occ = np.repeat(np.arange(n_occ_tot), n_dels)
+    ins_occ = np.repeat(np.arange(n_occ_tot), n_ins)
+    mut_block = np.repeat(occ_block, n_muts)
+    del_block, ins_block = occ_block[del_occ], occ_block[ins_occ]
+
+    # mutations
+    occs_den = np.maximum(n_occs, 1)
+    mean_muts = np.bincount(occ_block, weights=n_muts, minlength=n_blocks) / occs_den
+    max_muts = np.zeros(n_blocks, dtype=np.int64)
+    np.maximum.at(max_muts, occ_block, n_muts)
+    Lmax = int(cons_L.max(initial=0)) + 2
+    sites = np.unique(mut_block * Lmax + mut_pos)
+    snp_sites = np.bincount(sites // Lmax, minlength=n_blocks)
+
+    # inserted and deleted bases, and occurrence lengths
+    ins_bases = np.bincount(ins_block, weights=ins_len, minlength=n_blocks).astype(np.int64)
+    del_bases = np.bincount(del_block, weights=del_len, minlength=n_blocks).astype(np.int64)
+    occ_L = cons_L[occ_block]
+    occ_L += np.bincount(ins_occ, weights=ins_len, minlength=n_occ_tot).astype(np.int64)
+    occ_L -= np.bincount(del_occ, weights=del_len, minlength=n_occ_tot).astype(np.int64)
+    min_len = cons_L.copy()
+    max_len = cons_L.copy()
+    has_occs = n_occs > 0
+    min_len[has_occs] = np.minimum.reduceat(occ_L, (np.cumsum(n_occs) - n_occs)[has_occs])
+    max_len[has_occs] = np.maximum.reduceat(occ_L, (np.cumsum(n_occs) - n_occs)[has_occs])
+
+    # gap columns: consensus positions deleted in at least one occurrence, plus
+    # columns of the gaps that are not filled by every occurrence
+    deleted = np.unique(np.repeat(del_block, del_len) * Lmax + _expand_intervals(del_pos, del_len))
+    n_deleted = np.bincount(deleted // Lmax, minlength=n_blocks)
+    Gmax = int(ins_gap_pos.max(initial=0) + ins_len.max(initial=0)) + 1
+    col_key = (np.repeat(ins_block * Lmax + ins_gap, ins_len)) * Gmax
+    col_key += _expand_intervals(ins_gap_pos, ins_len)
+    cols, coverage = np.unique(col_key, return_counts=True)
+    col_block = cols // Gmax // Lmax
+    n_filled = np.bincount(col_block[coverage == n_occs[col_block]], minlength=n_blocks)
+    gap_columns = gap_L - n_filled + n_deleted
+
+    return {
+        "n_occs": n_occs,
+        "mean_muts": mean_muts,
+        "max_muts": max_muts,
+        "snp_sites": snp_sites,
+        "ins_bases": ins_bases,
+        "del_bases": del_bases,
+        "gap_columns": gap_columns,
+        "min_len": min_len,
+        "max_len": max_len,
+    }
+
+
+def extract_relevant_SNPs(consensus: str, variation: compact_variation, rows: list):
     """Function to extract a set of relevant SNPs from the set of mutations and deletions.
     Optionally a particular subset of strains can be considered. It only takes columns of
-    the alignment without deletions. It returns:
+    the alignment without deletions. Occurrences are selected through their indices `rows`
+    in `variation.occs`. It returns:
     - positions (np.array): list of positions in which mutations occurr (nb: relative to
         block consensus, and in python indexing)
-    - SNPs (np matrix): matrix of nucleotides. The first index represent occurrences and
-        the second the position
-    - which (list): set of occurrences corresponding to the matrix rows.
+    - SNPs (np matrix): matrix of nucleotides as uint8 ASCII codes. The first index
+        represent occurrences and the second the position
+    - has_consensus_column (bool): whether at least one column has the same nucleotide
+        in all selected occurrences.
 
     Nb: columns might still be equal to consensus, but only if a subset of strains (all
         having the same mutations) is requested.
-    Nb: occurrences are in the same order as passed in the `which argument`
+    Nb: occurrences are in the same order as passed in the `rows` argument
     Nb: the position is relative to the BLOCK consensus. this is not the same as the
         alignment consensus.
     """
+    v = variation
+    rows = np.asarray(rows, dtype=np.int64)
+    W = len(rows)
 
     # find all positions with a deletions. These cannot be considered for
     # valid SNPs since they would contain a gap in one column
-    forbidden_positions = set()  # julia indexing
-    for wh in which:
-        ds = dels[wh]
-        for pos, L in ds:
-            forbidden_positions |= set([pos + l for l in range(L)])
-
-    # find relevant columns
-    snp_pos = []
-    snp_columns = {}
-    W = len(which)
-    for i, wh in enumerate(which):
-        mt = muts[wh]
-        for pos, nt in mt:
-
-            # exclude positions that have gaps
-            if pos in forbidden_positions:
-                continue
-
-            if pos in snp_pos:
-                # if position was already present, add the mutation in the specific column
-                snp_columns[pos][i] = nt
-            else:
-                # else add the new position and add a new column
-                snp_pos.append(pos)
-                snp_columns[pos] = [
-                    consensus[pos - 1]
-                ] * W  # NB: pos is in julia indexing
-                snp_columns[pos][i] = nt
-
-    # format and return relevant results
-    positions = np.sort(snp_pos)
-    SNPs = np.zeros((W, positions.size), dtype=str)
-    for i, pos in enumerate(positions):
-        SNPs[:, i] = snp_columns[pos]
-
-    # print a warning if there is at least one column where all are consensus
-    is_there_a_consensus = np.any(np.all(SNPs == SNPs[0, :], axis=0))  # TODO: test?
-    if is_there_a_consensus:
-        print("Warning: at least one column has no mutations")
-        print("Maybe it corresponds to a subset?")
+    d_idx, _ = _select_entries(v.del_ptr, rows)
+    forbidden_positions = np.unique(_expand_intervals(v.del_pos[d_idx], v.del_len[d_idx]))
+
+    # mutations of the selected occurrences, excluding positions with gaps
+    m_idx, m_row = _select_entries(v.mut_ptr, rows)
+    m_pos = v.mut_pos[m_idx]
+    keep = ~np.isin(m_pos, forbidden_positions)
+    m_idx, m_row, m_pos = m_idx[keep], m_row[keep], m_pos[keep]
+
+    # fill the matrix with consensus nucleotides, then add mutations
+    positions = np.unique(m_pos).astype(np.int64)  # julia indexing
+    cons = _encode(consensus)
+    SNPs = np.tile(cons[positions - 1], (W, 1))
+    SNPs[m_row, np.searchsorted(positions, m_pos)] = v.mut_nt[m_idx]
+
+    # flag if there is at least one column where all are consensus
+    has_consensus_column = bool(W > 0 and np.any(np.all(SNPs == SNPs[0, :], axis=0)))
 
     positions -= 1  # julia to python indexing
-    return positions, SNPs
\ No newline at end of file
+    return positions, SNPs, has_consensus_column
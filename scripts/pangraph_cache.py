@@ -0,0 +1,222 @@
+# Persistent on-disk cache for parsed pangraph data.
+# Each part of the cache (e.g. the paths, or the locator map) is a set of
+# numpy arrays saved as separate .npy files, so that they can be memory-mapped
+# when reloaded. The cache is keyed by the content hash of the pangraph file,
+# and is invalidated automatically whenever the file changes.
+# The annotation of gff features on the pangraph can also be cached, in a
+# sqlite database (see `FeatureCache`).
+
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+CACHE_VERSION = 4
+
+
+def file_digest(filename, chunk_size=1 << 20):
+    """Returns the sha256 hex digest of the content of a file."""
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def default_cache_dir(filename):
+    """Default location of the cache for a pangraph file: a directory with the
+    same name and a `.cache` suffix, next to the file."""
+    return str(filename) + ".cache"
+
+
+def _tmp_file(filename):
+    """Temporary name under which a file is written before being moved in place,
+    unique to the process so that concurrent runs do not write to the same file."""
+    return f"{filename}.{os.getpid()}.tmp"
+
+
+class PangraphCache:
+    """Binary cache associated to a specific pangraph file. It has attributes:
+    - directory (str): folder in which the cache files are stored. The folder is
+        owned by the cache: files in it may be overwritten or removed.
+    - digest (str): content hash of the pangraph file. Cached parts saved
+        with a different digest are considered stale and are never loaded.
+
+    Parts are saved with `save` and reloaded with `load`. A part is a dictionary
+    {name -> np.array}. Arrays are reloaded memory-mapped (read-only).
+    """
+
+    def __init__(self, directory, digest):
+        self.directory = str(directory)
+        self.digest = digest
+
+    @staticmethod
+    def for_file(filename, directory=None):
+        """Creates the cache object for a pangraph file. If `directory` is not
+        specified the default location is used (see `default_cache_dir`).
+        Otherwise the cache is stored in a subdirectory of `directory` named after
+        the pangraph file, so that several pangraphs can share the same directory
+        and no other file in it is ever touched."""
+        cache_dir = default_cache_dir(filename)
+        if directory is not None:
+            cache_dir = os.path.join(directory, os.path.basename(cache_dir))
+        return PangraphCache(cache_dir, file_digest(filename))
+
+    def _meta_file(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def _array_file(self, part, name):
+        return os.path.join(self.directory, f"{part}.{name}.npy")
+
+    def _read_raw_meta(self):
+        """Returns the metadata of the cache as stored, or None if missing."""
+        try:
+            with open(self._meta_file(), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read_meta(self):
+        """Returns the metadata of the cache, or None if the cache is missing,
+        stale or was created by a different version of this module."""
+        meta = self._read_raw_meta()
+        if meta is None or meta.get("version") != CACHE_VERSION or meta.get("digest") != self.digest:
+            return None
+        return meta
+
+    def _write_meta(self, meta):
+        tmp = _tmp_file(self._meta_file())
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_file())
+
+    def has(self, part):
+        """Whether a valid copy of the part is present in the cache."""
+        meta = self._read_meta()
+        return (meta is not None) and (part in meta["parts"])
+
+    def save(self, part, arrays):
+        """Saves a part of the cache. Any stale content of the cache directory
+        (from a previous version of the pangraph file) is discarded."""
+        os.makedirs(self.directory, exist_ok=True)
+        meta = self._read_meta()
+        if meta is None:
+            self.clear()
+            meta = {"version": CACHE_VERSION, "digest": self.digest, "parts": {}}
+        # invalidate the part while it is being written
+        meta["parts"].pop(part, None)
+        self._write_meta(meta)
+        for name, arr in arrays.items():
+            # arrays are written under a temporary name and moved in place, so that
+            # a concurrent run never reads or overwrites a partially written file
+            tmp = _tmp_file(self._array_file(part, name))
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(arr), allow_pickle=False)
+            os.replace(tmp, self._array_file(part, name))
+        meta["parts"][part] = sorted(arrays.keys())
+        self._write_meta(meta)
+
+    def load(self, part, mmap=True):
+        """Loads a part of the cache as a dictionary {name -> np.array}. Returns
+        None if the part is missing or stale."""
+        meta = self._read_meta()
+        if (meta is None) or (part not in meta["parts"]):
+            return None
+        mmap_mode = "r" if mmap else None
+        return {
+            name: np.load(self._array_file(part, name), mmap_mode=mmap_mode)
+            for name in meta["parts"][part]
+        }
+
+    def clear(self):
+        """Removes the files of the cache, as listed in its metadata (even if
+        stale). Other files in the cache directory are left untouched."""
+        meta = self._read_raw_meta()
+        if meta is None:
+            return
+        for part, names in meta.get("parts", {}).items():
+            for name in names:
+                try:
+                    os.remove(self._array_file(part, name))
+                except FileNotFoundError:
+                    pass
+        os.remove(self._meta_file())
+
+
+class FeatureCache:
+    """Persistent cache of the annotation of gff features on a pangraph, stored in
+    a sqlite database, so that a gff that changed only slightly since the last run
+    can be re-annotated without processing its unchanged features again.
+
+    Each feature is identified by a key, a hash of the content hash of the
+    pangraph file (`digest`), of the annotation mode and of the full gff line of
+    the feature (seqid, coordinates, type, strand, phase and attributes). Entries
+    of a different version of a pangraph are never used, so that the same database
+    can be shared by several pangraphs. The result of a feature is stored as text.
+
+    The database is opened separately in each process, so that the cache can be
+    used by a pool of worker processes.
+    """
+
+    def __init__(self, filename, digest):
+        self.filename = str(filename)
+        self.digest = digest
+        self._conn = None
+        self._pid = None
+
+    @staticmethod
+    def for_file(cache_file, pangraph_file):
+        """Creates the feature cache stored in `cache_file` for a pangraph file."""
+        return FeatureCache(cache_file, file_digest(pangraph_file))
+
+    def __getstate__(self):
+        # connections are not shared between processes
+        return {"filename": self.filename, "digest": self.digest}
+
+    def __setstate__(self, state):
+        self.__init__(state["filename"], state["digest"])
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.filename, timeout=60)
+            self._pid = os.getpid()
+            # write-ahead log: concurrent readers are not blocked by a writer, and commits are cheaper
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # results can be long (several gff lines), so they are kept out of the index of the keys
+            self._conn.execute("CREATE TABLE IF NOT EXISTS features (key BLOB UNIQUE, result TEXT)")
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS query (i INTEGER, key BLOB)")
+        return self._conn
+
+    def keys(self, mode, lines):
+        """Returns the keys of a list of features, given as gff lines."""
+        prefix = f"{self.digest}\t{mode}\n".encode()
+        return [hashlib.sha1(prefix + line.encode()).digest() for line in lines]
+
+    def lookup(self, keys):
+        """Returns the list of the cached results of the features with the given
+        keys, with None for the features that are not in the cache."""
+        conn = self._connection()
+        results = [None] * len(keys)
+        with conn:
+            conn.execute("DELETE FROM query")
+            conn.executemany("INSERT INTO query VALUES (?, ?)", enumerate(keys))
+            rows = conn.execute("SELECT q.i, f.result FROM query q JOIN features f ON f.key = q.key").fetchall()
+        for i, result in rows:
+            results[i] = result
+        return results
+
+    def store(self, keys, results):
+        """Stores the results of the features with the given keys."""
+        conn = self._connection()
+        # keys are random: inserting them in order keeps the updates of the index local
+        rows = sorted(zip(keys, results))
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO features VALUES (?, ?)", rows)
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
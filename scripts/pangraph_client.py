@@ -0,0 +1,91 @@
+# Client for `pangraph_server`. Queries are sent as newline-delimited JSON over
+# a Unix socket or a localhost TCP connection, and answered by the server from
+# the pangraph it keeps in memory.
+
+import json
+import socket
+
+
+class PangraphServerError(Exception):
+    """Error returned by the server in response to a query."""
+
+
+class PangraphClient:
+    """Connection to a running `pangraph_server`. Connects to the Unix socket
+    `socket_path` if given, otherwise to `host:port`. Can be used as a context
+    manager, which closes the connection on exit.
+
+    Positions are 1-based, as in the rest of the scripts. Queries take lists of
+    positions or intervals, which are answered in a single request.
+    """
+
+    def __init__(self, socket_path=None, host="127.0.0.1", port=8765, timeout=None):
+        if socket_path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(socket_path)
+        else:
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self.sock.makefile("rb")
+        self._next_id = 0
+
+    def request(self, method, **params):
+        """Sends a request and returns its result. Raises PangraphServerError if
+        the server answers with an error."""
+        self._next_id += 1
+        request = {"id": self._next_id, "method": method, "params": params}
+        self.sock.sendall(json.dumps(request).encode() + b"\n")
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("connection closed by the server")
+        response = json.loads(line)
+        if response.get("id") != self._next_id:
+            raise PangraphServerError(f"unexpected response id {response.get('id')}")
+        if "error" in response:
+            raise PangraphServerError(response["error"])
+        return response["result"]
+
+    def find_position(self, strain, positions):
+        """For each position on the genome of the strain, returns the block id, the
+        position in the block occurrence and the occurrence (strain, block n.,
+        strand), as a dictionary of lists with keys `block_ids`, `block_positions`
+        and `occurrences`. See `Locator.find_position`."""
+        return self.request("find_position", strain=strain, positions=[int(p) for p in positions])
+
+    def find_interval(self, strain, starts, ends):
+        """For each interval [start, end] on the genome of the strain, returns a
+        dictionary with the lists of `block_ids`, of `intervals` relative to each
+        block occurrence and of `occurrences`. See `Locator.find_interval`."""
+        starts = [int(p) for p in starts]
+        ends = [int(p) for p in ends]
+        return self.request("find_interval", strain=strain, starts=starts, ends=ends)
+
+    def block_stats(self, block_ids=None):
+        """Returns a dictionary {block id -> statistics} for the given blocks (default:
+        all blocks). See `Pangraph.to_blockstats_df`."""
+        if block_ids is None:
+            return self.request("block_stats")
+        return self.request("block_stats", block_ids=list(block_ids))
+
+    def strains(self):
+        """Returns the list of strains in the pangraph."""
+        return self.request("strains")
+
+    def info(self):
+        """Returns the name of the pangraph file, the number of strains and blocks,
+        and how many times the pangraph has been (re)loaded."""
+        return self.request("info")
+
+    def reload(self):
+        """Asks the server to reload the pangraph file."""
+        return self.request("reload")
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
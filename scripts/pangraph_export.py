@@ -0,0 +1,259 @@
+# Functions to export alignments and sequences from a pangraph as FASTA files.
+# Blocks are processed independently, optionally in a pool of processes, and
+# results are written in a deterministic order without keeping the whole
+# output in memory.
+
+import collections
+import itertools
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+# lookup table for the complement of uint8 ASCII nucleotide codes
+COMPLEMENT = np.arange(256, dtype=np.uint8)
+for _a, _b in ["AT", "CG", "at", "cg"]:
+    COMPLEMENT[ord(_a)], COMPLEMENT[ord(_b)] = ord(_b), ord(_a)
+
+
+def reverse_complement(aln):
+    """Reverse-complements the rows of a matrix (or a vector) of uint8 ASCII
+    nucleotide codes. Gaps are left unchanged."""
+    return COMPLEMENT[aln][..., ::-1]
+
+
+def core_block_order(pan, reference=None):
+    """Returns the list of core blocks (see `Pangraph.to_blockstats_df`), ordered
+    as in the path of the reference strain (by default the first strain), together
+    with the strand of each block in the reference strain."""
+    df = pan.to_blockstats_df()
+    core = set(df.index[df["core"]])
+    path = pan.paths[reference] if reference is not None else pan.paths[0]
+    order, strands = [], []
+    for bl, st in zip(path.block_ids, path.block_strands):
+        if bl in core:
+            order.append(str(bl))
+            strands.append(bool(st))
+    return order, strands
+
+
+def core_block_alignment(block, strains, flip, snps_only=False):
+    """Returns the alignment of a core block as a (n. strains x n. columns) uint8
+    matrix, with one row per strain in the order of `strains`. If `flip` is True the
+    alignment is reverse-complemented. If `snps_only` is True only polymorphic
+    columns without gaps are kept (see `pan_alignment.extract_nongap_SNPs`)."""
+    aln = block.alignment
+    occ_by_strain = {occ[0]: occ for occ in aln.occs}
+    which = [occ_by_strain[strain] for strain in strains]
+    if snps_only:
+        _, M, _ = aln.extract_nongap_SNPs(which)
+        if M.shape[0] > 0:
+            M = M[:, ~np.all(M == M[0, :], axis=0)]
+    else:
+        M, _ = aln.alignment_matrix(which)
+    if flip:
+        M = reverse_complement(M)
+    return M
+
+
+# state shared by worker processes. With the fork start method it is
+# inherited from the parent process without copying (copy-on-write)
+_worker_state = None
+
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+
+def _core_block_job(job):
+    block_id, flip = job
+    pan, strains, snps_only = _worker_state
+    M = core_block_alignment(pan.blocks[block_id], strains, flip, snps_only)
+    return np.ascontiguousarray(M)
+
+
+def _run_chunk(func, chunk):
+    return [func(job) for job in chunk]
+
+
+def imap_blocks(func, jobs, state, processes=1, chunksize=4):
+    """Applies `func` to every job, with access to `state` through the global
+    `_worker_state`. Results are yielded in the same order as `jobs`. If
+    `processes` > 1 jobs are distributed over a pool of processes. The raw block
+    records of a deferred pangraph must be loaded before (see
+    `BlockCollection.load_raw`), otherwise each worker loads them again.
+
+    Jobs are sent to the pool in chunks of `chunksize`, and at most two chunks
+    per process are in flight: new chunks are only sent as results are consumed,
+    so that results do not pile up in memory when the consumer is slower than
+    the pool."""
+    if processes <= 1:
+        _init_worker(state)
+        for job in jobs:
+            yield func(job)
+        return
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+    jobs = iter(jobs)
+    with context.Pool(processes, initializer=_init_worker, initargs=(state,)) as pool:
+        pending = collections.deque()
+        while True:
+            while len(pending) < 2 * processes:
+                chunk = list(itertools.islice(jobs, chunksize))
+                if not chunk:
+                    break
+                pending.append(pool.apply_async(_run_chunk, (func, chunk)))
+            if not pending:
+                return
+            yield from pending.popleft().get()
+
+
+def write_core_alignment(pan, filename, snps_only=False, reference=None, processes=1):
+    """Writes the concatenated alignment of core blocks as a FASTA file, with one
+    record per strain. Blocks are ordered and oriented as in the reference strain.
+    If `snps_only` is True, only polymorphic columns without gaps are included.
+
+    Block alignments are computed in a pool of `processes` processes and spooled
+    block by block to a temporary file next to the output. Each strain's record
+    is then assembled from the spool, so that the full alignment is never held
+    in memory. Returns the list of core blocks in the order of the alignment.
+    """
+    strains = [str(strain) for strain in pan.strains()]
+    order, strands = core_block_order(pan, reference)
+    jobs = [(block_id, not strand) for block_id, strand in zip(order, strands)]
+    state = (pan, strains, snps_only)
+    pan.blocks.load_raw()
+
+    out_dir = os.path.dirname(os.path.abspath(filename))
+    with tempfile.TemporaryFile(dir=out_dir) as spool:
+        # write the alignment of each block, in order, to the spool
+        offsets, widths, offset = [], [], 0
+        for M in imap_blocks(_core_block_job, jobs, state, processes):
+            spool.write(M.tobytes())
+            offsets.append(offset)
+            widths.append(M.shape[1])
+            offset += M.size
+        spool.flush()
+
+        # assemble the record of each strain
+        spooled = np.memmap(spool, dtype=np.uint8, mode="r") if offset > 0 else None
+        with open(filename, "w") as f:
+            for i, strain in enumerate(strains):
+                f.write(f">{strain}\n")
+                for off, w in zip(offsets, widths):
+                    f.write(spooled[off + i * w : off + (i + 1) * w].tobytes().decode("ascii"))
+                f.write("\n")
+        del spooled
+    return order
+
+
+def _pancontig_sequences_job(job):
+    code, occs, flip_by_strand = job
+    blocks = _worker_state
+    seqs, which = blocks[code].alignment.generate_sequences(occs)
+    seqs = [np.frombuffer(seq.encode("ascii"), dtype=np.uint8) for seq in seqs]
+    if flip_by_strand:
+        seqs = [reverse_complement(seq) if not occ[2] else seq for seq, occ in zip(seqs, which)]
+    return b"".join(seq.tobytes() for seq in seqs), [len(seq) for seq in seqs]
+
+
+def _sequence_jobs(pmaps, flip_by_strand):
+    """Jobs extracting the sequences of the block occurrences of a batch of
+    strains (given their PathMaps), one per block."""
+    occs_by_code = {}
+    for pmap in pmaps:
+        for code, occ in zip(pmap.codes.tolist(), pmap.occurrences(slice(None))):
+            occs_by_code.setdefault(code, []).append(occ)
+    return [(code, occs, flip_by_strand) for code, occs in occs_by_code.items()]
+
+
+def iter_pancontig_sequences(locator, strains, orientation="block", processes=1, batch_size=16):
+    """Generator of the sequences of the block occurrences (pancontigs) of a set
+    of strains, given the `Locator` of the pangraph. For each strain, in order, it yields the records of its blocks in
+    the order in which they appear on the genome, as tuples
+    (strain, block id, occurrence n., strand, sequence).
+
+    Sequences are obtained with `pan_alignment.generate_sequences`, in a single
+    pool of `processes` processes. If `orientation` is "block" they are in the
+    orientation of the block consensus, which is the frame of reference of
+    positions in the regions gff (see `PathMap.interval_to_blocks`). If it is
+    "genome" occurrences on the reverse strand are reverse-complemented, as they
+    appear in the genome.
+
+    Strains are processed in batches of `batch_size`, one block at a time for all
+    the strains of a batch. The records of a batch are yielded as soon as it is
+    extracted, and the pool only runs ahead of the consumer by a few blocks (see
+    `imap_blocks`), so that the sequences of about `batch_size` genomes are held
+    in memory.
+    """
+    if orientation not in ["block", "genome"]:
+        raise ValueError(f"unknown orientation {orientation}, should be block or genome")
+    if locator.coords_only:
+        raise Exception("sequences are not available with coords_only=True")
+    batches = [strains[k : k + batch_size] for k in range(0, len(strains), batch_size)]
+    jobs = [_sequence_jobs([locator[strain] for strain in batch], orientation == "genome") for batch in batches]
+    locator.blocks.load_raw()
+    results = imap_blocks(_pancontig_sequences_job, [job for batch_jobs in jobs for job in batch_jobs],
+                          locator.blocks, processes)
+    for batch, batch_jobs in zip(batches, jobs):
+        # sequence of each occurrence of the batch {(code, strain, n) -> sequence}
+        seqs = {}
+        for code, occs, _ in batch_jobs:
+            data, lengths = next(results)
+            ends = np.cumsum(lengths).tolist()
+            for (strain, n, _), L, e in zip(occs, lengths, ends):
+                seqs[(code, strain, n)] = data[e - L : e].decode("ascii")
+        for strain in batch:
+            pmap = locator[strain]
+            for code, bl_id, n, strand in zip(pmap.codes.tolist(), pmap.ids.tolist(), pmap.nums.tolist(), pmap.strands.tolist()):
+                yield strain, bl_id, n, strand, seqs[(code, strain, n)]
+
+
+def pancontig_sequence_name(bl_id, strain, n, strand):
+    """Name of the sequence of a block occurrence, e.g. FUZWWRHODH-_1|strain.
+    Block ids are not unique when a block occurs several times, so the name also
+    has the strand and occurrence number (as the pancontig labels of the gff
+    attributes) and the strain."""
+    return bl_id + {True: "+", False: "-"}[strand] + "_" + str(n) + "|" + strain
+
+
+def pancontig_fasta_header(bl_id, strain, n, strand):
+    """FASTA header of a pancontig sequence. The name is unique to the block
+    occurrence (see `pancontig_sequence_name`), and the description has the block
+    id, the strain and the same pancontig attributes as the gff entries."""
+    name = pancontig_sequence_name(bl_id, strain, n, strand)
+    strand = {True: "+", False: "-"}[strand]
+    return f">{name} pancontigID={bl_id};strain={strain};pancontigN={n};pancontigStrand={strand}"
+
+
+def write_pancontig_sequences(locator, strains, f, orientation="block", processes=1):
+    """Writes the sequences of the block occurrences of a set of strains to the
+    open file `f`, in FASTA format. See `iter_pancontig_sequences`. Returns the
+    number of records written."""
+    n_records = 0
+    for strain, bl_id, n, strand, seq in iter_pancontig_sequences(locator, strains, orientation, processes):
+        f.write(pancontig_fasta_header(bl_id, strain, n, strand) + "\n" + seq + "\n")
+        n_records += 1
+    return n_records
+
+
+def write_pancontig_sequences_per_strain(locator, strains, filenames, orientation="block", processes=1):
+    """Writes the sequences of the block occurrences of each strain to its own
+    FASTA file (`filenames` has one file per strain). Sequences are extracted by a
+    single pool of processes for all strains. Returns the number of records
+    written."""
+    records = iter_pancontig_sequences(locator, strains, orientation, processes)
+    record = next(records, None)
+    n_records = 0
+    for strain, filename in zip(strains, filenames):
+        with open(filename, "w") as f:
+            while record is not None and record[0] == strain:
+                _, bl_id, n, strand, seq = record
+                f.write(pancontig_fasta_header(bl_id, strain, n, strand) + "\n" + seq + "\n")
+                n_records += 1
+                record = next(records, None)
+    return n_records
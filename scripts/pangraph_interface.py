@@ -4,11 +4,16 @@
 # Wrapper to import in python the results of the Pangraph pipeline.
 
 import numpy as np
+import gzip
 import json
+import lzma
 import pandas as pd
 
 from collections import Counter
 import pangraph_alignment as pga
+import pangraph_cache as pgc
+import pangraph_export as pge
+import pangraph_profile as pgp
 
 
 def run_pangraph(align, output, compressed=False):
@@ -23,35 +28,126 @@ class Pangraph:
     The class has two main attributes:
     - `paths` : each strain has
     - `blocks` :
+    Block ids and strain names are stored internally as integer codes. The
+    `codes` attribute is the `CodeTable` used to translate them.
+    The `profiler` attribute (see `pangraph_profile.StageProfiler`) records the
+    stages of loading, and is passed on to the `Locator` built on the pangraph.
     """
 
-    def __init__(self, pan_json):
+    def __init__(self, pan_json, lazy=False, compact=False, coords_only=False):
         """Python calss to load the output of the Pangraph pipeline.
 
         Args:
             pan_json (dict): content of the .json file produced by pangraph.
+            lazy (bool): if True, blocks are kept as raw records and `Block`
+                objects (and their alignments) are only built the first time
+                they are accessed.
+            compact (bool): if True, the variation in block alignments is stored
+                in numpy arrays rather than in python lists (see `pan_alignment`).
+            coords_only (bool): if True, only the position and length of block
+                occurrences are kept, and sequences and alignments are discarded
+                (see `coords_record`). This is enough to locate positions on the
+                pangraph, but alignments and sequences are not available.
         """
-        self.paths = PathCollection(pan_json["paths"])
-        self.blocks = BlockCollection(pan_json["blocks"])
+        pan_blocks = pan_json["blocks"]
+        if coords_only:
+            pan_blocks = [pan_block if is_coords_record(pan_block) else coords_record(pan_block) for pan_block in pan_blocks]
+        self.blocks = BlockCollection(pan_blocks, lazy=lazy, compact=compact)
+        self.coords_only = coords_only
+        strains = [path["name"] for path in pan_json["paths"]]
+        self.codes = CodeTable.from_blocks(self.blocks, strains)
+        self.paths = PathCollection(pan_json["paths"], self.codes)
+        # binary cache associated to the pangraph file, if any (see `load_json`)
+        self.cache = None
+        self.profiler = pgp.NULL_PROFILER
 
     @staticmethod
-    def load_json(filename):
+    def load_json(filename, lazy=False, cache=None, compact=False, coords_only=False, profiler=None):
         """Creates a Pangraph object by loading it from the .json file.
 
         Args:
-            load_json (str): .json file to be loaded.
+            load_json (str): .json file to be loaded. Files compressed with gzip
+                (.json.gz) or xz (.json.xz) are decompressed on the fly.
+            lazy (bool): whether to defer the construction of blocks until
+                they are accessed. See `BlockCollection`.
+            compact (bool): whether to store the variation in block alignments
+                in numpy arrays. See `pan_alignment`.
+            cache (bool or str): if True or a directory name, a binary cache of
+                the parsed paths is used (see `pangraph_cache`). If the cache
+                is valid for the current content of the file, paths are reloaded
+                from it without parsing the .json file, and blocks are only
+                loaded from the .json file if they are accessed. Otherwise the
+                file is parsed and the cache is (re-)created.
+            coords_only (bool): whether to only load the coordinates of block
+                occurrences, which is enough to locate positions on the pangraph.
+                Sequences and alignments are dropped while the file is parsed,
+                and are not available. See `coords_record`.
+            profiler (StageProfiler): if specified, records the time and memory
+                used to parse the file, build the pangraph and read or write the
+                cache. It is stored in the `profiler` attribute of the pangraph.
 
         Returns:
             Pangraph: the Pangraph object containing the results of the pipeline.
         """
 
-        isjson = str(filename).endswith(".json")
+        isjson = str(filename).endswith(JSON_EXTENSIONS)
         if not isjson:
             raise Exception(f"the input file {filename} should be in .json format")
 
-        with open(filename, "r") as f:
-            pan_json = json.load(f)
-        pan = Pangraph(pan_json)
+        profiler = pgp.NULL_PROFILER if profiler is None else profiler
+        pan_cache = None
+        if cache:
+            directory = None if cache is True else cache
+            with profiler.stage("load_cache"):
+                pan_cache = pgc.PangraphCache.for_file(filename, directory)
+                arrays = pan_cache.load("paths")
+                if arrays is not None:
+                    load_blocks = lambda: load_json_file(filename, coords_only)["blocks"]
+                    pan = Pangraph.from_arrays(arrays, load_blocks, compact=compact, coords_only=coords_only)
+            if arrays is not None:
+                pan.cache = pan_cache
+                pan.profiler = profiler
+                profiler.count("blocks", len(pan.blocks))
+                profiler.count("paths", len(pan.paths))
+                return pan
+
+        with profiler.stage("parse_json"):
+            pan_json = load_json_file(filename, coords_only)
+        with profiler.stage("build_pangraph"):
+            pan = Pangraph(pan_json, lazy=lazy, compact=compact, coords_only=coords_only)
+        pan.profiler = profiler
+        if pan_cache is not None:
+            with profiler.stage("save_cache"):
+                pan_cache.save("paths", pan.to_arrays())
+            pan.cache = pan_cache
+        profiler.count("blocks", len(pan.blocks))
+        profiler.count("paths", len(pan.paths))
+        return pan
+
+    def to_arrays(self):
+        """Returns a dictionary of numpy arrays containing the paths and the list
+        of block ids. This is the format used to store the pangraph in the
+        binary cache."""
+        arrays = self.paths.to_arrays()
+        arrays["block_ids"] = self.blocks.ids
+        arrays["block_lengths"] = self.blocks.lengths
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays, load_blocks, compact=False, coords_only=False):
+        """Creates a Pangraph object from the output of `to_arrays`. Blocks are
+        built lazily from the list of raw block records returned by
+        `load_blocks()`, which is only called if a block is accessed.
+        `coords_only` indicates whether these are coordinates-only records."""
+        pan = Pangraph.__new__(Pangraph)
+        pan.coords_only = coords_only
+        pan.blocks = BlockCollection.deferred(
+            arrays["block_ids"], load_blocks, compact=compact, lengths=arrays["block_lengths"]
+        )
+        pan.codes = CodeTable.from_blocks(pan.blocks, arrays["names"])
+        pan.paths = PathCollection.from_arrays(arrays, pan.codes)
+        pan.cache = None
+        pan.profiler = pgp.NULL_PROFILER
         return pan
 
     def strains(self):
@@ -62,10 +158,32 @@ class Pangraph:
         """Returns the list of block ids"""
         return self.blocks.ids_copy()
 
-    def to_json(self):
-         # TODO: implement saving to json format after manipulation.
-         # Maintain the same input format
-         pass
+    def to_json(self, filename):
+        """Saves the pangraph to a .json file, in the same format as the output
+        of pangraph. The file is written incrementally, one path or block at a
+        time, and is compressed if the file name ends in .json.gz or .json.xz.
+        Blocks that were loaded lazily and never accessed are written back
+        from their raw records without being parsed.
+
+        Args:
+            filename (str): .json file to be written.
+        """
+        isjson = str(filename).endswith(JSON_EXTENSIONS)
+        if not isjson:
+            raise Exception(f"the output file {filename} should be in .json format")
+        if self.coords_only:
+            raise Exception("a pangraph loaded with coords_only=True cannot be saved")
+
+        with open_json_file(filename, "w") as f:
+            f.write('{"paths": [')
+            for n, path in enumerate(self.paths):
+                f.write(", " if n > 0 else "")
+                f.write(json.dumps(path.to_pan_path()))
+            f.write('], "blocks": [')
+            for n, pan_block in enumerate(self.blocks.records()):
+                f.write(", " if n > 0 else "")
+                f.write(json.dumps(pan_block))
+            f.write("]}")
 
     def to_paths_dict(self):
         """Generates a compressed representation of paths as simply lists of
@@ -73,14 +191,46 @@ class Pangraph:
         """
         return self.paths.to_block_dict()
 
+    def block_occurrence_codes(self):
+        """Returns the block occurrences of all paths as integer codes. Codes are
+        positions of blocks in `self.blocks` (see `CodeTable`).
+
+        Returns:
+            codes (np.array): code of each block occurrence, for all paths
+                concatenated in order.
+            path_idx (np.array): index of the path of each occurrence.
+        """
+        codes = _concat([path.block_codes for path in self.paths], np.int64)
+        lengths = [len(path) for path in self.paths]
+        path_idx = np.repeat(np.arange(len(self.paths)), lengths)
+        return codes, path_idx
+
+    def _block_order(self, codes, include_absent=False):
+        """Codes of blocks sorted by first appearance along the paths. If
+        `include_absent` is True blocks that never appear are added at the end."""
+        present, first = np.unique(codes, return_index=True)
+        order = present[np.argsort(first, kind="stable")]
+        if include_absent:
+            absent = np.setdiff1d(np.arange(len(self.blocks)), present)
+            order = np.concatenate([order, absent])
+        return order
+
     def to_blockcount_df(self):
         """Returns a dataframe whose rows are strain names, and columns are block
         names. Values indicate the number of times a block is present. This can
         also be used to build a presence / absence matrix."""
-        block_counters = {}
-        for path in self.paths:
-            block_counters[path.name] = Counter(path.block_ids)
-        return pd.DataFrame(block_counters).fillna(0).T
+        codes, path_idx = self.block_occurrence_codes()
+        n_paths, n_blocks = len(self.paths), len(self.blocks)
+        counts = np.bincount(
+            path_idx * n_blocks + codes, minlength=n_paths * n_blocks
+        ).reshape(n_paths, n_blocks)
+        order = self._block_order(codes)
+        counts = counts[:, order]
+        # as for missing entries filled with zeros, counts are float if some
+        # block is absent from a path
+        if np.any(counts == 0):
+            counts = counts.astype(float)
+        return pd.DataFrame(counts, index=self.paths.ids, columns=self.blocks.ids[order])
 
     def to_blockstats_df(self):
         """Returns a dataframe containing statistics about blocks distribution.
@@ -91,22 +241,77 @@ class Pangraph:
         - len: average block length from pangraph.
         - core: whether a gene occurrs exactly once per strain
         """
-        block_counter = Counter()
-        str_counter = Counter()
-
-        for path in self.paths:
-            block_counter.update(path.block_ids)
-            str_counter.update(np.unique(path.block_ids))
-
-        lengths = {block.id: len(block.sequence) for block in self.blocks}
-
+        codes, path_idx = self.block_occurrence_codes()
+        n_blocks = len(self.blocks)
+        count = np.bincount(codes, minlength=n_blocks)
+        # distinct (path, block) pairs
+        pairs = pd.unique(path_idx * n_blocks + codes)
+        n_strains = np.bincount(pairs % n_blocks, minlength=n_blocks)
+
+        order = self._block_order(codes, include_absent=True)
         df = pd.DataFrame(
-            {"count": block_counter, "n. strains": str_counter, "len": lengths}
+            {
+                "count": count[order],
+                "n. strains": n_strains[order],
+                "len": self.blocks.lengths[order],
+            },
+            index=self.blocks.ids[order],
         )
         df["duplicated"] = df["count"] > df["n. strains"]
         df["core"] = (df["n. strains"] == len(self.paths)) & (df["duplicated"] == False)
         return df
 
+    def to_blockvariation_df(self):
+        """Returns a dataframe containing statistics about the variation within
+        each block, evaluated at once for all blocks (see
+        `pangraph_alignment.variation_stats`). The index of the dataframe are
+        block ids, and the columns are:
+        - mean mut.: average n. of mutations per block occurrence
+        - max mut.: maximum n. of mutations in a block occurrence
+        - SNPs per kb: n. of mutated consensus positions per kb of consensus
+        - ins. bases: total n. of inserted bases, over all occurrences
+        - del. bases: total n. of deleted bases, over all occurrences
+        - gap columns: n. of alignment columns with a gap in some occurrence
+        - len spread: difference between the maximum and minimum length of
+            block occurrences
+        Blocks that have not been built are not materialized.
+        """
+        if self.coords_only:
+            raise Exception("block variation is not available with coords_only=True")
+        stats = pga.variation_stats(self.blocks.variations())
+        df = pd.DataFrame(
+            {
+                "mean mut.": stats["mean_muts"],
+                "max mut.": stats["max_muts"],
+                "SNPs per kb": stats["snp_sites"] / np.maximum(self.blocks.lengths, 1) * 1000,
+                "ins. bases": stats["ins_bases"],
+                "del. bases": stats["del_bases"],
+                "gap columns": stats["gap_columns"],
+                "len spread": stats["max_len"] - stats["min_len"],
+            },
+            index=self.blocks.ids,
+        )
+        return df
+
+    def write_core_alignment(self, filename, snps_only=False, reference=None, processes=1):
+        """Writes the concatenated alignment of core blocks (see `to_blockstats_df`)
+        as a FASTA file, with one record per strain.
+
+        Args:
+            filename (str): output FASTA file.
+            snps_only (bool): if True, only polymorphic alignment columns without
+                gaps are written.
+            reference (str): strain whose path determines the order and the
+                orientation of blocks. Defaults to the first strain.
+            processes (int): number of processes used to build block alignments.
+
+        Returns:
+            list: ids of the core blocks, in the order of the alignment.
+        """
+        return pge.write_core_alignment(
+            self, filename, snps_only=snps_only, reference=reference, processes=processes
+        )
+
 
 class IndexedCollection:
     """This class is used to implement smart indexing of a list of blocks or paths.
@@ -146,11 +351,11 @@ class IndexedCollection:
         # if indexed by block id
         if isinstance(idx, str):
             pos = self.id_to_pos[idx]
-            return self.list[pos]
+            return self._items(pos)
 
         # if indexed by integer
         if isinstance(idx, (int, np.integer)):
-            return self.list[idx]
+            return self._items(idx)
 
         # if indexed by list or numpy array
         if isinstance(idx, (list, np.ndarray)):
@@ -161,7 +366,7 @@ class IndexedCollection:
             idx0 = idx[0]
             # if the type is integer, return corresponding items
             if isinstance(idx0, (int, np.integer)) and not isinstance(idx0, bool):
-                return self.list[idx]
+                return self._items(idx)
 
             # if the type is string, return corresponding ids
             if isinstance(idx0, str):
@@ -169,7 +374,7 @@ class IndexedCollection:
 
             # if the type is bool (a mask)
             if isinstance(idx0, np.bool_):
-                return self.list[idx]
+                return self._items(idx)
 
         # if no condition is matched, then raise an error
         message = """
@@ -180,6 +385,11 @@ class IndexedCollection:
         """
         raise TypeError(message)
 
+    def _items(self, idx):
+        """Returns the items corresponding to an integer, a list of integers or
+        a boolean mask. Subclasses can override this to build items on demand."""
+        return self.list[idx]
+
     def ids_copy(self):
         return self.ids.copy()
 
@@ -187,27 +397,156 @@ class IndexedCollection:
 class BlockCollection(IndexedCollection):
     """Collection of all blocks. Inherits from IndexedCollection to allow for
     smart indexing of blocks.
+
+    If `lazy` is True the raw pangraph block records are stored, and each
+    `Block` is only built the first time it is indexed or iterated over. The
+    raw record is released once the block has been built.
+    If `compact` is True block alignments are stored in numpy arrays.
+
+    The consensus length of each block is stored in the `lengths` array, so
+    that it is available without building the blocks.
     """
 
-    def __init__(self, pan_blocks):
+    def __init__(self, pan_blocks, lazy=False, compact=False):
         ids = [block["id"] for block in pan_blocks]
-        items = [Block(block) for block in pan_blocks]
+        self.lengths = np.array([block_length(block) for block in pan_blocks], dtype=np.int64)
+        self.lazy = lazy
+        self.compact = compact
+        self._load_raw = None
+        if lazy:
+            self.raw = list(pan_blocks)
+            items = [None] * len(pan_blocks)
+        else:
+            self.raw = None
+            items = [Block(block, compact=compact) for block in pan_blocks]
         IndexedCollection.__init__(self, ids, items)
 
+    @staticmethod
+    def deferred(ids, load_raw, compact=False, lengths=None):
+        """Creates a lazy collection of blocks with the given ids (and consensus
+        lengths), whose raw records are only loaded (by calling `load_raw()`)
+        the first time that a block is accessed. Records must be in the same
+        order as `ids`."""
+        coll = BlockCollection([], lazy=True, compact=compact)
+        IndexedCollection.__init__(coll, ids, [None] * len(ids))
+        coll.lengths = lengths
+        coll.raw = None
+        coll._load_raw = load_raw
+        return coll
+
+    def __iter__(self):
+        if not self.lazy:
+            return iter(self.list)
+        return (self._items(n) for n in range(len(self.list)))
+
+    def _items(self, idx):
+        if self.lazy:
+            if isinstance(idx, (int, np.integer)):
+                self._materialize(idx)
+            else:
+                for pos in np.arange(len(self.list))[idx]:
+                    self._materialize(pos)
+        return self.list[idx]
+
+    def variations(self):
+        """Generator over (consensus length, gaps, variation) tuples, one per block,
+        where `variation` is the `compact_variation` of the block alignment.
+        Blocks that have not been built yet are read from their raw records and
+        are not stored."""
+        for pos in range(len(self.list)):
+            if self.lazy and (self.list[pos] is None):
+                self.load_raw()
+                raw = self.raw[pos]
+                var = pga.compact_variation.from_pan_block(raw)
+                yield len(raw["sequence"]), raw["gaps"], var
+            else:
+                aln = self.list[pos].alignment
+                yield len(aln.consensus), aln.gaps, aln.packed()
+
+    def records(self):
+        """Generator over the blocks in the pangraph .json format. Blocks that
+        have not been built yet are returned as raw records."""
+        for pos in range(len(self.list)):
+            if self.lazy and (self.list[pos] is None):
+                self.load_raw()
+                yield self.raw[pos]
+            else:
+                yield self.list[pos].to_pan_block()
+
+    def load_raw(self):
+        """Loads the raw records of a deferred collection (see `deferred`), if they
+        have not been loaded yet. Call it before forking worker processes that
+        access blocks, so that they share the records instead of each loading
+        them again."""
+        if self.lazy and self.raw is None:
+            self.raw = list(self._load_raw())
+            self._load_raw = None
+
+    def _materialize(self, pos):
+        """Builds the block in position `pos` if it has not been built yet."""
+        if self.list[pos] is None:
+            self.load_raw()
+            self.list[pos] = Block(self.raw[pos], lazy=True, compact=self.compact)
+            self.raw[pos] = None
+
 
 class PathCollection(IndexedCollection):
     """Collection of all paths. Inherits from IndexedCollection to allow for
     smart indexing of paths.
     """
 
-    def __init__(self, pan_paths):
+    def __init__(self, pan_paths, codes=None):
         ids = [path["name"] for path in pan_paths]
-        items = [Path(path) for path in pan_paths]
+        items = [Path(path, codes) for path in pan_paths]
         IndexedCollection.__init__(self, ids, items)
 
     def to_block_dict(self):
         return {path.name: path.block_ids.copy() for path in self}
 
+    def to_arrays(self):
+        """Returns the content of all paths as a dictionary of flat numpy arrays.
+        Block occurrences of all paths are concatenated, and the occurrences of
+        path `i` are in the slice `block_ptr[i]:block_ptr[i+1]`."""
+        lengths = [len(path) for path in self]
+        positions = [path.position if path.position is not None else [] for path in self]
+        return {
+            "has_position": np.array([path.position is not None for path in self], dtype=bool),
+            "position_ptr": np.concatenate([[0], np.cumsum([len(p) for p in positions])]).astype(np.int64),
+            "path_positions": _concat([np.asarray(p, dtype=np.int64) for p in positions], np.int64),
+            "names": self.ids,
+            "offsets": np.array([path.offset for path in self]),
+            "circular": np.array([path.circular for path in self], dtype=bool),
+            "block_ptr": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            "path_block_codes": _concat([path.block_codes for path in self], np.int32),
+            "path_block_nums": _concat([path.block_nums for path in self], np.int64),
+            "path_block_strands": _concat([path.block_strands for path in self], bool),
+        }
+
+    @staticmethod
+    def from_arrays(arrays, codes):
+        """Inverse of `to_arrays`. Block codes refer to the `codes` table."""
+        ptr, pos_ptr = arrays["block_ptr"], arrays["position_ptr"]
+        paths = []
+        for i, name in enumerate(arrays["names"]):
+            sl = slice(ptr[i], ptr[i + 1])
+            position = None
+            if arrays["has_position"][i]:
+                position = arrays["path_positions"][pos_ptr[i] : pos_ptr[i + 1]]
+            path = Path.from_arrays(
+                name=str(name),
+                offset=int(arrays["offsets"][i]),
+                circular=bool(arrays["circular"][i]),
+                block_codes=arrays["path_block_codes"][sl],
+                block_nums=arrays["path_block_nums"][sl],
+                block_strands=arrays["path_block_strands"][sl],
+                codes=codes,
+                position=position,
+            )
+            paths.append(path)
+        coll = PathCollection([])
+        IndexedCollection.__init__(coll, [path.name for path in paths], paths)
+        return coll
+
 
 class Block:
     """Python wrapper for pangraph block object. It has attributes:
@@ -217,20 +556,55 @@ class Block:
         pangraph
     - alignment (pan_alignment): object containing the information provided by
         pangraph that can be used to build alignments. See `pan_alignment`
-        class for details.
+        class for details. If the block is created with `lazy=True` the
+        alignment is only parsed the first time this attribute is accessed.
+        If `compact=True` the alignment variation is stored in numpy arrays.
+
+    If the block is created from a coordinates-only record (see `coords_record`),
+    `coords_only` is True, `sequence` and `gaps` are None and `alignment` is a
+    `coords_alignment` object, which only contains positions and lengths of
+    block occurrences.
     """
 
-    def __init__(self, pan_block):
+    def __init__(self, pan_block, lazy=False, compact=False):
         self.id = pan_block["id"]
-        self.sequence = pan_block["sequence"]
-        self.alignment = pga.pan_alignment(pan_block)
+        self.coords_only = is_coords_record(pan_block)
+        self.sequence = None if self.coords_only else pan_block["sequence"]
+        self._len = block_length(pan_block)
+        self._compact = compact
+        if lazy:
+            self._pan_block = pan_block
+            self._alignment = None
+        else:
+            self._pan_block = None
+            self._alignment = self._build_alignment(pan_block)
+
+    def _build_alignment(self, pan_block):
+        if self.coords_only:
+            return pga.coords_alignment(pan_block)
+        return pga.pan_alignment(pan_block, compact=self._compact)
+
+    @property
+    def alignment(self):
+        if self._alignment is None:
+            self._alignment = self._build_alignment(self._pan_block)
+            self._pan_block = None
+        return self._alignment
+
+    def to_pan_block(self):
+        """Returns the block in the pangraph .json format."""
+        if self._pan_block is not None:
+            return self._pan_block
+        pan_block = {"id": self.id, "sequence": self.sequence}
+        pan_block.update(self.alignment.to_pan_block())
+        return pan_block
 
     def __len__(self):
         """Length of the sequence in base-pairs."""
-        return len(self.sequence)
+        return self._len
 
     def __str__(self):
-        return f"block {self.id}, consensus len {len(self.sequence)/1000} kbp, {self.depth()} occurrences."
+        return f"block {self.id}, consensus len {len(self)/1000} kbp, {self.depth()} occurrences."
 
     def depth(self):
         """How many occurrences of the block are present"""
@@ -262,20 +636,195 @@ class Path:
         once per strain)
     - block_strains (str) : list of strains in which blocks occurr
     - block_strands (bool) : whether the block occurrs on direct or reverse strand.
+
+    Block ids are stored as integer codes in the `block_codes` array, and
+    `block_ids` is decoded from it using the `codes` table (see `CodeTable`).
+
+    If present in the pangraph file, the `position` list of the path is also
+    stored (otherwise it is None).
     """
 
-    def __init__(self, pan_path):
+    def __init__(self, pan_path, codes=None):
         self.name = pan_path["name"]
         self.offset = pan_path["offset"]
         self.circular = pan_path["circular"]
+        self.position = pan_path.get("position", None)
         blocks = pan_path["blocks"]
-        self.block_ids = np.array([block["id"] for block in blocks])
+        ids = [block["id"] for block in blocks]
+        if codes is None:
+            # table for the blocks of this path only
+            codes = CodeTable(list(dict.fromkeys(ids)), [self.name])
+        self.codes = codes
+        self.block_codes = codes.encode_blocks(ids)
         self.block_nums = np.array([block["number"] for block in blocks])
-        self.block_strains = np.array([block["name"] for block in blocks])
         self.block_strands = np.array([block["strand"] for block in blocks])
 
+    @staticmethod
+    def from_arrays(name, offset, circular, block_codes, block_nums, block_strands, codes, position=None):
+        """Creates a path directly from the arrays of block codes, occurrence
+        numbers and strands."""
+        path = Path.__new__(Path)
+        path.name = name
+        path.offset = offset
+        path.circular = circular
+        path.position = position
+        path.codes = codes
+        path.block_codes = block_codes
+        path.block_nums = block_nums
+        path.block_strands = block_strands
+        return path
+
+    @property
+    def block_ids(self):
+        return self.codes.decode_blocks(self.block_codes)
+
+    @property
+    def block_strains(self):
+        return np.full(len(self.block_codes), self.name)
+
+    def to_pan_path(self):
+        """Returns the path in the pangraph .json format."""
+        pan_path = {"name": self.name, "offset": int(self.offset), "circular": bool(self.circular)}
+        if self.position is not None:
+            pan_path["position"] = [int(p) for p in self.position]
+        pan_path["blocks"] = [
+            {"id": str(bl), "name": str(strain), "number": int(n), "strand": bool(st)}
+            for bl, strain, n, st in zip(
+                self.block_ids, self.block_strains, self.block_nums, self.block_strands
+            )
+        ]
+        return pan_path
+
     def __len__(self):
-        return len(self.block_ids)
+        return len(self.block_codes)
 
     def __str__(self):
-        return f"path {self.name}, n. blocks = {len(self.block_ids)}"
\ No newline at end of file
+        return f"path {self.name}, n. blocks = {len(self.block_codes)}"
+
+
+class CodeTable:
+    """Interning table that maps block ids and strain names to dense integer
+    codes, and back. The code of a block is its position in the list of blocks
+    of the pangraph, and the code of a strain is the position of its path. It
+    has attributes:
+    - block_ids (np.array of str): block id for each code.
+    - block_code (dict): block id -> code.
+    - strains (np.array of str): strain name for each code.
+    - strain_code (dict): strain name -> code.
+    """
+
+    def __init__(self, block_ids, strains, block_code=None):
+        self.block_ids = np.asarray(block_ids, dtype=str)
+        if block_code is None:
+            block_code = {bl: n for n, bl in enumerate(self.block_ids.tolist())}
+        self.block_code = block_code
+        self.strains = np.asarray(strains, dtype=str)
+        self.strain_code = {strain: n for n, strain in enumerate(self.strains.tolist())}
+
+    @staticmethod
+    def from_blocks(blocks, strains):
+        """Creates the table for a `BlockCollection`, sharing its array of ids
+        and its index instead of copying them."""
+        return CodeTable(blocks.ids, strains, block_code=blocks.id_to_pos)
+
+    def encode_blocks(self, ids):
+        """Returns the array of codes of a list of block ids."""
+        return np.fromiter((self.block_code[bl] for bl in ids), dtype=np.int32, count=len(ids))
+
+    def decode_blocks(self, codes):
+        """Returns the array of block ids corresponding to an array of codes."""
+        return self.block_ids[codes]
+
+    def encode_strain(self, strain):
+        return self.strain_code[strain]
+
+    def decode_strain(self, code):
+        return str(self.strains[code])
+
+
+# accepted extensions for pangraph files
+JSON_EXTENSIONS = (".json", ".json.gz", ".json.xz")
+
+
+def open_json_file(filename, mode="r"):
+    """Opens a .json file in text mode, transparently (de-)compressing it if the
+    name ends in .gz (gzip) or .xz (xz)."""
+    filename = str(filename)
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode + "t")
+    if filename.endswith(".xz"):
+        return lzma.open(filename, mode + "t")
+    return open(filename, mode)
+
+
+def load_json_file(filename, coords_only=False):
+    """Returns the content of a pangraph .json file as a dictionary. If
+    `coords_only` is True, blocks are reduced to coordinates-only records (see
+    `coords_record`) as soon as they are parsed, so that the sequences and
+    alignments of all blocks are never held in memory at the same time."""
+    hook = _coords_hook if coords_only else None
+    with open_json_file(filename, "r") as f:
+        pan_json = json.load(f, object_pairs_hook=hook)
+    return pan_json
+
+
+def coords_record(pan_block):
+    """Reduces a pangraph block record to the coordinates of its occurrences.
+    Returns a dictionary with keys:
+    - id: block id
+    - length: length of the consensus sequence
+    - positions: positions of block occurrences, as in the pangraph record
+    - lengths: length of each block occurrence, in the same order as positions
+    The length of an occurrence is derived from its [beg, end] positions on the
+    genome. For occurrences that wrap around the end of the genome (end < beg)
+    it is instead derived from the consensus length and the insertions and
+    deletions.
+    """
+    L = len(pan_block["sequence"])
+    lengths = []
+    indels = None
+    for occ, (b, e) in pan_block["positions"]:
+        if e >= b:
+            lengths.append(e - b + 1)
+            continue
+        if indels is None:
+            indels = Counter()
+            for occ_i, ins in pan_block["insert"]:
+                indels[pga.blockid_to_tuple(occ_i)] += sum(len(seq) for _, seq in ins)
+            for occ_i, dels in pan_block["delete"]:
+                indels[pga.blockid_to_tuple(occ_i)] -= sum(dL for _, dL in dels)
+        lengths.append(L + indels[pga.blockid_to_tuple(occ)])
+    return {
+        "id": pan_block["id"],
+        "length": L,
+        "positions": pan_block["positions"],
+        "lengths": lengths,
+    }
+
+
+def is_coords_record(pan_block):
+    """Whether a block record is a coordinates-only record (see `coords_record`)."""
+    return "sequence" not in pan_block
+
+
+def block_length(pan_block):
+    """Consensus length of a (full or coordinates-only) block record."""
+    if is_coords_record(pan_block):
+        return pan_block["length"]
+    return len(pan_block["sequence"])
+
+
+def _coords_hook(pairs):
+    """object_pairs_hook for `json.load`, that reduces block records to
+    coordinates-only records while the file is parsed."""
+    obj = dict(pairs)
+    if len(pairs) > 4 and ("sequence" in obj) and ("positions" in obj):
+        return coords_record(obj)
+    return obj
+
+
+def _concat(arrays, dtype):
+    """Concatenates a list of arrays, also when the list is empty."""
+    if len(arrays) == 0:
+        return np.array([], dtype=dtype)
+    return np.concatenate(arrays)
@@ -0,0 +1,207 @@
+# Functions to transfer intervals (e.g. annotations) from the genome of one
+# strain to the genome of another strain, through the pancontigs (blocks) that
+# the two strains share. Intervals are first split into pieces, one per block of
+# the source strain, and each piece is then placed on the occurrence of the same
+# block in the target strain, going through the columns of the block alignment so
+# that insertions and deletions between the two strains are taken into account.
+# All steps are vectorized over the set of intervals.
+
+import numpy as np
+
+
+def locate_intervals(locator, source, starts, ends):
+    """Splits a set of intervals on the genome of the source strain into pieces,
+    one for every block that contains part of the interval.
+
+    Args:
+        locator (Locator): locator of the pangraph, loaded with the alignments.
+        source (str): source strain.
+        starts, ends (np.array): beginning and end of the intervals on the
+            source genome (1-based indexing, start <= end).
+
+    Returns a dictionary of arrays. The pieces of the i-th interval are in the
+    slice `offsets[i]:offsets[i+1]`, ordered as along the source genome:
+    - offsets: array with len(starts) + 1 entries.
+    - codes, nums, strands: code, occurrence number and strand of the block of
+        each piece in the source strain.
+    - I_b, I_e: beginning and end of the piece relative to the block occurrence
+        (1-based indexing, as returned by `PathMap.interval_to_blocks_batch`).
+    - src_b, src_e: beginning and end of the piece on the source genome.
+    - L: length of the block occurrence in the source strain.
+    - col_b, col_e: alignment columns of the beginning and end of the piece.
+    """
+    source_map = locator[source]
+    offsets, idxs, I_b, I_e, strands = source_map.interval_to_blocks_batch(starts, ends)
+    col_b, col_e = occurrence_columns(locator, source, idxs, I_b, I_e)
+    src_b, src_e = block_to_genome(
+        I_b, I_e, source_map.b[idxs], source_map.e[idxs], strands, source_map.path_L
+    )
+    return {
+        "offsets": offsets,
+        "codes": source_map.codes[idxs],
+        "nums": source_map.nums[idxs],
+        "strands": strands,
+        "I_b": I_b,
+        "I_e": I_e,
+        "src_b": src_b,
+        "src_e": src_e,
+        "L": source_map.Ls[idxs],
+        "col_b": col_b,
+        "col_e": col_e,
+    }
+
+
+def lift_pieces(pieces, locator, target):
+    """Places the pieces returned by `locate_intervals` on the genome of the target
+    strain. Each piece is placed on the occurrence of the same block in the target
+    strain, preferring the occurrence with the same occurrence number if the block
+    is duplicated (see `PathMap.find_occurrences_batch`). The piece covers the same
+    alignment columns in the target occurrence. If an end of the piece falls in a
+    gap of the target occurrence, it is moved inward to the closest position that
+    the target occurrence has. Pieces that reach the end of the source occurrence
+    reach the end of the target occurrence.
+
+    Returns a dictionary of arrays with one entry per piece:
+    - mapped: whether the block of the piece occurs in the target strain, and the
+        target occurrence has part of the piece. Pieces that would cross the
+        origin of the target genome are not mapped.
+    - exact: whether the piece is mapped and both its ends are in the target
+        occurrence (they did not fall in a gap).
+    - tgt_b, tgt_e: beginning and end of the piece on the target genome.
+    - flip: whether the orientation of the piece is reversed in the target strain.
+    - n_copies: number of occurrences of the block in the target strain.
+    and one entry per interval:
+    - n_pieces, n_mapped, n_exact: number of pieces, of mapped pieces, and of
+        pieces mapped exactly.
+    - contiguous: whether all pieces are mapped, with the same orientation,
+        next to each other and in order on the target genome. In this case the
+        interval is mapped as a whole on [start, end], with orientation `flipped`.
+    - start, end, flipped
+    """
+    offsets = pieces["offsets"]
+    target_map = locator[target]
+    idxs, n_copies = target_map.find_occurrences_batch(pieces["codes"], pieces["nums"])
+    present = idxs >= 0
+    idxs = np.where(present, idxs, 0)
+
+    # positions relative to the target occurrence, through the alignment columns
+    L_t = target_map.Ls[idxs]
+    I_b, I_e, exact_b, exact_e = occurrence_positions(
+        locator, target, idxs[present], pieces["col_b"][present], pieces["col_e"][present]
+    )
+    I_b, I_e = _scatter(present, I_b, 1), _scatter(present, I_e, 1)
+    exact_b, exact_e = _scatter(present, exact_b, False), _scatter(present, exact_e, False)
+    # pieces that reach the ends of the source occurrence
+    at_b, at_e = pieces["I_b"] == 1, pieces["I_e"] == pieces["L"]
+    I_b, I_e = np.where(at_b, 1, I_b), np.where(at_e, L_t, I_e)
+    exact = (exact_b | at_b) & (exact_e | at_e)
+    t_strands = target_map.strands[idxs]
+    tgt_b, tgt_e = block_to_genome(
+        I_b, I_e, target_map.b[idxs], target_map.e[idxs], t_strands, target_map.path_L
+    )
+    mapped = present & (I_b <= I_e) & (tgt_b <= tgt_e)
+    exact &= mapped
+    flip = t_strands != pieces["strands"]
+
+    # intervals that map as a whole: consecutive pieces must be adjacent on the
+    # target genome, in the direction given by the orientation
+    n_int = len(offsets) - 1
+    n_pieces = np.diff(offsets)
+    interval = np.repeat(np.arange(n_int), n_pieces)
+    n_mapped = np.bincount(interval, weights=mapped, minlength=n_int).astype(np.int64)
+    n_exact = np.bincount(interval, weights=exact, minlength=n_int).astype(np.int64)
+    n_flip = np.bincount(interval, weights=flip, minlength=n_int).astype(np.int64)
+    same = interval[1:] == interval[:-1]
+    gap_fw = (tgt_b[1:] - tgt_e[:-1] - 1) % target_map.path_L
+    gap_rv = (tgt_b[:-1] - tgt_e[1:] - 1) % target_map.path_L
+    adjacent = np.where(flip[1:], gap_rv, gap_fw) == 0
+    breaks = np.bincount(interval[1:][same & ~adjacent], minlength=n_int)
+    contiguous = (n_mapped == n_pieces) & (breaks == 0)
+    contiguous &= (n_flip == 0) | (n_flip == n_pieces)
+
+    # every interval has at least one piece
+    first, last = offsets[:-1], offsets[1:] - 1
+    flip_i = flip[first]
+    start = np.where(flip_i, tgt_b[last], tgt_b[first])
+    end = np.where(flip_i, tgt_e[first], tgt_e[last])
+    # intervals that would cross the origin of the target genome
+    contiguous &= start <= end
+    return {
+        "mapped": mapped,
+        "exact": exact,
+        "tgt_b": tgt_b,
+        "tgt_e": tgt_e,
+        "flip": flip,
+        "n_copies": n_copies,
+        "n_pieces": n_pieces,
+        "n_mapped": n_mapped,
+        "n_exact": n_exact,
+        "contiguous": contiguous,
+        "start": start,
+        "end": end,
+        "flipped": flip_i,
+    }
+
+
+def liftover_intervals(locator, source, target, starts, ends):
+    """Transfers a set of intervals from the genome of the source strain to the
+    genome of the target strain. Returns the pieces of the intervals (see
+    `locate_intervals`) and their placement on the target genome (see
+    `lift_pieces`)."""
+    pieces = locate_intervals(locator, source, starts, ends)
+    return pieces, lift_pieces(pieces, locator, target)
+
+
+def occurrence_columns(locator, strain, idxs, I_b, I_e):
+    """Alignment columns of the positions I_b and I_e, relative to the block
+    occurrences of the strain given by their indices `idxs` in its PathMap."""
+    pmap = locator[strain]
+    col_b = np.zeros(len(idxs), dtype=np.int64)
+    col_e = np.zeros(len(idxs), dtype=np.int64)
+    codes = pmap.codes[idxs]
+    for code in np.unique(codes).tolist():
+        sel = np.flatnonzero(codes == code)
+        segments = locator.block_segments(strain, code)
+        rows = [segments.occ_index[occ] for occ in pmap.occurrences(idxs[sel])]
+        col_b[sel] = segments.locate(rows, I_b[sel])[1]
+        col_e[sel] = segments.locate(rows, I_e[sel])[1]
+    return col_b, col_e
+
+
+def occurrence_positions(locator, strain, idxs, col_b, col_e):
+    """Inverse of `occurrence_columns`: positions [I_b, I_e] spanning the alignment
+    columns [col_b, col_e] in the block occurrences of the strain given by their
+    indices `idxs` in its PathMap. Also returns whether col_b and col_e are in the
+    occurrence; otherwise the ends are moved inward, and I_b > I_e if the
+    occurrence has no position in the columns."""
+    pmap = locator[strain]
+    I_b = np.zeros(len(idxs), dtype=np.int64)
+    I_e = np.zeros(len(idxs), dtype=np.int64)
+    exact_b = np.zeros(len(idxs), dtype=bool)
+    exact_e = np.zeros(len(idxs), dtype=bool)
+    codes = pmap.codes[idxs]
+    for code in np.unique(codes).tolist():
+        sel = np.flatnonzero(codes == code)
+        segments = locator.block_segments(strain, code)
+        rows = [segments.occ_index[occ] for occ in pmap.occurrences(idxs[sel])]
+        I_b[sel], exact_b[sel] = segments.sequence_position(rows, col_b[sel], side="right")
+        I_e[sel], exact_e[sel] = segments.sequence_position(rows, col_e[sel], side="left")
+    return I_b, I_e, exact_b, exact_e
+
+
+def _scatter(mask, values, fill):
+    """Array with `values` where `mask` is True, and `fill` elsewhere."""
+    out = np.full(len(mask), fill, dtype=np.asarray(values).dtype)
+    out[mask] = values
+    return out
+
+
+def block_to_genome(I_b, I_e, bl_b, bl_e, bl_s, pth_L):
+    """Inverse of `position_in_block_coordinates`: converts an interval [I_b, I_e]
+    relative to a block occurrence into an interval [beg, end] on the genome, given
+    the beginning and end position of the block occurrence on the genome, its
+    strand and the genome length. All positions are in 1-based indexing. If the
+    interval crosses the origin of the genome, it is beg > end."""
+    beg = np.where(bl_s, bl_b + I_b - 1, bl_e - I_e + 1)
+    end = np.where(bl_s, bl_b + I_e - 1, bl_e - I_b + 1)
+    return (beg - 1) % pth_L + 1, (end - 1) % pth_L + 1
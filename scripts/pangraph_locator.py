@@ -8,15 +8,76 @@
 import numpy as np
 from collections import defaultdict
 
+import pangraph_profile as pgp
+
 
 class Locator:
     """Given a pangraph, builds a map that can be used to quickly
     locate a genomic position on the pangraph.
+
+    If `lazy` is True, the PathMap of each strain is only built the first
+    time that the strain is accessed (e.g. with `locator[strain]`). Maps for
+    a set of strains can also be built in advance with `prefetch`. Built maps
+    are stored in the `map` dictionary {strain : PathMap}. Similarly, the
+    offset tables used to find consensus positions are built for each block of a
+    strain on first use, and kept in `segments` {strain : {block code : tables}}.
+
+    The time and memory used to build maps are recorded by `profiler` (see
+    `pangraph_profile.StageProfiler`), by default the profiler of the pangraph.
     """
 
-    def __init__(self, pan):
+    def __init__(self, pan, lazy=False, profiler=None):
+        self.paths = pan.paths
+        self.blocks = pan.blocks
+        self.codes = pan.codes
+        self.coords_only = getattr(pan, "coords_only", False)
+        if profiler is None:
+            profiler = getattr(pan, "profiler", pgp.NULL_PROFILER)
+        self.profiler = profiler
+        self.map = {}
+        self.segments = {}
+        # indices of the occurrences of each block in the PathMap of a strain
+        # {strain : {block code : np.array}}, to build the offset tables
+        self._block_idxs = {}
+
+        # if the pangraph has a binary cache, maps are reloaded from it if possible.
+        # Otherwise all maps are built and saved, so that later runs can use them.
+        self._map_arrays = None
+        cache = getattr(pan, "cache", None)
+        if cache is not None:
+            self._map_arrays = cache.load("map")
+            if self._map_arrays is None:
+                self.prefetch(self.strains())
+                with self.profiler.stage("save_cache"):
+                    cache.save("map", map_to_arrays(self.map))
+                return
+            strains = self._map_arrays["strains"]
+            self._strain_to_pos = {str(strain): n for n, strain in enumerate(strains)}
+
         # build a map
-        self.map = build_map(pan.paths, pan.blocks)
+        if not lazy:
+            self.prefetch(self.strains())
+
+    def strains(self):
+        """Returns the list of strain names."""
+        return [str(strain) for strain in self.paths.ids]
+
+    def prefetch(self, strains):
+        """Builds the maps of the given strains, if not already built."""
+        for strain in strains:
+            self[strain]
+
+    def _build_path_map(self, strain):
+        self.profiler.count("path_maps")
+        if self._map_arrays is not None:
+            with self.profiler.stage("load_map"):
+                pmap = path_map_from_arrays(self._map_arrays, self._strain_to_pos[strain], self.codes)
+        else:
+            # includes the construction of the blocks of the path, if lazy
+            with self.profiler.stage("build_map"):
+                pmap = build_path_map(self.paths[strain], self.blocks)
+        pmap.profiler = self.profiler
+        return pmap
 
     def find_position(self, strain, pos):
         """Returns the block-id associated to a particular position
@@ -27,7 +88,7 @@ class Locator:
         Nb: the position is relative to the block sequence in the strain
         considered, and not to the block consensus.
         """
-        pmap = self.map[strain]
+        pmap = self[strain]
         return pmap.position_to_block(pos)
 
     def find_interval(self, strain, pos_b, pos_e):
@@ -35,30 +96,97 @@ class Locator:
         of positions on the genomes.
         Positions should be provided with 1-based indexing.
         """
-        pmap = self.map[strain]
+        pmap = self[strain]
         return pmap.interval_to_blocks(pos_b, pos_e)
 
+    def find_consensus_position(self, strain, pos):
+        """Returns the block-id associated to a particular position on the genome
+        (1-based indexing), the corresponding position on the block consensus and
+        column of the block alignment (both 1-based indexing), whether the
+        position is in an insertion with respect to the consensus, and the block
+        occurrence tag (strain, block n., strand). For inserted positions the
+        consensus position is the one after which the insertion is.
+        Unlike `find_position`, positions are comparable across strains.
+        """
+        bl_ids, cons_pos, cols, inserted, idxs = self.find_consensus_positions(strain, [pos])
+        occ = self[strain].occurrences(idxs)[0]
+        return str(bl_ids[0]), int(cons_pos[0]), int(cols[0]), bool(inserted[0]), occ
+
+    def find_consensus_positions(self, strain, positions):
+        """Vectorized version of `find_consensus_position`, for an array of
+        positions on the genome of a strain. Returns arrays of block ids,
+        consensus positions, alignment columns and insertion flags, together with
+        the indices of the block occurrences in the PathMap of the strain.
+        Positions are converted with the offset tables of block occurrences (see
+        `block_segments`), which are reused by later queries."""
+        if self.coords_only:
+            raise Exception("consensus positions are not available with coords_only=True")
+        pmap = self[strain]
+        positions = np.asarray(positions, dtype=np.int64)
+        idxs = pmap.position_to_block_idx(positions)
+        seq_pos = position_in_block_coordinates_batch(
+            positions, pmap.b[idxs], pmap.e[idxs], pmap.strands[idxs], pmap.path_L
+        )
+        cons_pos = np.zeros(len(positions), dtype=np.int64)
+        cols = np.zeros(len(positions), dtype=np.int64)
+        inserted = np.zeros(len(positions), dtype=bool)
+        # positions are converted block by block
+        codes = pmap.codes[idxs]
+        for code in np.unique(codes).tolist():
+            sel = np.flatnonzero(codes == code)
+            segments = self.block_segments(strain, code)
+            rows = [segments.occ_index[occ] for occ in pmap.occurrences(idxs[sel])]
+            cons_pos[sel], cols[sel], inserted[sel] = segments.locate(rows, seq_pos[sel])
+        return pmap.block_ids(idxs), cons_pos, cols, inserted, idxs
+
+    def block_segments(self, strain, code):
+        """Returns the offset tables relating positions in the occurrences of a block
+        (given by its code) in a strain to consensus positions and alignment columns
+        (see `pan_alignment.segments`). Tables are built for all the occurrences of the
+        block in the strain the first time they are needed, and then reused."""
+        segments = self.segments.setdefault(strain, {})
+        if code not in segments:
+            if strain not in self._block_idxs:
+                pmap = self[strain]
+                order = np.argsort(pmap.codes, kind="stable")
+                bounds = np.flatnonzero(np.diff(pmap.codes[order])) + 1
+                self._block_idxs[strain] = {
+                    int(pmap.codes[idx[0]]): idx for idx in np.split(order, bounds)
+                }
+            occs = self[strain].occurrences(self._block_idxs[strain][code])
+            segments[code] = self.blocks[code].alignment.segments(occs)
+        return segments[code]
+
     def __getitem__(self, idx):
+        if idx not in self.map:
+            self.map[idx] = self._build_path_map(idx)
         return self.map[idx]
 
     def __iter__(self):
-        return iter(self.map)
+        return iter(self.strains())
 
     def items(self):
-        return self.map.items()
+        return [(strain, self[strain]) for strain in self.strains()]
 
 
 class PathMap:
-    def __init__(self, bl_ids, bl_begs, bl_ends, bl_lengths, bl_occs):
+    def __init__(self, strain, bl_codes, bl_begs, bl_ends, bl_lengths, bl_nums, bl_strands, codes):
         """Takes care of reordering the lists of blocks based on beginning
         positions on the genomes.
+        Blocks are identified by their integer codes in the `codes` table (see
+        `pangraph_interface.CodeTable`). Ids and occurrences are decoded only
+        when returned, see `block_ids` and `occurrences`.
         """
-        self.ids = np.array(bl_ids)
+        self.strain = strain
+        self.table = codes
+        self.codes = np.asarray(bl_codes, dtype=np.int32)
         self.b = np.array(bl_begs)
         self.e = np.array(bl_ends)
-        self.N = len(self.ids)
+        self.N = len(self.codes)
         self.Ls = np.array(bl_lengths)
-        self.occs = np.array(bl_occs, dtype=object)
+        # occurrence numbers and strands as arrays, for vectorized queries
+        self.nums = np.asarray(bl_nums, dtype=int)
+        self.strands = np.asarray(bl_strands, dtype=bool)
         self.path_L = np.sum(bl_lengths)
         #assert np.all((self.e + 1 - self.b) % self.path_L == self.Ls)  # TODO: remove
 
@@ -67,9 +195,45 @@ class PathMap:
         order = np.argsort(self.b)
         self.b = self.b[order]
         self.e = self.e[order]
-        self.ids = self.ids[order]
+        self.codes = self.codes[order]
         self.Ls = self.Ls[order]
-        self.occs = self.occs[order]
+        self.nums = self.nums[order]
+        self.strands = self.strands[order]
+
+        # index {(block code, occurrence n.) -> position in the PathMap lists}
+        self.occ_index = {
+            (code, n): i for i, (code, n) in enumerate(zip(self.codes.tolist(), self.nums.tolist()))
+        }
+        # sorted keys for the reverse lookup, built on first use
+        self._occ_order = None
+        # counts the wrap-around warnings (see `Locator`)
+        self.profiler = pgp.NULL_PROFILER
+
+    @property
+    def ids(self):
+        """Array of block ids, in the PathMap order."""
+        return self.table.decode_blocks(self.codes)
+
+    @property
+    def occs(self):
+        """Array of block occurrences (strain, block n., strand), in the PathMap
+        order."""
+        occs = np.empty((self.N, 3), dtype=object)
+        occs[:, 0] = self.strain
+        occs[:, 1] = self.nums
+        occs[:, 2] = self.strands
+        return occs
+
+    def block_ids(self, idxs):
+        """Returns the ids of the blocks with indices `idxs` in the PathMap lists."""
+        return self.table.decode_blocks(self.codes[idxs])
+
+    def occurrences(self, idxs):
+        """Returns the list of block occurrences (strain, block n., strand) of the
+        blocks with indices `idxs` in the PathMap lists."""
+        return [
+            (self.strain, n, s) for n, s in zip(self.nums[idxs].tolist(), self.strands[idxs].tolist())
+        ]
 
     def position_to_block_idx(self, pos):
         """Given a position on the genome, returns the index of the block
@@ -79,16 +243,48 @@ class PathMap:
         idx = (idx - 1) % self.N  # correct for periodic boundary conditions
         return idx
 
+    def occurrence_to_block_idx(self, bl_id, n):
+        """Given a block id and an occurrence number, returns the index of the
+        corresponding block occurrence in the PathMap lists."""
+        return self.occ_index[(self.table.block_code[bl_id], n)]
+
+    def find_occurrences_batch(self, codes, nums):
+        """Reverse lookup from blocks to the genome. Given arrays of block codes and
+        occurrence numbers, returns:
+        - idxs (np.array): index in the PathMap lists of the occurrence of each
+            block with the same occurrence number. If there is none, the first
+            occurrence of the block is used, and if the block does not occur in
+            this path the index is -1.
+        - n_copies (np.array): number of occurrences of each block in this path.
+        """
+        if self._occ_order is None:
+            order = np.lexsort((self.nums, self.codes))
+            self._occ_order = order
+            self._occ_keys = _occurrence_keys(self.codes[order], self.nums[order])
+        order, keys = self._occ_order, self._occ_keys
+        codes = np.asarray(codes, dtype=np.int64)
+        sorted_codes = keys >> 32
+        first = np.searchsorted(sorted_codes, codes, side="left")
+        n_copies = np.searchsorted(sorted_codes, codes, side="right") - first
+
+        # occurrence with the same number, or first occurrence of the block
+        q = _occurrence_keys(codes, nums)
+        exact = np.minimum(np.searchsorted(keys, q), self.N - 1)
+        found = keys[exact] == q
+        idxs = np.where(found, order[exact], order[np.minimum(first, self.N - 1)])
+        idxs = np.where(n_copies > 0, idxs, -1)
+        return idxs, n_copies
+
     def position_to_block(self, pos):
         """Relates a position on the genome (1-based indexing!) to a position in
         a block. It returns the block id, the position of the nucleotide in the block
         (1-based indexing!) and the block occurrence tuple: (strain, block n., strand).
         """
         idx = self.position_to_block_idx(pos)
-        bl_id = self.ids[idx]
-        b, e, s, pthL = self.b[idx], self.e[idx], self.occs[idx][2], self.path_L
+        bl_id = self.block_ids(idx)
+        b, e, s, pthL = self.b[idx], self.e[idx], self.strands[idx], self.path_L
         bl_pos = position_in_block_coordinates(pos, b, e, s, pthL)
-        occ = tuple(self.occs[idx])
+        occ = (self.strain, self.nums[idx], s)
         return bl_id, bl_pos, occ
 
     def interval_to_blocks(self, pos_b, pos_e):
@@ -110,24 +306,18 @@ class PathMap:
         # create the list of indices of blocks that contain the interval
         wrap_1 = idx_e < idx_b
         wrap_2 = idx_e == idx_b
-        strand = self.occs[idx_b][2]
+        strand = self.strands[idx_b]
         wrap_2 &= (strand & (pe < pb)) | ((not strand) & (pe > pb))
         if wrap_2:
-            message = "warning: interval starts and ends in the same block"
-            message += " but it wraps around the genome.\n"
-            message += f"strand = {strand}, beg = {pos_b}, end = {pos_e},\n"
-            message += f"block beg = {self.ids[idx_b]}, block end = {self.ids[idx_e]}"
-            message += f"beg pos in block = {pb}, end pos in block = {pe}."
-            print(message)
+            self._warn_wrap(strand, pos_b, pos_e, idx_b, idx_e, pb, pe)
         if wrap_1 | wrap_2:
             idxs = np.arange(idx_b, idx_e + self.N + 1) % self.N
         else:
             idxs = np.arange(idx_b, idx_e + 1)
 
         I = [(1, self.Ls[idx]) for idx in idxs]
-        bl_ids = self.ids[idxs]
-        occs = self.occs[idxs]
-        occs = [tuple(occ) for occ in occs]
+        bl_ids = self.block_ids(idxs)
+        occs = [(self.strain, n, s) for n, s in zip(self.nums[idxs], self.strands[idxs])]
 
         # set beginning and end
         Ib, occb = I[0], occs[0]
@@ -136,6 +326,91 @@ class PathMap:
         I[-1] = (Ie[0], pe) if occe[2] else (pe, Ie[1])
         return bl_ids, I, occs
 
+    def interval_block_ranges(self, pos_b, pos_e):
+        """Given arrays of beginning and end positions (1-based indexing) on the
+        genome, returns for each interval the index of its first block in the
+        PathMap lists and the number of blocks that contain it. Blocks of an
+        interval are consecutive: the i-th interval is contained in blocks
+        `(idx_b[i] + k) % N` for k in range(n_blocks[i]).
+        Intervals that wrap around the genome are treated as in `interval_to_blocks`.
+        Positions in the block frame of reference are only computed for intervals
+        that start and end in the same block, to check for wrap-around.
+        """
+        pos_b = np.asarray(pos_b, dtype=np.int64)
+        pos_e = np.asarray(pos_e, dtype=np.int64)
+
+        # find indices of start and end blocks
+        idx_b = self.position_to_block_idx(pos_b)
+        idx_e = self.position_to_block_idx(pos_e)
+
+        # intervals that start and end in the same block wrap around the genome
+        # if they end before they start in the block frame of reference
+        wrap_1 = idx_e < idx_b
+        wrap_2 = np.zeros(len(pos_b), dtype=bool)
+        same = np.flatnonzero(idx_e == idx_b)
+        ib = idx_b[same]
+        pb = position_in_block_coordinates_batch(pos_b[same], self.b[ib], self.e[ib], self.strands[ib], self.path_L)
+        pe = position_in_block_coordinates_batch(pos_e[same], self.b[ib], self.e[ib], self.strands[ib], self.path_L)
+        strand = self.strands[ib]
+        wrap_2[same] = (strand & (pe < pb)) | (~strand & (pe > pb))
+        for k in np.flatnonzero(wrap_2[same]):
+            i = same[k]
+            self._warn_wrap(strand[k], pos_b[i], pos_e[i], idx_b[i], idx_e[i], pb[k], pe[k])
+        n_blocks = idx_e - idx_b + 1 + self.N * (wrap_1 | wrap_2)
+        return idx_b, n_blocks
+
+    def interval_to_blocks_batch(self, pos_b, pos_e):
+        """Vectorized version of `interval_to_blocks`, for arrays of beginning and
+        end positions (1-based indexing) on the genome. Results for all intervals
+        are concatenated in flat arrays: the blocks of the i-th interval are in
+        the slice `offsets[i]:offsets[i+1]`. It returns:
+        - offsets (np.array): array with len(pos_b) + 1 entries.
+        - idxs (np.array): indices of the blocks in the PathMap lists. Block ids
+            and occurrences are `self.block_ids(idxs)` and `self.occurrences(idxs)`.
+        - I_b, I_e (np.array): beginning and end of the interval in each block
+            (1-based indexing, relative to the block sequence and not to the
+            consensus).
+        - strands (np.array): strand of each block occurrence.
+        Intervals that wrap around the genome are treated as in `interval_to_blocks`.
+        """
+        pos_b = np.asarray(pos_b, dtype=np.int64)
+        pos_e = np.asarray(pos_e, dtype=np.int64)
+        idx_b, n_blocks = self.interval_block_ranges(pos_b, pos_e)
+
+        # flat list of block indices
+        offsets = np.concatenate([[0], np.cumsum(n_blocks)]).astype(np.int64)
+        interval = np.repeat(np.arange(len(pos_b)), n_blocks)
+        k = np.arange(offsets[-1]) - offsets[interval]
+        idxs = (idx_b[interval] + k) % self.N
+        strands = self.strands[idxs]
+        I_b = np.ones(len(idxs), dtype=np.int64)
+        I_e = self.Ls[idxs].astype(np.int64)
+
+        # interval start and end position in block frame of reference
+        first, last = offsets[:-1], offsets[1:] - 1
+        i_b, i_e = idxs[first], idxs[last]
+        pb = position_in_block_coordinates_batch(pos_b, self.b[i_b], self.e[i_b], self.strands[i_b], self.path_L)
+        pe = position_in_block_coordinates_batch(pos_e, self.b[i_e], self.e[i_e], self.strands[i_e], self.path_L)
+
+        # set beginning and end
+        s_first, s_last = strands[first], strands[last]
+        I_b[first] = np.where(s_first, pb, I_b[first])
+        I_e[first] = np.where(s_first, I_e[first], pb)
+        I_e[last] = np.where(s_last, pe, I_e[last])
+        I_b[last] = np.where(s_last, I_b[last], pe)
+        return offsets, idxs, I_b, I_e, strands
+
+    def _warn_wrap(self, strand, pos_b, pos_e, idx_b, idx_e, pb, pe):
+        """Prints a warning for an interval that starts and ends in the same
+        block but wraps around the genome."""
+        message = "warning: interval starts and ends in the same block"
+        message += " but it wraps around the genome.\n"
+        message += f"strand = {strand}, beg = {pos_b}, end = {pos_e},\n"
+        message += f"block beg = {self.block_ids(idx_b)}, block end = {self.block_ids(idx_e)}"
+        message += f"beg pos in block = {pb}, end pos in block = {pe}."
+        print(message)
+        self.profiler.count("wrap_warnings")
+
 
 def build_map(paths, blocks):
     """
@@ -143,30 +418,80 @@ def build_map(paths, blocks):
     """
     pan_map = {}
     for path in paths:
-        strain = path.name
-        bl_ids, bl_starts, bl_ends, bl_Ls, bl_occs = [[] for _ in range(5)]
-        for bl, n, st in zip(path.block_ids, path.block_nums, path.block_strands):
-            # index for the alignment dictionary in block object
-            occ = (strain, n, st)
-
-            # nb: julia indexing
-            aln = blocks[bl].alignment
-            pos_b, pos_e = aln.pos[occ]
-            bl_L = aln.block_occurrence_length(occ)
-
-            # build lists of block indices and positions
-            bl_ids.append(bl)
-            bl_starts.append(pos_b)
-            bl_ends.append(pos_e)
-            bl_Ls.append(bl_L)
-            bl_occs.append(occ)
-
-        # use the lists to build a map object for every strain
-        pan_map[strain] = PathMap(bl_ids, bl_starts, bl_ends, bl_Ls, bl_occs)
+        pan_map[path.name] = build_path_map(path, blocks)
+    return pan_map
+
+
+def build_path_map(path, blocks):
+    """
+    Given a path and the set of blocks, builds the PathMap for the path.
+    """
+    strain = path.name
+    bl_starts, bl_ends, bl_Ls = [[] for _ in range(3)]
+    for code, n, st in zip(path.block_codes, path.block_nums, path.block_strands):
+        # index for the alignment dictionary in block object
+        occ = (strain, n, st)
 
+        # nb: julia indexing
+        aln = blocks[code].alignment
+        pos_b, pos_e = aln.pos[occ]
+        bl_L = aln.block_occurrence_length(occ)
+
+        # build lists of block positions
+        bl_starts.append(pos_b)
+        bl_ends.append(pos_e)
+        bl_Ls.append(bl_L)
+
+    # use the lists to build a map object
+    return PathMap(
+        strain, path.block_codes, bl_starts, bl_ends, bl_Ls,
+        path.block_nums, path.block_strands, path.codes,
+    )
+
+
+def map_to_arrays(pan_map):
+    """Converts a dictionary {strain : PathMap} to a dictionary of flat numpy
+    arrays, which is the format used to store the map in the binary cache.
+    The entries of the `i`-th strain are in the slice `ptr[i]:ptr[i+1]`."""
+    strains = list(pan_map.keys())
+    pmaps = [pan_map[strain] for strain in strains]
+    Ns = [pmap.N for pmap in pmaps]
+    return {
+        "strains": np.array(strains, dtype=str),
+        "ptr": np.concatenate([[0], np.cumsum(Ns)]).astype(np.int64),
+        "codes": np.concatenate([pmap.codes for pmap in pmaps]).astype(np.int32),
+        "b": np.concatenate([pmap.b for pmap in pmaps]).astype(np.int64),
+        "e": np.concatenate([pmap.e for pmap in pmaps]).astype(np.int64),
+        "Ls": np.concatenate([pmap.Ls for pmap in pmaps]).astype(np.int64),
+        "nums": np.concatenate([pmap.nums for pmap in pmaps]).astype(np.int64),
+        "strands": np.concatenate([pmap.strands for pmap in pmaps]).astype(bool),
+    }
+
+
+def map_from_arrays(arrays, codes):
+    """Inverse of `map_to_arrays`. Block codes refer to the `codes` table."""
+    pan_map = {}
+    for i, strain in enumerate(arrays["strains"]):
+        pan_map[str(strain)] = path_map_from_arrays(arrays, i, codes)
     return pan_map
 
 
+def path_map_from_arrays(arrays, i, codes):
+    """Builds the PathMap of the i-th strain from the output of `map_to_arrays`."""
+    ptr = arrays["ptr"]
+    strain = str(arrays["strains"][i])
+    sl = slice(ptr[i], ptr[i + 1])
+    return PathMap(
+        strain, arrays["codes"][sl], arrays["b"][sl], arrays["e"][sl], arrays["Ls"][sl],
+        arrays["nums"][sl], arrays["strands"][sl], codes,
+    )
+
+
+def _occurrence_keys(codes, nums):
+    """Combines block codes and occurrence numbers in sortable int64 keys."""
+    return (np.asarray(codes, dtype=np.int64) << 32) | np.asarray(nums, dtype=np.int64)
+
+
 def position_in_block_coordinates(pos, bl_b, bl_e, bl_s, pth_L):
     """Given a position in the genome, information on the block hosting
     this position, returns the (1-based) index of the position in the block.
@@ -182,3 +507,11 @@ def position_in_block_coordinates(pos, bl_b, bl_e, bl_s, pth_L):
         return (pos - bl_b + 1) % pth_L
     else:
         return (bl_e - pos + 1) % pth_L
+
+
+def position_in_block_coordinates_batch(pos, bl_b, bl_e, bl_s, pth_L):
+    """Vectorized version of `position_in_block_coordinates`, for arrays of
+    positions and of the corresponding block beginnings, ends and strands."""
+    assert np.all((pos - bl_b) % pth_L <= (bl_e - bl_b) % pth_L)
+    assert np.all((bl_e - pos) % pth_L <= (bl_e - bl_b) % pth_L)
+    return np.where(bl_s, (pos - bl_b + 1) % pth_L, (bl_e - pos + 1) % pth_L)
@@ -0,0 +1,110 @@
+# Instrumentation of the stages of a run (e.g. loading the pangraph, building
+# the maps, annotating and writing a gff). For each stage the wall-clock time,
+# the CPU time and the peak of memory allocated by python (as traced by
+# tracemalloc) are recorded, together with counters of the items processed.
+
+import json
+import os
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class StageProfiler:
+    """Records the resources used by named stages of a run. Stages are timed with
+    `with profiler.stage(name): ...`, and can be nested, in which case the time
+    and memory of the inner stage are also included in the outer one. A stage that
+    is entered several times accumulates its times, and keeps the maximum of its
+    memory peaks. Counters are incremented with `profiler.count(name, n)`.
+
+    If `enabled` is False, stages and counters are not recorded, so that the hooks
+    can be left in the code at no cost. If `trace_memory` is True, tracemalloc is
+    started (if it is not already running), which slows down allocations.
+    """
+
+    def __init__(self, enabled=True, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages = {}
+        self.counts = {}
+        # peak memory of the stages that are currently running
+        self._running = []
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager that records the wall time, CPU time and peak memory
+        of a stage."""
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            self._update_peaks()
+            tracemalloc.reset_peak()
+        self._running.append(0)
+        t_wall, t_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - t_wall
+            cpu = time.process_time() - t_cpu
+            if self.trace_memory:
+                self._update_peaks()
+            peak = self._running.pop()
+            # the peak of the outer stages includes the one of this stage
+            if self._running:
+                self._running[-1] = max(self._running[-1], peak)
+            rec = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_mb": 0.0})
+            rec["calls"] += 1
+            rec["wall_s"] += wall
+            rec["cpu_s"] += cpu
+            rec["peak_mb"] = max(rec["peak_mb"], peak / 2**20)
+
+    def _update_peaks(self):
+        """Updates the peak memory of the running stages with the peak traced
+        since the last reset."""
+        _, peak = tracemalloc.get_traced_memory()
+        self._running = [max(p, peak) for p in self._running]
+
+    def count(self, name, n=1):
+        """Increments the counter `name` by n."""
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def reset(self):
+        """Discards the recorded stages and counters."""
+        self.stages, self.counts = {}, {}
+
+    def merge(self, report):
+        """Adds the stages and counters of a report (the output of `to_dict`,
+        e.g. from another process) to this profiler."""
+        if not self.enabled:
+            return
+        for name, other in report["stages"].items():
+            rec = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_mb": 0.0})
+            rec["calls"] += other["calls"]
+            rec["wall_s"] += other["wall_s"]
+            rec["cpu_s"] += other["cpu_s"]
+            rec["peak_mb"] = max(rec["peak_mb"], other["peak_mb"])
+        for name, n in report["counts"].items():
+            self.count(name, n)
+
+    def to_dict(self):
+        """Returns the recorded stages and counters as a dictionary."""
+        return {"stages": self.stages, "counts": self.counts}
+
+    def write_json(self, filename, **metadata):
+        """Writes the report to a .json file. Additional keyword arguments are
+        stored in the `metadata` field."""
+        report = {
+            "metadata": {"python": platform.python_version(), "pid": os.getpid(), **metadata},
+            **self.to_dict(),
+        }
+        with open(filename, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+# profiler that records nothing, used by default
+NULL_PROFILER = StageProfiler(enabled=False)
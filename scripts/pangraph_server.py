@@ -0,0 +1,285 @@
+# Long-running server that keeps a pangraph and its Locator in memory, and
+# answers queries from other processes. This avoids paying the cost of loading
+# the pangraph and building the maps for every small query.
+#
+# The server listens on a Unix socket or on a localhost TCP port. The protocol
+# is newline-delimited JSON: each request is one line with a JSON object
+#     {"id": ..., "method": "find_position", "params": {...}}
+# and the server answers with one line per request, in the same order:
+#     {"id": ..., "result": ...}   or   {"id": ..., "error": "message"}
+# Several clients can be connected at the same time, and each client can send
+# several requests without waiting for the answers. See `pangraph_client` for a
+# client. The pangraph is reloaded when the file changes.
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import sys
+
+import numpy as np
+
+import pangraph_interface
+import pangraph_locator
+
+# maximum length of a request line (bytes)
+MAX_REQUEST_SIZE = 1 << 28
+
+
+class GraphState:
+    """A loaded pangraph, together with its Locator and the signature (modification
+    time and size) of the file it was loaded from. Block statistics are computed
+    on first request."""
+
+    def __init__(self, filename, cache=None, coords_only=False):
+        self.filename = filename
+        self.signature = file_signature(filename)
+        self.pan = pangraph_interface.Pangraph.load_json(
+            filename, lazy=True, cache=cache, compact=True, coords_only=coords_only
+        )
+        self.locator = pangraph_locator.Locator(self.pan, lazy=True)
+        self._blockstats = None
+
+    def blockstats(self):
+        """Block statistics as a dictionary {block id -> {column -> value}},
+        see `Pangraph.to_blockstats_df`."""
+        if self._blockstats is None:
+            df = self.pan.to_blockstats_df()
+            self._blockstats = json.loads(df.to_json(orient="index"))
+        return self._blockstats
+
+
+def file_signature(filename):
+    """Modification time and size of a file, used to detect changes."""
+    st = os.stat(filename)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _strain_map(state, params):
+    strain = params["strain"]
+    if strain not in state.pan.paths.id_to_pos:
+        raise ValueError(f"unknown strain {strain}")
+    return state.locator[strain]
+
+
+def _check_positions(pmap, strain, positions):
+    """Raises a ValueError if some positions are outside of the genome of the strain."""
+    positions = np.asarray(positions, dtype=np.int64)
+    out = positions[(positions < 1) | (positions > pmap.path_L)]
+    if len(out) > 0:
+        shown = ", ".join(str(p) for p in out[:5].tolist()) + (", ..." if len(out) > 5 else "")
+        raise ValueError(f"positions out of the genome of {strain} (1-{pmap.path_L}): {shown}")
+    return positions
+
+
+def find_position(state, params):
+    """params: strain, positions (list of positions, 1-based). For each position,
+    returns the block id, the position in the block occurrence and the occurrence
+    (strain, block n., strand). See `Locator.find_position`."""
+    pmap = _strain_map(state, params)
+    pos = _check_positions(pmap, params["strain"], params["positions"])
+    idxs = pmap.position_to_block_idx(pos)
+    bl_pos = pangraph_locator.position_in_block_coordinates_batch(
+        pos, pmap.b[idxs], pmap.e[idxs], pmap.strands[idxs], pmap.path_L
+    )
+    return {
+        "block_ids": pmap.block_ids(idxs).tolist(),
+        "block_positions": bl_pos.tolist(),
+        "occurrences": pmap.occurrences(idxs),
+    }
+
+
+def find_interval(state, params):
+    """params: strain, starts, ends (lists of positions, 1-based). For each interval,
+    returns the block ids, the interval relative to each block occurrence and the
+    occurrences. See `Locator.find_interval`."""
+    pmap = _strain_map(state, params)
+    starts = _check_positions(pmap, params["strain"], params["starts"])
+    ends = _check_positions(pmap, params["strain"], params["ends"])
+    offsets, idxs, I_b, I_e, _ = pmap.interval_to_blocks_batch(starts, ends)
+    bl_ids = pmap.block_ids(idxs).tolist()
+    I = [list(x) for x in zip(I_b.tolist(), I_e.tolist())]
+    occs = pmap.occurrences(idxs)
+    results = []
+    for k in range(len(offsets) - 1):
+        sl = slice(offsets[k], offsets[k + 1])
+        results.append({"block_ids": bl_ids[sl], "intervals": I[sl], "occurrences": occs[sl]})
+    return results
+
+
+def block_stats(state, params):
+    """params: block_ids (optional). Returns the block statistics of the given
+    blocks, or of all blocks."""
+    stats = state.blockstats()
+    block_ids = params.get("block_ids")
+    if block_ids is None:
+        return stats
+    missing = [bl_id for bl_id in block_ids if bl_id not in stats]
+    if missing:
+        raise ValueError(f"unknown blocks {', '.join(missing)}")
+    return {bl_id: stats[bl_id] for bl_id in block_ids}
+
+
+def strains(state, params):
+    """Returns the list of strains in the pangraph."""
+    return state.locator.strains()
+
+
+METHODS = {
+    "find_position": find_position,
+    "find_interval": find_interval,
+    "block_stats": block_stats,
+    "strains": strains,
+}
+
+
+class PangraphServer:
+    """Serves queries on a pangraph file. The pangraph is loaded once, and reloaded
+    in the background when the file changes (checked every `poll_interval`
+    seconds). While a new version is loaded, queries are answered with the previous
+    one. Queries run in a separate thread, so that a slow query (e.g. building the map
+    of a strain) does not hold up reloads and `info` requests. The thread is the
+    only one to run queries: the Locator and the blocks of a pangraph are built
+    lazily and are not thread-safe. Besides the queries in `METHODS`, the server answers to:
+    - info: file name, number of strains and blocks, and number of (re)loads.
+    - reload: reloads the pangraph, even if the file did not change.
+    """
+
+    def __init__(self, filename, cache=None, coords_only=False, poll_interval=2.0):
+        self.filename = filename
+        self.cache = cache
+        self.coords_only = coords_only
+        self.poll_interval = poll_interval
+        self.state = None
+        self.n_loads = 0
+        self._reload_lock = None
+        self._query_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def _load(self):
+        return GraphState(self.filename, cache=self.cache, coords_only=self.coords_only)
+
+    async def reload(self):
+        """Loads the pangraph in a separate thread, and replaces the current one
+        once loaded. Concurrent reloads are serialized."""
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            self.state = await loop.run_in_executor(None, self._load)
+            self.n_loads += 1
+            print(f"loaded {self.filename}", file=sys.stderr)
+
+    async def watch(self):
+        """Reloads the pangraph whenever the signature of the file changes."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                changed = file_signature(self.filename) != self.state.signature
+                if changed:
+                    await self.reload()
+            except Exception as e:
+                # e.g. the file is being replaced: try again later
+                print(f"reload of {self.filename} failed: {e}", file=sys.stderr)
+
+    def info(self):
+        return {
+            "pangraph": str(self.filename),
+            "n_strains": len(self.state.pan.paths),
+            "n_blocks": len(self.state.pan.blocks),
+            "n_loads": self.n_loads,
+        }
+
+    async def answer(self, request):
+        """Returns the response to a request (a dictionary)."""
+        req_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            method = request["method"]
+            params = request.get("params", {})
+            if method == "reload":
+                await self.reload()
+                result = self.info()
+            elif method == "info":
+                result = self.info()
+            elif method in METHODS:
+                # the query keeps the current state, even if the pangraph is reloaded meanwhile
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._query_executor, METHODS[method], self.state, params)
+            else:
+                raise ValueError(f"unknown method {method}")
+        except Exception as e:
+            return {"id": req_id, "error": f"{type(e).__name__}: {e}"}
+        return {"id": req_id, "result": result}
+
+    async def handle_client(self, reader, writer):
+        """Answers the requests of one client, one line at a time."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {"id": None, "error": f"invalid request: {e}"}
+                else:
+                    response = await self.answer(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            print(f"client disconnected: {e}", file=sys.stderr)
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=None, host="127.0.0.1", port=None):
+        """Loads the pangraph and serves queries on a Unix socket (if `socket_path`
+        is given) or on a TCP port, until cancelled."""
+        self._reload_lock = asyncio.Lock()
+        await self.reload()
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path=socket_path, limit=MAX_REQUEST_SIZE)
+            print(f"serving {self.filename} on {socket_path}", file=sys.stderr)
+        else:
+            server = await asyncio.start_server(self.handle_client, host=host, port=port, limit=MAX_REQUEST_SIZE)
+            print(f"serving {self.filename} on {host}:{port}", file=sys.stderr)
+        watcher = asyncio.create_task(self.watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+            self._query_executor.shutdown(wait=False)
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def get_options():
+    parser = argparse.ArgumentParser(
+        description="Keep a pangraph in memory and answer queries on a Unix socket or a localhost port",
+        prog="pangraph_server",
+    )
+    parser.add_argument("--pangraph", help="Input pangraph (JSON)", required=True)
+    parser.add_argument("--socket", help="Path of the Unix socket to listen on", required=False, default="")
+    parser.add_argument("--host", help="Host to listen on, if no socket is given", required=False, default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="TCP port to listen on, if no socket is given", required=False, default=8765)
+    parser.add_argument("--poll_interval", type=float, required=False, default=2.0,
+        help="Interval (seconds) between checks for changes of the pangraph file")
+    parser.add_argument("--cache", nargs="?", const=True, default=None, required=False,
+        help="Use a binary cache of the parsed pangraph, stored in the given directory (default: next to the pangraph file)")
+    parser.add_argument("--coords_only", action="store_true", required=False,
+        help="Only load the coordinates of blocks from the pangraph, skipping sequences and alignments")
+    return parser.parse_args()
+
+
+def main():
+    args = get_options()
+    server = PangraphServer(args.pangraph, cache=args.cache, coords_only=args.coords_only, poll_interval=args.poll_interval)
+    socket_path = args.socket if args.socket != "" else None
+    try:
+        asyncio.run(server.serve(socket_path=socket_path, host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
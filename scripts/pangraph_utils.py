@@ -1,4 +1,4 @@
-from collections import defaultdict, Counter
+from collections import Counter
 import numpy as np
 
 
@@ -42,12 +42,8 @@ def node_attribute(G, pan, attr):
 
     # n. SNPs in block
     if attr == "n_mut":
-        n_mut = {}
-        for bl in G.nodes():
-            al_diff = pan.blocks[bl].align_diff
-            n_mut_bl = [len(item["mutate"]) for item in al_diff.values()]
-            n_mut[bl] = np.mean(n_mut_bl)
-        return n_mut
+        n_mut = pan.to_blockvariation_df()["mean mut."]
+        return {bl: n_mut[bl] for bl in G.nodes()}
 
     raise ValueError(
         "the attribute must be one of the following strings:\n \
@@ -66,98 +62,128 @@ def edge_attribute(G, pan, attr):
     Nb: it returns a dictionary in the form {(x,y) -> value}, where for ease of
     search both orders (x,y) and (y,x) are present. This is for compatibility
     with networkx, in which node order in edges is not alphabetic.
+    Edges are evaluated on the paths of the pangraph, keeping only the blocks
+    that are nodes of the graph (see `edge_stats`). To evaluate more than one
+    attribute, use `edge_stats` directly to avoid repeating the computation.
     Args:
     - G (networkx Graph) : this must be the graph created by the pangraph 'to_networkx'
         function.
     - pan (Pangraph) : the orginal pangraph object with which the graph was created
     - attr (string) : edge attribute to evaluate. Must have one of the values specified above.
     """
+    if attr not in EDGE_ATTRIBUTES:
+        raise ValueError(
+            "the attribute must be one of the following strings:\n \
+         n_occurrences , n_hidden_blocks_occurrences , n_hidden_blocks"
+        )
+    stats = edge_stats(pan, G.nodes())
+    return edge_stats_to_dict(pan, stats, attr)
 
-    # n. of times the two blocks occurr one after the other
-    if attr == "n_occurrences":
-        occ_dict = defaultdict(int)
-        for strain, path in G.paths.items():
-            # for every path
-            for x, y in zip(path, np.roll(path, -1)):
-                # count every successive block occurrence once
-                occ_dict[(x, y)] += 1
-                occ_dict[(y, x)] += 1
-        return dict(occ_dict)
-
-    # n. of hidden blocks that have been compressed on the edge.
-    # Nb: if the same block is repeated, it is counted multiple times.
-    if attr == "n_hidden_blocks_occurrences":
-
-        path_dict = pan.to_paths_dict()
-        kept_blocks = G.nodes()  # list of blocks that are not hidden
-
-        # counter for block occurrences on an edge
-        edge_compression = defaultdict(int)
-
-        for path in path_dict.values():
-            # names of blocks that are kept, and number of hidden blocks in between
-            ids_kept, n_excluded = [], [0]
-
-            for bl in path:
-                # if not hidden, then go to the next edge
-                if bl in kept_blocks:
-                    ids_kept.append(bl)
-                    n_excluded.append(0)
-                else:
-                    # if hidden, add one more hidden block
-                    n_excluded[-1] += 1
-
-            # compensate for periodic boundary conditions
-            n_excluded[0] += n_excluded[-1]
-            n_excluded = n_excluded[:-1]
-
-            # turn the results in a dictionary whose keys are pairs of nodes.
-            # Nb: every count is repeated twice because nodes are ordered in both ways.
-            for n_edge, (x, y) in enumerate(zip(np.roll(ids_kept, 1), ids_kept)):
-                edge_compression[(x, y)] += n_excluded[n_edge]
-                edge_compression[(y, x)] += n_excluded[n_edge]
-
-        return dict(edge_compression)
-
-    if attr == "n_hidden_blocks":
-
-        path_dict = pan.to_paths_dict()
-        kept_blocks = G.nodes()  # list of blocks that are not hidden
-
-        # counter for block occurrences on an edge
-        edge_hiddenblocks = defaultdict(list)
-
-        for path in path_dict.values():
-            # names of blocks that are kept, and names of hidden blocks in between
-            ids_kept, n_excluded = [], [[]]
-
-            for bl in path:
-                # if not hidden, then go to the next edge
-                if bl in kept_blocks:
-                    ids_kept.append(bl)
-                    n_excluded.append([])
-                else:
-                    # if hidden, add one more hidden block
-                    n_excluded[-1].append(bl)
-
-            # compensate for periodic boundary conditions
-            n_excluded[0] += n_excluded[-1]
-            n_excluded = n_excluded[:-1]
-
-            # turn the results in a dictionary whose keys are pairs of nodes.
-            # Nb: every count is repeated twice because nodes are ordered in both ways.
-            for n_edge, (x, y) in enumerate(zip(np.roll(ids_kept, 1), ids_kept)):
-                edge_hiddenblocks[(x, y)] += n_excluded[n_edge]
-                edge_hiddenblocks[(y, x)] += n_excluded[n_edge]
-
-        # turn from list of nodes to count of unique values
-        edge_hiddenblocks = {
-            k: len(np.unique(edge_hiddenblocks[k])) for k in edge_hiddenblocks
-        }
-
-        return edge_hiddenblocks
 
-    raise ValueError(
-        "the attribute must be one of the following strings:\n \
-     n_occurrences"
-    )
\ No newline at end of file
+EDGE_ATTRIBUTES = ["n_occurrences", "n_hidden_blocks_occurrences", "n_hidden_blocks"]
+
+
+def edge_stats(pan, kept_blocks=None):
+    """Evaluates all edge attributes (see `edge_attribute`) in a single pass
+    over the paths of the pangraph. Edges connect consecutive blocks in the paths
+    (paths are considered circular), after removing the blocks that are not in
+    `kept_blocks`.
+    Args:
+    - pan (Pangraph) : the pangraph object.
+    - kept_blocks : list of ids of the blocks that are kept, or boolean mask over
+        the blocks of the pangraph. If None all blocks are kept.
+    Returns a dictionary of arrays with one entry per (undirected) edge:
+    - x, y : codes of the two blocks of the edge, with x <= y (see
+        `pangraph_interface.CodeTable`).
+    - n_occurrences, n_hidden_blocks_occurrences, n_hidden_blocks : edge attributes.
+    """
+    n_blocks = len(pan.blocks)
+    kept = _kept_mask(pan, kept_blocks)
+    codes, path_idx = pan.block_occurrence_codes()
+    path_L = np.bincount(path_idx, minlength=len(pan.paths))
+    path_start = np.concatenate([[0], np.cumsum(path_L)[:-1]])
+    local = np.arange(len(codes)) - path_start[path_idx]
+
+    # kept block occurrences, and previous kept occurrence in the same path
+    is_kept = kept[codes]
+    k_idx = np.flatnonzero(is_kept)
+    k_path = path_idx[k_idx]
+    first = np.diff(k_path, prepend=-1) != 0
+    last = np.diff(k_path, append=-1) != 0
+    prev = np.roll(k_idx, 1)
+    # compensate for periodic boundary conditions
+    prev[first] = k_idx[last]
+
+    # one edge occurrence per kept block occurrence, with the number of hidden
+    # block occurrences since the previous kept one
+    x, y = codes[prev], codes[k_idx]
+    edge_key = np.minimum(x, y).astype(np.int64) * n_blocks + np.maximum(x, y)
+    n_hidden = (local[k_idx] - local[prev] - 1) % path_L[k_path]
+
+    # each hidden block occurrence belongs to the edge that ends at the next
+    # kept occurrence in its path
+    h_idx = np.flatnonzero(~is_kept & np.isin(path_idx, k_path))
+    n_kept_before = np.cumsum(is_kept) - is_kept
+    j = n_kept_before[h_idx]
+    first_of_path = np.full(len(pan.paths), -1)
+    first_of_path[k_path[first]] = np.flatnonzero(first)
+    wrap = (j >= len(k_idx)) | (k_path[np.minimum(j, len(k_idx) - 1)] != path_idx[h_idx])
+    j[wrap] = first_of_path[path_idx[h_idx[wrap]]]
+    hidden_pairs = np.unique(edge_key[j] * n_blocks + codes[h_idx])
+
+    # aggregate over edges
+    keys, edge_idx = np.unique(edge_key, return_inverse=True)
+    edge_idx = edge_idx.reshape(-1)
+    hidden_edge = np.searchsorted(keys, hidden_pairs // n_blocks)
+    return {
+        "x": (keys // n_blocks).astype(np.int32),
+        "y": (keys % n_blocks).astype(np.int32),
+        "n_occurrences": np.bincount(edge_idx, minlength=len(keys)),
+        "n_hidden_blocks_occurrences": np.bincount(
+            edge_idx, weights=n_hidden, minlength=len(keys)
+        ).astype(np.int64),
+        "n_hidden_blocks": np.bincount(hidden_edge, minlength=len(keys)),
+    }
+
+
+def _kept_mask(pan, kept_blocks):
+    """Boolean mask over block codes from a list of block ids or a mask."""
+    if kept_blocks is None:
+        return np.ones(len(pan.blocks), dtype=bool)
+    if isinstance(kept_blocks, np.ndarray) and kept_blocks.dtype == bool:
+        return kept_blocks
+    kept = np.zeros(len(pan.blocks), dtype=bool)
+    kept[[pan.codes.block_code[bl] for bl in kept_blocks]] = True
+    return kept
+
+
+def edge_stats_to_dict(pan, stats, attr):
+    """Turns an attribute of the output of `edge_stats` into a dictionary
+    {(x,y) -> value} of block ids, in which both orders (x,y) and (y,x) are
+    present (see `edge_attribute`).
+    Nb: for consistency with the count of both orders, occurrences of self-loops
+    (x,x) are counted twice.
+    """
+    xs = pan.codes.decode_blocks(stats["x"]).tolist()
+    ys = pan.codes.decode_blocks(stats["y"]).tolist()
+    values = stats[attr].tolist()
+    double_loops = attr != "n_hidden_blocks"
+    attr_dict = {}
+    for x, y, v in zip(xs, ys, values):
+        if x == y and double_loops:
+            v *= 2
+        attr_dict[(x, y)] = v
+        attr_dict[(y, x)] = v
+    return attr_dict
+
+
+def set_edge_attributes(G, pan, stats, attrs=EDGE_ATTRIBUTES):
+    """Adds the attributes evaluated by `edge_stats` to the edges of a networkx
+    graph whose nodes are block ids. Edges that are not in the graph are ignored."""
+    import networkx as nx
+
+    values = {}
+    for attr in attrs:
+        for edge, v in edge_stats_to_dict(pan, stats, attr).items():
+            values.setdefault(edge, {})[attr] = v
+    nx.set_edge_attributes(G, values)
@@ -0,0 +1,79 @@
+# Fixtures shared by the tests: a small hand-written pangraph whose coordinates
+# can be checked by hand, and a synthetic pangraph (see
+# `benchmarks/synthetic_pangraph.py`) with duplications, indels and genomes that
+# wrap around the origin.
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from synthetic_pangraph import write_dataset  # noqa: E402
+
+
+def _occ(strain, strand=True):
+    return {"name": strain, "number": 1, "strand": strand}
+
+
+def indel_pangraph_json():
+    """Pangraph with two blocks and three linear genomes of 29-30 bp:
+    - block A: 20 bp consensus, with a gap of 3 columns after position 10, so
+      that consensus positions 11-20 are in columns 14-23.
+    - block B: 10 bp consensus, without gaps.
+    - strain s1: A+ on [1, 20], B+ on [21, 30]. Same sequence as the consensus.
+    - strain s2: A+ on [1, 19], B+ on [20, 29]. Consensus positions 5-7 of A are
+      deleted, and "GG" is inserted in the first two columns of the gap.
+    - strain s3: A- on [1, 20], B+ on [21, 30]. Same sequence as the consensus.
+    """
+    A, B = "ACGTACGTACGTACGTACGT", "TTGGCCAATT"
+    strains = {"s1": [True, True], "s2": [True, True], "s3": [False, True]}
+    positions = {"s1": [[1, 20], [21, 30]], "s2": [[1, 19], [20, 29]], "s3": [[1, 20], [21, 30]]}
+    paths = [
+        {
+            "name": strain,
+            "offset": 0,
+            "circular": False,
+            "blocks": [{"id": "A", **_occ(strain, s_A)}, {"id": "B", **_occ(strain, s_B)}],
+        }
+        for strain, (s_A, s_B) in strains.items()
+    ]
+    block_A = {
+        "id": "A",
+        "sequence": A,
+        "gaps": {"10": 3},
+        "mutate": [[_occ(s, strands[0]), []] for s, strands in strains.items()],
+        "insert": [[_occ(s, strands[0]), [[[10, 0], "GG"]] if s == "s2" else []] for s, strands in strains.items()],
+        "delete": [[_occ(s, strands[0]), [[5, 3]] if s == "s2" else []] for s, strands in strains.items()],
+        "positions": [[_occ(s, strands[0]), positions[s][0]] for s, strands in strains.items()],
+    }
+    block_B = {
+        "id": "B",
+        "sequence": B,
+        "gaps": {},
+        "mutate": [[_occ(s, strands[1]), []] for s, strands in strains.items()],
+        "insert": [[_occ(s, strands[1]), []] for s, strands in strains.items()],
+        "delete": [[_occ(s, strands[1]), []] for s, strands in strains.items()],
+        "positions": [[_occ(s, strands[1]), positions[s][1]] for s, strands in strains.items()],
+    }
+    return {"paths": paths, "blocks": [block_A, block_B]}
+
+
+@pytest.fixture
+def indel_pangraph(tmp_path):
+    """File of the pangraph of `indel_pangraph_json`."""
+    pan_file = tmp_path / "indel.json"
+    pan_file.write_text(json.dumps(indel_pangraph_json()))
+    return str(pan_file)
+
+
+@pytest.fixture(scope="session")
+def synthetic_dataset(tmp_path_factory):
+    """Synthetic pangraph with 6 strains, and one GFF per strain. Returns the
+    pangraph file and the list of GFF files."""
+    output_dir = tmp_path_factory.mktemp("synthetic")
+    return write_dataset(str(output_dir), n_features=60, n_strains=6, n_blocks=40, mean_len=200, seed=1)
@@ -0,0 +1,93 @@
+import subprocess
+import sys
+
+import pytest
+
+import pangraph_cache
+import pangraph_export
+import pangraph_interface
+import pangraph_locator
+import pangraph_profile
+from add_pancontigs_to_gff import annotate_gff_lines, iter_gff
+from conftest import ROOT
+
+
+def run_script(name, *args):
+    subprocess.run([sys.executable, f"{ROOT}/scripts/{name}", *args], check=True, capture_output=True, text=True)
+
+
+def read_gff(filename):
+    return [line.split("\t") for line in open(filename).read().split("\n") if line and not line.startswith("#")]
+
+
+def test_occurrence_seqids_match_fasta(synthetic_dataset, tmp_path):
+    """The seqids of a regions gff written with --occurrence_seqids are the names
+    of the records exported by export_pancontig_sequences, and entries are within
+    the sequence of their record."""
+    pan_file, gff_files = synthetic_dataset
+    output_gff = str(tmp_path / "regions.gff")
+    run_script("add_pancontigs_to_gff.py", "--pangraph", pan_file, "--input_gff", gff_files[0],
+               "--output_gff", output_gff, "--mode", "regions", "--occurrence_seqids")
+    entries = read_gff(output_gff)
+    assert len(entries) > 0
+
+    locator = pangraph_locator.Locator(pangraph_interface.Pangraph.load_json(pan_file), lazy=True)
+    strain = entries[0][1]
+    lengths = {}
+    for strain_, bl_id, n, strand, seq in pangraph_export.iter_pancontig_sequences(locator, [strain]):
+        lengths[pangraph_export.pancontig_sequence_name(bl_id, strain_, n, strand)] = len(seq)
+    for entry in entries:
+        assert entry[0] in lengths
+        assert 1 <= int(entry[3]) <= int(entry[4]) <= lengths[entry[0]]
+
+
+def test_occurrence_seqids_needs_regions(synthetic_dataset, tmp_path):
+    pan_file, gff_files = synthetic_dataset
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        run_script("add_pancontigs_to_gff.py", "--pangraph", pan_file, "--input_gff", gff_files[0],
+                   "--output_gff", str(tmp_path / "out.gff"), "--occurrence_seqids")
+    assert "--occurrence_seqids can only be used with --mode regions" in error.value.stderr
+
+
+def annotate_lines(pan_file, gff_file, feature_cache=None):
+    """Output lines of regions mode, and the counts of the profiler."""
+    profiler = pangraph_profile.StageProfiler(trace_memory=False)
+    pan = pangraph_interface.Pangraph.load_json(pan_file, lazy=True, compact=True, profiler=profiler)
+    locator = pangraph_locator.Locator(pan, lazy=True)
+    lines = list(annotate_gff_lines(locator, iter_gff(gff_file), mode="regions", feature_cache=feature_cache))
+    return lines, profiler.counts
+
+
+def test_feature_cache(synthetic_dataset, tmp_path):
+    """Regions mode gives the same lines and fragment counts with the feature
+    cache, whether the features are annotated or reused, also after some of the
+    features changed."""
+    pan_file, gff_files = synthetic_dataset
+    feature_cache = pangraph_cache.FeatureCache.for_file(str(tmp_path / "features.sqlite"), pan_file)
+    expected, counts = annotate_lines(pan_file, gff_files[0])
+    assert counts["fragmented_features"] > 0
+    for n_cached in [0, len(list(iter_gff(gff_files[0])))]:
+        lines, cached_counts = annotate_lines(pan_file, gff_files[0], feature_cache)
+        assert lines == expected
+        assert cached_counts["cached_features"] == n_cached
+        for name in ["fragmented_features", "fragments", "output_entries"]:
+            assert cached_counts.get(name, 0) == counts.get(name, 0)
+
+    # move every other feature by one position
+    changed_gff = str(tmp_path / "changed.gff")
+    with open(changed_gff, "w") as f:
+        for k, line in enumerate(open(gff_files[0]).read().split("\n")):
+            fields = line.split("\t")
+            if len(fields) == 9 and k % 2 == 0:
+                fields[3], fields[4] = str(int(fields[3]) + 1), str(int(fields[4]) + 1)
+            f.write("\t".join(fields) + "\n")
+    expected, _ = annotate_lines(pan_file, changed_gff)
+    lines, cached_counts = annotate_lines(pan_file, changed_gff, feature_cache)
+    assert lines == expected
+    assert 0 < cached_counts["cached_features"] < len(list(iter_gff(changed_gff)))
+    feature_cache.close()
+
+    # the cache of another version of the pangraph is not used
+    other = pangraph_cache.FeatureCache(str(tmp_path / "features.sqlite"), "another digest")
+    assert other.lookup(other.keys("regions", expected[:3])) == [None] * 3
+    other.close()
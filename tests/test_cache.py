@@ -0,0 +1,77 @@
+import json
+import os
+
+import numpy as np
+
+import pangraph_cache
+import pangraph_interface
+import pangraph_locator
+
+MAP_ARRAYS = ["b", "e", "codes", "nums", "strands", "Ls"]
+
+
+def load(pan_file, **kwargs):
+    pan = pangraph_interface.Pangraph.load_json(pan_file, lazy=True, compact=True, **kwargs)
+    return pan, pangraph_locator.Locator(pan, lazy=True)
+
+
+def assert_same_pangraph(pan, locator, ref_pan, ref_locator):
+    assert list(pan.strains()) == list(ref_pan.strains())
+    assert list(pan.blocks.records()) == list(ref_pan.blocks.records())
+    for strain in ref_locator.strains():
+        pmap, ref = locator[strain], ref_locator[strain]
+        assert pmap.path_L == ref.path_L
+        for name in MAP_ARRAYS:
+            assert np.array_equal(getattr(pmap, name), getattr(ref, name)), name
+        assert pmap.ids.tolist() == ref.ids.tolist()
+
+
+def test_cache_roundtrip(synthetic_dataset, tmp_path):
+    """A pangraph and its maps reloaded from the cache are the same as the ones
+    built from the .json file."""
+    pan_file, _ = synthetic_dataset
+    ref_pan, ref_locator = load(pan_file)
+    cache_dir = str(tmp_path)
+    # the first run creates the cache, the second loads from it
+    for _ in range(2):
+        pan, locator = load(pan_file, cache=cache_dir)
+        assert_same_pangraph(pan, locator, ref_pan, ref_locator)
+    assert pan.cache.directory == os.path.join(cache_dir, "pangraph.json.cache")
+    assert pan.cache.has("paths") and pan.cache.has("map")
+    assert locator._map_arrays is not None
+
+
+def test_cache_invalidation(synthetic_dataset, tmp_path):
+    """The cache of a modified pangraph is rebuilt, and files of the cache
+    directory that do not belong to the cache are left untouched."""
+    pan_file, _ = synthetic_dataset
+    modified = str(tmp_path / "pangraph.json")
+    pan_json = json.load(open(pan_file))
+    json.dump(pan_json, open(modified, "w"))
+    cache_dir = str(tmp_path / "cache")
+    pan, locator = load(modified, cache=cache_dir)
+    other_file = os.path.join(pan.cache.directory, "notes.txt")
+    open(other_file, "w").write("not part of the cache")
+
+    # the last strain is removed from the pangraph
+    pan_json["paths"] = pan_json["paths"][:-1]
+    json.dump(pan_json, open(modified, "w"))
+    pan, locator = load(modified, cache=cache_dir)
+    ref_pan, ref_locator = load(modified)
+    assert len(pan.strains()) == len(pan_json["paths"])
+    assert_same_pangraph(pan, locator, ref_pan, ref_locator)
+    assert open(other_file).read() == "not part of the cache"
+    assert pan.cache.digest == pangraph_cache.file_digest(modified)
+
+    pan.cache.clear()
+    assert sorted(os.listdir(pan.cache.directory)) == ["notes.txt"]
+    assert not pan.cache.has("paths")
+
+
+def test_stale_cache_is_not_loaded(tmp_path):
+    cache = pangraph_cache.PangraphCache(str(tmp_path), "digest 1")
+    cache.save("part", {"x": np.arange(5)})
+    assert np.array_equal(cache.load("part")["x"], np.arange(5))
+    assert pangraph_cache.PangraphCache(str(tmp_path), "digest 2").load("part") is None
+    # no temporary file is left behind
+    assert sorted(os.listdir(tmp_path)) == ["meta.json", "part.x.npy"]
@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+import pangraph_export
+import pangraph_interface
+import pangraph_locator
+
+
+def load_locator(pan_file, **kwargs):
+    pan = pangraph_interface.Pangraph.load_json(pan_file, lazy=True, compact=True, **kwargs)
+    return pan, pangraph_locator.Locator(pan, lazy=True)
+
+
+def complement(seq):
+    return seq[::-1].translate(str.maketrans("ACGTacgt", "TGCAtgca"))
+
+
+@pytest.mark.parametrize("orientation", ["block", "genome"])
+def test_pancontig_sequences(synthetic_dataset, orientation):
+    """Sequences extracted in batches of strains are the ones of each block
+    occurrence, in the order of the genome of each strain."""
+    pan_file, _ = synthetic_dataset
+    pan, locator = load_locator(pan_file)
+    strains = locator.strains()
+    records = list(pangraph_export.iter_pancontig_sequences(locator, strains, orientation, batch_size=4))
+    expected = []
+    for strain in strains:
+        pmap = locator[strain]
+        for bl_id, occ in zip(pmap.ids.tolist(), pmap.occurrences(slice(None))):
+            (seq,), _ = pan.blocks[bl_id].alignment.generate_sequences([occ])
+            if orientation == "genome" and not occ[2]:
+                seq = complement(seq)
+            expected.append((strain, bl_id, occ[1], occ[2], seq))
+    assert records == expected
+
+
+def test_pancontig_sequences_pool(synthetic_dataset, tmp_path):
+    """The pool of processes (with jobs sent a few at a time) gives the same
+    output as a single process, also for a pangraph loaded from the cache."""
+    pan_file, _ = synthetic_dataset
+    _, locator = load_locator(pan_file)
+    serial = io.StringIO()
+    pangraph_export.write_pancontig_sequences(locator, locator.strains(), serial)
+    for _ in range(2):
+        # the second time, blocks are loaded from the cache
+        _, locator = load_locator(pan_file, cache=str(tmp_path))
+        pooled = io.StringIO()
+        pangraph_export.write_pancontig_sequences(locator, locator.strains(), pooled, processes=3)
+        assert pooled.getvalue() == serial.getvalue()
+
+    filenames = [str(tmp_path / f"{strain}.fa") for strain in locator.strains()]
+    pangraph_export.write_pancontig_sequences_per_strain(locator, locator.strains(), filenames, processes=3)
+    assert "".join(open(filename).read() for filename in filenames) == serial.getvalue()
+
+
+@pytest.mark.parametrize("snps_only", [False, True])
+def test_core_alignment_pool(synthetic_dataset, tmp_path, snps_only):
+    pan_file, _ = synthetic_dataset
+    pan, _ = load_locator(pan_file)
+    serial, pooled = tmp_path / "serial.fa", tmp_path / "pooled.fa"
+    order = pangraph_export.write_core_alignment(pan, str(serial), snps_only=snps_only)
+    assert len(order) > 0
+    assert pangraph_export.write_core_alignment(pan, str(pooled), snps_only=snps_only, processes=3) == order
+    assert pooled.read_text() == serial.read_text()
+    lines = serial.read_text().split("\n")
+    assert [line[1:] for line in lines[0::2] if line] == [str(strain) for strain in pan.strains()]
+    assert len({len(line) for line in lines[1::2] if line}) == 1
@@ -0,0 +1,76 @@
+import numpy as np
+
+import pangraph_interface
+import pangraph_liftover
+import pangraph_locator
+from add_pancontigs_to_gff import iter_gff
+
+
+def load_locator(pan_file):
+    pan = pangraph_interface.Pangraph.load_json(pan_file, lazy=True, compact=True)
+    return pangraph_locator.Locator(pan, lazy=True)
+
+
+def test_liftover_across_indel(indel_pangraph):
+    locator = load_locator(indel_pangraph)
+    # [3, 12]: spans the deletion and the insertion of s2
+    # [6, 15]: begins in the deletion of s2
+    # [18, 25]: spans the end of A, shorter by one in s2, and the beginning of B
+    starts, ends = np.array([3, 6, 18]), np.array([12, 15, 25])
+    pieces, lifted = pangraph_liftover.liftover_intervals(locator, "s1", "s2", starts, ends)
+    assert pieces["col_b"].tolist() == [3, 6, 21, 1]
+    assert pieces["col_e"].tolist() == [15, 18, 23, 5]
+    assert lifted["contiguous"].tolist() == [True, True, True]
+    assert lifted["n_exact"].tolist() == [1, 0, 2]
+    assert lifted["start"].tolist() == [3, 5, 17]
+    assert lifted["end"].tolist() == [11, 14, 24]
+
+    # back from s2 to s1, the inserted positions 8-9 of s2 are in a gap of s1
+    pieces, lifted = pangraph_liftover.liftover_intervals(locator, "s2", "s1", np.array([8, 9]), np.array([12, 10]))
+    assert lifted["mapped"].tolist() == [True, True]
+    assert lifted["exact"].tolist() == [False, False]
+    assert lifted["start"].tolist() == [11, 11]
+    assert lifted["end"].tolist() == [13, 11]
+
+
+def test_liftover_reverse_strand(indel_pangraph):
+    locator = load_locator(indel_pangraph)
+    pieces, lifted = pangraph_liftover.liftover_intervals(locator, "s1", "s3", np.array([3, 18]), np.array([12, 25]))
+    assert lifted["flip"].tolist() == [True, True, False]
+    assert lifted["flipped"].tolist() == [True, True]
+    assert lifted["start"][0] == 9 and lifted["end"][0] == 18
+    # the two pieces of [18, 25] are not in order on s3
+    assert lifted["contiguous"].tolist() == [True, False]
+    assert lifted["tgt_b"][1:].tolist() == [1, 21]
+    assert lifted["tgt_e"][1:].tolist() == [3, 25]
+
+
+def test_liftover_matches_alignment_columns(synthetic_dataset):
+    """Ends of exactly mapped pieces are on the same alignment columns in the
+    source and target strains (compared with `find_consensus_positions`)."""
+    pan_file, gff_files = synthetic_dataset
+    locator = load_locator(pan_file)
+    entries = list(iter_gff(gff_files[0]))
+    source = entries[0].seqid
+    starts, ends = np.array([e.start for e in entries]), np.array([e.end for e in entries])
+    n_checked = 0
+    for target in locator.strains():
+        if target == source:
+            continue
+        pieces, lifted = pangraph_liftover.liftover_intervals(locator, source, target, starts, ends)
+        exact = lifted["exact"]
+        # ends in block orientation, unless the piece reaches the end of its block
+        inner_b = exact & (pieces["I_b"] > 1)
+        inner_e = exact & (pieces["I_e"] < pieces["L"])
+        for inner, col in [(inner_b, "col_b"), (inner_e, "col_e")]:
+            pmap = locator[target]
+            strand_t = np.where(lifted["flip"], ~pieces["strands"], pieces["strands"])[inner]
+            # beginning of the piece in block orientation on the genome
+            if col == "col_b":
+                pos = np.where(strand_t, lifted["tgt_b"][inner], lifted["tgt_e"][inner])
+            else:
+                pos = np.where(strand_t, lifted["tgt_e"][inner], lifted["tgt_b"][inner])
+            _, _, cols, _, _ = locator.find_consensus_positions(target, pos)
+            assert np.array_equal(cols, pieces[col][inner])
+            n_checked += inner.sum()
+    assert n_checked > 0
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+import pangraph_interface
+import pangraph_locator
+from pangraph_alignment import GAP
+
+
+@pytest.fixture(scope="module")
+def locator(synthetic_dataset):
+    pan_file, _ = synthetic_dataset
+    pan = pangraph_interface.Pangraph.load_json(pan_file, lazy=True, compact=True)
+    return pangraph_locator.Locator(pan, lazy=True)
+
+
+def random_intervals(pmap, n, seed=0):
+    """Random intervals, including intervals in a single block and intervals
+    ending on block boundaries or on the ends of the genome."""
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(1, pmap.path_L + 1, n)
+    ends = np.minimum(starts + rng.integers(0, 2000, n), pmap.path_L)
+    starts = np.concatenate([starts, pmap.b, [1, 1]])
+    ends = np.concatenate([ends, np.maximum(pmap.b, np.minimum(pmap.b + 5, pmap.path_L)), [1, pmap.path_L]])
+    return starts, ends
+
+
+def test_position_queries(locator):
+    for strain in locator.strains():
+        pmap = locator[strain]
+        positions = np.concatenate([np.arange(1, pmap.path_L + 1, 7), pmap.b, pmap.e, [pmap.path_L]])
+        idxs = pmap.position_to_block_idx(positions)
+        bl_pos = pangraph_locator.position_in_block_coordinates_batch(
+            positions, pmap.b[idxs], pmap.e[idxs], pmap.strands[idxs], pmap.path_L
+        )
+        bl_ids, occs = pmap.block_ids(idxs), pmap.occurrences(idxs)
+        for k, pos in enumerate(positions.tolist()):
+            bl_id, pos_in_block, occ = pmap.position_to_block(pos)
+            assert (bl_ids[k], bl_pos[k], occs[k]) == (bl_id, pos_in_block, tuple(occ))
+
+
+def test_interval_queries(locator):
+    for n, strain in enumerate(locator.strains()):
+        pmap = locator[strain]
+        starts, ends = random_intervals(pmap, 200, seed=n)
+        offsets, idxs, I_b, I_e, strands = pmap.interval_to_blocks_batch(starts, ends)
+        idx_b, n_blocks = pmap.interval_block_ranges(starts, ends)
+        assert np.array_equal(np.diff(offsets), n_blocks)
+        assert np.array_equal(idxs[offsets[:-1]], idx_b)
+        bl_ids, occs = pmap.block_ids(idxs), pmap.occurrences(idxs)
+        for k, (pos_b, pos_e) in enumerate(zip(starts.tolist(), ends.tolist())):
+            sl = slice(offsets[k], offsets[k + 1])
+            ref_ids, ref_I, ref_occs = pmap.interval_to_blocks(pos_b, pos_e)
+            assert list(bl_ids[sl]) == list(ref_ids)
+            assert list(zip(I_b[sl].tolist(), I_e[sl].tolist())) == [tuple(x) for x in ref_I]
+            assert occs[sl] == [tuple(occ) for occ in ref_occs]
+            assert strands[sl].tolist() == [occ[2] for occ in ref_occs]
+
+
+def test_find_occurrences(locator):
+    strains = locator.strains()
+    for strain, other in zip(strains, strains[1:] + strains[:1]):
+        pmap, other_map = locator[strain], locator[other]
+        # occurrences of the blocks of another strain, which may be missing or
+        # have a different number of copies in this strain
+        codes, nums = other_map.codes, other_map.nums
+        idxs, n_copies = pmap.find_occurrences_batch(codes, nums)
+        for code, num, idx, n in zip(codes.tolist(), nums.tolist(), idxs.tolist(), n_copies.tolist()):
+            assert n == np.sum(pmap.codes == code)
+            if n == 0:
+                assert idx == -1
+                continue
+            bl_id = pmap.table.decode_blocks(np.array([code]))[0]
+            if num in pmap.nums[pmap.codes == code]:
+                assert idx == pmap.occurrence_to_block_idx(bl_id, num)
+            else:
+                assert idx == pmap.occurrence_to_block_idx(bl_id, pmap.nums[pmap.codes == code].min())
+
+
+def test_consensus_positions(locator):
+    """Alignment columns are the ones of the nucleotides in the alignment matrix
+    of the block, and consensus columns match the consensus positions."""
+    strain = locator.strains()[0]
+    pmap = locator[strain]
+    positions = np.arange(1, pmap.path_L + 1, 3)
+    bl_ids, cons_pos, cols, inserted, idxs = locator.find_consensus_positions(strain, positions)
+    for bl_id, cons, col, ins, idx, pos in zip(bl_ids, cons_pos, cols, inserted, idxs, positions):
+        aln = locator.blocks[bl_id].alignment
+        (occ,) = pmap.occurrences([idx])
+        (row,), _ = aln.alignment_matrix([occ])
+        _, seq_pos, _ = pmap.position_to_block(pos)
+        # the seq_pos-th nucleotide of the occurrence is in column col
+        assert np.flatnonzero(row != GAP)[seq_pos - 1] + 1 == col
+        if not ins:
+            assert locator.block_segments(strain, pmap.codes[idx]).consensus_column(cons) == col
+    assert locator.find_consensus_position(strain, int(positions[0]))[:4] == (
+        str(bl_ids[0]), int(cons_pos[0]), int(cols[0]), bool(inserted[0])
+    )
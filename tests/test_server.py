@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import pangraph_interface
+import pangraph_locator
+from pangraph_client import PangraphClient, PangraphServerError
+from pangraph_server import PangraphServer
+
+
+@pytest.fixture
+def server_socket(synthetic_dataset, tmp_path):
+    """Runs a server on the synthetic pangraph in a background thread, and
+    returns the path of its socket."""
+    pan_file, _ = synthetic_dataset
+    socket_path = str(tmp_path / "pangraph.sock")
+    server = PangraphServer(pan_file, poll_interval=60)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(server.serve(socket_path=socket_path))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    for _ in range(200):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+    yield socket_path
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(timeout=10)
+
+
+def test_server_matches_locator(synthetic_dataset, server_socket):
+    """Concurrent clients get the same answers as the scalar Locator queries,
+    while the maps of the strains are built lazily by the server."""
+    pan_file, _ = synthetic_dataset
+    locator = pangraph_locator.Locator(pangraph_interface.Pangraph.load_json(pan_file))
+    strains = locator.strains()
+
+    def query(strain):
+        pmap = locator[strain]
+        rng = np.random.default_rng(len(strain))
+        positions = rng.integers(1, pmap.path_L + 1, 50)
+        with PangraphClient(socket_path=server_socket, timeout=30) as client:
+            res = client.find_position(strain, positions)
+            for k, pos in enumerate(positions.tolist()):
+                bl_id, bl_pos, occ = locator.find_position(strain, pos)
+                assert res["block_ids"][k] == bl_id
+                assert res["block_positions"][k] == bl_pos
+                assert tuple(res["occurrences"][k]) == tuple(occ)
+            ends = np.minimum(positions + 700, pmap.path_L)
+            res = client.find_interval(strain, positions, ends)
+            for k, (pos_b, pos_e) in enumerate(zip(positions.tolist(), ends.tolist())):
+                bl_ids, I, occs = locator.find_interval(strain, pos_b, pos_e)
+                assert res[k]["block_ids"] == list(bl_ids)
+                assert [tuple(x) for x in res[k]["intervals"]] == [tuple(x) for x in I]
+                assert [tuple(x) for x in res[k]["occurrences"]] == [tuple(x) for x in occs]
+        return strain
+
+    with ThreadPoolExecutor(len(strains)) as executor:
+        assert sorted(executor.map(query, strains * 3)) == sorted(strains * 3)
+
+
+def test_server_errors(server_socket):
+    with PangraphClient(socket_path=server_socket, timeout=30) as client:
+        strain = client.strains()[0]
+        with pytest.raises(PangraphServerError, match="unknown strain"):
+            client.find_position("not_a_strain", [1])
+        with pytest.raises(PangraphServerError, match="out of the genome"):
+            client.find_position(strain, [0])
+        # the connection is still usable after an error
+        assert client.info()["n_loads"] == 1